@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rare.settings')
+# Serve the read endpoints with async views, see rareapi/async_reads.py
+os.environ.setdefault('RARE_ASYNC_READS', '1')
 
 application = get_asgi_application()
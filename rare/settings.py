@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,25 +47,45 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'rareapi.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'rareapi.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rareapi.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'rareapi.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
+# MessagePack, for clients sending `Accept: application/msgpack`, when the
+# optional msgpack package is installed
+if find_spec('msgpack') is not None:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('rareapi.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('rareapi.parsers.MessagePackParser')
+
 CORS_ORIGIN_WHITELIST = (
     'http://localhost:3000',
     'http://127.0.0.1:3000'
 )
 
 MIDDLEWARE = [
+    # First, so the timings cover every other middleware too
+    'rareapi.instrumentation.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'rareapi.db_routers.ReplicaPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -99,6 +121,26 @@ DATABASES = {
     }
 }
 
+# Read replica aliases from DATABASES, used by rareapi.db_routers for the
+# list and retrieve views; see rare/settings_replicas.py
+DATABASE_ROUTERS = ['rareapi.db_routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+# How long a client that wrote keeps reading from the primary
+REPLICA_LAG_SECONDS = 5
+
+# rare/asgi.py serves the read endpoints with async views, which run their
+# queries on a pool of this many threads; see rareapi/async_reads.py
+ASYNC_READS = os.environ.get('RARE_ASYNC_READS') == '1'
+ASYNC_READ_THREADS = 8
+
+# Rows removed per batch when a category, post or user is deleted in the
+# background; see rareapi/deletion.py
+PURGE_BATCH_SIZE = 500
+
+# PRAGMA statements run on every new SQLite connection, see
+# rare/settings_production.py for the tuned production profile
+SQLITE_PRAGMAS = {}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -0,0 +1,27 @@
+"""
+Read replica profile for rare project, for trying replicas out locally.
+
+Use it with DJANGO_SETTINGS_MODULE=rare.settings_replicas. Next to the
+primary db.sqlite3 it adds a replica, db.replica.sqlite3, which list and
+retrieve views read from (see rareapi/db_routers.py).
+
+SQLite has no replication, so `manage.py sync_replicas` stands in for it
+by copying the primary into every replica, once or every few seconds with
+--interval. Run it after `migrate`, since migrations only run on the
+primary.
+
+Tests run the replica as a mirror of the test database.
+"""
+
+from .settings import *  # pylint: disable=wildcard-import,unused-wildcard-import
+
+DATABASES = {
+    'default': DATABASES['default'],
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_REPLICAS = ['replica']
@@ -13,11 +13,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.conf.urls import include
 from django.urls import path
-from rareapi.views import register_user, login_user
+from rareapi.views import (register_user, login_user, import_users_view, performance_stats,
+                           deletion_progress)
 from rest_framework import routers
+from rareapi.async_reads import async_read_urls
 from rareapi.views import PostView, CategoryView, TagView
 
 
@@ -26,10 +29,18 @@ router.register(r'posts', PostView, 'post')
 router.register(r'categories', CategoryView, 'category')
 router.register(r'tags', TagView, 'tag')
 
+router_urls = router.urls
+if settings.ASYNC_READS:
+    # Served by rare/asgi.py, see rareapi/async_reads.py
+    router_urls = async_read_urls(router_urls)
+
 urlpatterns = [
-    path('', include(router.urls)),
-    path('register', register_user),
-    path('login', login_user),
+    path('', include(router_urls)),
+    path('register', register_user, name='register'),
+    path('login', login_user, name='login'),
+    path('users/import', import_users_view, name='user-import'),
+    path('stats/performance', performance_stats, name='performance-stats'),
+    path('stats/deletions', deletion_progress, name='deletion-progress'),
     path('api-auth', include('rest_framework.urls', namespace='rest_framework')),
     path('admin/', admin.site.urls),
 ]
@@ -1,8 +1,55 @@
 from django.contrib import admin
-from rareapi.models import RareUser, Post, Category
+from rareapi.models import RareUser, Post, Category, Job
+from rareapi.tasks import delete_later
 
 # Register your models here.
 
-admin.site.register(RareUser)
-admin.site.register(Post)
 admin.site.register(Category)
+
+
+@admin.register(RareUser)
+class RareUserAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'created_on', 'active', 'deleted_at')
+    list_select_related = ('user',)
+    actions = ['delete_in_background']
+
+    @admin.action(description='Delete selected users and their posts in the background')
+    def delete_in_background(self, request, queryset):
+        # Deleting a prolific user in one go would lock the database for
+        # every other writer; see rareapi/deletion.py
+        users = [rare_user.user for rare_user in queryset.filter(deleted_at__isnull=True)]
+        for user in users:
+            delete_later(user)
+        self.message_user(request, f'{len(users)} users hidden and queued for deletion.')
+
+
+@admin.register(Post)
+class PostAdmin(admin.ModelAdmin):
+    list_display = ('id', 'title', 'author', 'category', 'publication_date',
+                    'approved', 'rejected')
+    list_filter = ('approved', 'rejected')
+    # The author and category columns come from one joined query
+    list_select_related = ('rare_user__user', 'category')
+    # Skip the unfiltered COUNT(*) over every post on each page load
+    show_full_result_count = False
+    actions = ['approve_posts', 'reject_posts']
+
+    @admin.display(ordering='rare_user__user__username')
+    def author(self, post):
+        return post.rare_user.user.username
+
+    @admin.action(description='Approve selected posts')
+    def approve_posts(self, request, queryset):
+        approved = queryset.approve()
+        self.message_user(request, f'{approved} posts approved.')
+
+    @admin.action(description='Reject selected posts')
+    def reject_posts(self, request, queryset):
+        rejected = queryset.reject()
+        self.message_user(request, f'{rejected} posts rejected.')
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'key', 'status', 'attempts', 'run_at')
+    list_filter = ('status', 'name')
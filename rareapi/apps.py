@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class RareapiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rareapi'
+
+    def ready(self):
+        # Connect the model signal handlers
+        from rareapi import signals  # pylint: disable=import-outside-toplevel,unused-import
+        # Register the background job tasks
+        from rareapi import tasks  # pylint: disable=import-outside-toplevel,unused-import
@@ -0,0 +1,95 @@
+"""Async read path for ASGI deployments
+
+Under ASGI, Django runs every synchronous view on one shared thread, so a
+slow SQLite read holds up every other request behind it. `async_reads`
+turns a read endpoint's view into an async view. GET and HEAD requests
+then run on a bounded pool of `settings.ASYNC_READ_THREADS` threads,
+each with its own database connection, and the event loop stays free
+while they wait. Other methods go to Django's shared thread as before,
+so writes are not spread over threads.
+
+Django 3.2's ORM has no async methods, so the views themselves, with
+authentication, pagination, sparse fieldsets, ETags and replica routing,
+are reused as they are. Only where they run changes. The pool bounds how
+many connections and concurrent reads the database sees.
+
+rare/asgi.py switches the read endpoints in `ASYNC_READ_ROUTES` over by
+setting `ASYNC_READS`. WSGI keeps the plain views: an async view there
+would only add an event loop per request. `bench_asgi` compares the two.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import URLPattern
+
+# URL names of the endpoints whose reads go through the pool
+ASYNC_READ_ROUTES = ('post-list', 'post-detail', 'category-list', 'tag-list')
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+@functools.lru_cache(maxsize=None)
+def read_pool(threads):
+    return ThreadPoolExecutor(threads, thread_name_prefix='rare-reads')
+
+
+async def run_read(function, *args, **kwargs):
+    """Run a blocking read on the read pool and wait for it
+
+    With `ASYNC_READ_THREADS = 0` it runs on Django's shared thread
+    instead, which is what tests need: the test database only exists on
+    the test's own connection.
+    """
+    threads = settings.ASYNC_READ_THREADS
+    if not threads:
+        return await sync_to_async(function)(*args, **kwargs)
+    # Carry the request's context variables (performance metrics, writes)
+    # over to the pool thread
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, function, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(read_pool(threads), call)
+
+
+def async_reads(view):
+    """Wrap a view so its reads run on the read pool
+
+    Arguments:
+        view -- A synchronous view, e.g. from `ViewSet.as_view()`
+    """
+    async def handler(request, *args, **kwargs):
+        if request.method in READ_METHODS:
+            return await run_read(render_view, view, request, *args, **kwargs)
+        return await sync_to_async(view)(request, *args, **kwargs)
+
+    # Copies the view's attributes too, such as DRF's csrf_exempt
+    return functools.wraps(view)(handler)
+
+
+def render_view(view, request, *args, **kwargs):
+    """Call a view and render its response, on the current thread"""
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        # Django would otherwise render it on its shared thread
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+        return response
+    finally:
+        # Nothing else closes connections on the pool threads
+        close_old_connections()
+
+
+def async_read_urls(patterns):
+    """Swap the views of the `ASYNC_READ_ROUTES` patterns for async ones"""
+    swapped = []
+    for pattern in patterns:
+        if isinstance(pattern, URLPattern) and pattern.name in ASYNC_READ_ROUTES:
+            pattern = URLPattern(pattern.pattern, async_reads(pattern.callback),
+                                 pattern.default_args, pattern.name)
+        swapped.append(pattern)
+    return swapped
@@ -0,0 +1,107 @@
+"""Token authentication that also resolves the RareUser"""
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from rareapi.caching import TTLCache
+from rareapi.models import RareUser
+
+# Longest another worker process keeps accepting a token after it was
+# deleted or its user deactivated or deleted
+REVOCATION_SECONDS = 5
+
+
+class CachedToken(namedtuple('CachedToken', 'token user rare_user')):
+    """Column values of a token, its User and its RareUser (or None)"""
+
+    @property
+    def user_id(self):
+        return self.user['id']
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """DRF token authentication with the RareUser attached to the request
+
+    The token, its user and the user's RareUser are loaded with one joined
+    query and their column values kept in a bounded TTL cache, so repeat
+    requests with the same token do not touch the database at all. Every
+    request gets model instances of its own built from those values, so
+    nothing is shared between requests or threads. Views read the profile
+    from `request.rare_user` instead of looking it up again.
+
+    The cache belongs to the process. The signal handlers in
+    `rareapi.signals` evict entries when a token is deleted or its User or
+    RareUser is saved, but only in the process making the change: other
+    worker processes keep accepting the token for up to
+    `REVOCATION_SECONDS`, which is why the entries live no longer than that.
+    """
+    cache = TTLCache(max_entries=10000, ttl=REVOCATION_SECONDS)
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            request.rare_user = result[1].rare_user
+        return result
+
+    def authenticate_credentials(self, key):
+        cached = self.cache.get(key)
+        if cached is None:
+            cached = self.load_token(key)
+            self.cache.set(key, cached)
+        token = self.build_token(cached)
+        return (token.user, token)
+
+    def load_token(self, key):
+        """Fetch the token, user and RareUser in a single query
+
+        Returns:
+            CachedToken -- Their column values
+        """
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user__rareuser').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        # Staff accounts made with createsuperuser have no RareUser
+        try:
+            rare_user = column_values(token.user.rareuser)
+        except RareUser.DoesNotExist:
+            rare_user = None
+        return CachedToken(column_values(token), column_values(token.user), rare_user)
+
+    def build_token(self, cached):
+        """New token, User and RareUser instances from cached column values"""
+        token = from_values(self.get_model(), cached.token)
+        token.user = from_values(User, cached.user)
+        token.rare_user = None
+        if cached.rare_user is not None:
+            token.rare_user = from_values(RareUser, cached.rare_user)
+            token.user.rareuser = token.rare_user
+        return token
+
+    @classmethod
+    def forget_token(cls, key):
+        cls.cache.delete(key)
+
+    @classmethod
+    def forget_user(cls, user_id):
+        cls.cache.delete_where(lambda cached: cached.user_id == user_id)
+
+
+def column_values(instance):
+    """The values of a model instance's columns, by attribute name"""
+    return {field.attname: getattr(instance, field.attname)
+            for field in instance._meta.concrete_fields}
+
+
+def from_values(model, values):
+    """A model instance for a row loaded earlier, as a query would build it"""
+    return model.from_db(DEFAULT_DB_ALIAS, list(values), list(values.values()))
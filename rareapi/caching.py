@@ -0,0 +1,243 @@
+"""Caches for reference data and other hot lookups
+
+`TTLCache` is a plain bounded cache whose entries expire after a fixed
+time. `VersionedCache` holds rarely changing reference data: categories
+and tags are read on nearly every screen but written almost never, so
+their serialized payloads are kept in memory and thrown away as a whole
+whenever a row changes.
+
+The payloads live in each process, but the version they are keyed by is a
+`CacheVersion` row in the database, read once per request. A write bumps
+it in the write's own transaction (the model signals in `rareapi.signals`
+do it), so once the write commits every web worker, and the `run_jobs`
+worker, moves to the new version together, and older entries become
+unreachable and are pushed out by the LRU bound.
+
+Cached payloads are read from the primary, never a replica: the views
+serving them through `cached_response` are not `replica_reads`, since a
+payload read from a replica that has not caught up with a write would be
+cached under the version that write set, and served until the next one.
+
+The version doubles as the ETag, letting clients that already hold the
+current payload get a 304 before the view touches the tables behind it.
+
+The payloads also carry post counts, which change with every post and
+tag written. Bumping on those would empty the cache all the time, so
+counts are allowed to be stale instead: with a `ttl`, the version also
+changes every `ttl` seconds, which rebuilds the payloads (and their
+ETags) at least that often. A count is never more than `ttl` seconds
+old, while label changes still show up at once.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from rareapi.models import CacheVersion
+
+# Version of a namespace that has never been bumped
+INITIAL_VERSION = '0'
+
+
+class VersionedCache:
+    """A bounded LRU of serialized payloads tied to a shared version"""
+
+    def __init__(self, namespace, max_entries=256, ttl=None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def version(self):
+        """Read the current version from the database
+
+        Always from the primary: a replica could still hold the version
+        from before a write, and the payload would be cached under it.
+        """
+        token = (CacheVersion.objects.using(DEFAULT_DB_ALIAS)
+                 .filter(namespace=self.namespace)
+                 .values_list('token', flat=True).first()) or INITIAL_VERSION
+        if self.ttl is None:
+            return token
+        # Wall clock time, so every process moves to the next one together
+        return f'{token}.{int(time.time() // self.ttl)}'
+
+    def bump(self):
+        """Invalidate every cached payload, in every process"""
+        token = uuid.uuid4().hex
+        versions = CacheVersion.objects.using(DEFAULT_DB_ALIAS)
+        # INSERT OR IGNORE the row on the first bump, then move it on
+        versions.bulk_create([CacheVersion(namespace=self.namespace, token=token)],
+                             ignore_conflicts=True)
+        versions.filter(namespace=self.namespace).update(token=token)
+        self.clear()
+
+    def etag(self, version):
+        return f'"{self.namespace}-{version}"'
+
+    def get_or_set(self, version, key, producer):
+        """Return the payload cached under `key`, building it if needed
+
+        Arguments:
+            version -- The version read at the start of the request
+            key -- Hashable key for this payload within the namespace
+            producer -- Callable returning the payload on a cache miss
+        """
+        # The version was read before querying, so a write that lands
+        # while the payload is built leaves it under a version nobody
+        # asks for again
+        entry_key = (version, key)
+
+        with self._lock:
+            if entry_key in self._entries:
+                self._entries.move_to_end(entry_key)
+                return self._entries[entry_key]
+
+        payload = producer()
+
+        with self._lock:
+            self._entries[entry_key] = payload
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return payload
+
+    def clear(self):
+        """Drop this process's payloads, leaving the version alone"""
+        with self._lock:
+            self._entries.clear()
+
+
+class TTLCache:
+    """A bounded LRU whose entries expire `ttl` seconds after being set"""
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the live value for `key`, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_where(self, predicate):
+        """Drop every entry whose value satisfies `predicate`"""
+        with self._lock:
+            stale = [key for key, (_, value) in self._entries.items() if predicate(value)]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def invalidate(cache):
+    """Bump a `VersionedCache` as part of the current write
+
+    Inside a transaction the new version commits, or rolls back, together
+    with the rows it covers, so no process sees one without the other.
+    """
+    cache.bump()
+
+
+def cached_response(request, cache, key, producer, exists=None):
+    """Serve a cached payload with an ETag, or a 304 if the client has it
+
+    The ETag covers the whole namespace, so it matches for ids that do not
+    exist as well. Detail routes pass `exists`, which is checked (and its
+    answer cached under the same version) before any 304 is sent.
+
+    Arguments:
+        request -- The full HTTP request object
+        cache -- The `VersionedCache` holding the payload
+        key -- Cache key for this payload
+        producer -- Callable returning the payload on a cache miss
+        exists -- Optional callable telling whether the resource exists
+
+    Returns:
+        Response -- 200 with the payload, an empty 304, or a 404
+    """
+    version = cache.version()
+    if exists is not None and not cache.get_or_set(version, ('exists', key), exists):
+        return Response({'message': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    etag = cache.etag(version)
+    if etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    payload = cache.get_or_set(version, key, producer)
+    return Response(payload, headers={'ETag': etag})
+
+
+def etag_matches(request, etag):
+    """Check `etag` against the request's If-None-Match header"""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    if '*' in etags:
+        return True
+    return etag in (tag[2:] if tag.startswith('W/') else tag for tag in etags)
+
+
+def not_modified(request, etag, last_modified):
+    """Check a request's conditional headers against a resource's validators
+
+    If-None-Match wins over If-Modified-Since when both are sent, as HTTP
+    requires. Last-Modified only has whole seconds, so a resource changed
+    within the second the client last saw counts as unchanged by that
+    header; clients that need better should send If-None-Match.
+
+    Arguments:
+        request -- The full HTTP request object
+        etag -- The resource's current ETag
+        last_modified -- Aware datetime the resource last changed
+    """
+    if request.META.get('HTTP_IF_NONE_MATCH'):
+        return etag_matches(request, etag)
+    since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return since is not None and int(last_modified.timestamp()) <= since
+
+
+def validator_headers(etag, last_modified):
+    """Response headers for a resource clients should revalidate each time"""
+    return {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified.timestamp()),
+        'Cache-Control': 'private, no-cache',
+    }
+
+
+# Longest a cached post count may lag behind, in seconds
+COUNT_TTL = 30
+
+category_cache = VersionedCache('categories', ttl=COUNT_TTL)
+tag_cache = VersionedCache('tags', ttl=COUNT_TTL)
@@ -0,0 +1,173 @@
+"""Denormalized counter columns
+
+Counting related rows with `Count()` on every list request gets slower as
+the tables grow, so three counts are stored on the rows they describe:
+
+* `Post.comment_count` -- comments on the post
+* `Category.post_count` -- posts in the category
+* `Tag.post_count` -- posts carrying the tag
+
+Single rows created or deleted through the ORM are counted by the signal
+handlers in `rareapi.signals`. `bulk_create` and `QuerySet.update()` send
+no signals, so code using them calls `adjust` itself. Every change is an
+`UPDATE ... SET n = n + delta`, so concurrent writers never overwrite each
+other's counts. Changing a post's comment count also sets its
+`updated_at`, which is how new and deleted comments reach the post
+detail's ETag.
+
+The bulk writes, which count their rows themselves, also queue a
+`counters.reconcile` job with `reconcile_later` that recounts the rows
+they changed once the response is sent, so a count gone wrong there (a
+concurrent attach of the same tag, say) does not stay wrong. Anything
+else that slips past (raw SQL, a crash between writes) is repaired by
+`reconcile`, run from the `reconcile_counters` command.
+"""
+from collections import Counter, defaultdict, namedtuple
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from rareapi import jobs
+from rareapi.models import Category, Post, PostTag, Tag
+from rareapi.models.comment import Comment
+
+RECONCILE = 'counters.reconcile'
+
+# Ids per `pk IN (...)` update, under older SQLite's 999 parameter limit
+CHUNK_SIZE = 900
+
+
+class CounterColumn(namedtuple('CounterColumn', 'model field related fk touch',
+                               defaults=(None,))):
+    """A count of `related` rows, stored in `model.field`
+
+    Arguments:
+        model -- Model holding the count
+        field -- Name of the counter field
+        related -- Model whose rows are counted
+        fk -- Name of the foreign key from `related` to `model`
+        touch -- Optional timestamp field on `model` set to now whenever
+        the count changes, in the same UPDATE
+    """
+
+    @property
+    def name(self):
+        return f'{self.model.__name__}.{self.field}'
+
+
+POST_COMMENTS = CounterColumn(Post, 'comment_count', Comment, 'post', 'updated_at')
+# The cached category and tag payloads are not invalidated when these
+# change; they are rebuilt every COUNT_TTL seconds instead, see
+# rareapi.caching
+CATEGORY_POSTS = CounterColumn(Category, 'post_count', Post, 'category')
+TAG_POSTS = CounterColumn(Tag, 'post_count', PostTag, 'tag_id')
+
+COUNTERS = (POST_COMMENTS, CATEGORY_POSTS, TAG_POSTS)
+
+
+def by_name(name):
+    """The counter called `name`, e.g. Post.comment_count"""
+    return next(counter for counter in COUNTERS if counter.name == name)
+
+
+def adjust(counter, ids, sign=1):
+    """Add one to the counter of every id given, or subtract with sign=-1
+
+    An id may appear more than once, e.g. the post of every comment in a
+    batch. Rows changing by the same amount share one UPDATE.
+
+    Arguments:
+        counter -- The `CounterColumn` to change
+        ids -- Primary keys of `counter.model` rows, one per counted row
+        sign -- 1 for rows created, -1 for rows deleted
+    """
+    by_delta = defaultdict(list)
+    for pk, times in Counter(ids).items():
+        if pk is not None:
+            by_delta[times * sign].append(pk)
+    if not by_delta:
+        return
+
+    field = counter.field
+    for delta, pks in by_delta.items():
+        # The column cannot go below zero; if it would, it had drifted and
+        # reconcile puts it right
+        value = F(field) + delta if delta > 0 else Greatest(F(field) + delta, Value(0))
+        for start in range(0, len(pks), CHUNK_SIZE):
+            counter.model.objects.filter(pk__in=pks[start:start + CHUNK_SIZE]).update(
+                **{field: value}, **_touched(counter))
+
+
+def _touched(counter):
+    """Extra UPDATE values setting the counter's `touch` field, if it has one"""
+    return {counter.touch: timezone.now()} if counter.touch else {}
+
+
+def actual_count(counter):
+    """Expression counting the related rows of each `counter.model` row"""
+    related = (counter.related.objects
+               .filter(**{counter.fk: OuterRef('pk')})
+               .order_by()
+               .values(counter.fk)
+               .annotate(n=Count('pk'))
+               .values('n'))
+    return Coalesce(Subquery(related), Value(0))
+
+
+def reconcile_later(counter, ids):
+    """Queue a recount of some rows of a counter for the job worker"""
+    ids = sorted({pk for pk in ids if pk is not None})
+    if ids:
+        jobs.enqueue(RECONCILE, {'counter': counter.name, 'ids': ids})
+
+
+def reconcile_rows(counter, ids):
+    """Recount the given rows of a counter column and fix the drifted ones
+
+    Returns:
+        list -- The primary keys of the rows fixed
+    """
+    field = counter.field
+    drifted = []
+    for start in range(0, len(ids), CHUNK_SIZE):
+        rows = (counter.model.objects.filter(pk__in=ids[start:start + CHUNK_SIZE])
+                .annotate(actual=actual_count(counter))
+                .values_list('pk', field, 'actual'))
+        pks = [pk for pk, stored, actual in rows if stored != actual]
+        if pks:
+            counter.model.objects.filter(pk__in=pks).update(
+                **{field: actual_count(counter)}, **_touched(counter))
+        drifted += pks
+    return drifted
+
+
+def reconcile(counter, batch_size=1000, dry_run=False):
+    """Recount a counter column in primary key order and fix drifted rows
+
+    Each batch runs in its own short transaction. Drifted rows are set from
+    a subquery in the UPDATE itself, so a row counted by another writer
+    between the check and the fix still ends up right.
+
+    Yields:
+        tuple -- `(rows checked, drifted primary keys)` for each batch
+    """
+    field = counter.field
+    last = None
+    while True:
+        with transaction.atomic():
+            rows = counter.model.objects.order_by('pk')
+            if last is not None:
+                rows = rows.filter(pk__gt=last)
+            rows = list(rows.annotate(actual=actual_count(counter))
+                        .values_list('pk', field, 'actual')[:batch_size])
+            if not rows:
+                return
+            last = rows[-1][0]
+
+            drifted = [pk for pk, stored, actual in rows if stored != actual]
+            if drifted and not dry_run:
+                counter.model.objects.filter(pk__in=drifted).update(
+                    **{field: actual_count(counter)}, **_touched(counter))
+        yield len(rows), drifted
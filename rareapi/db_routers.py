@@ -0,0 +1,146 @@
+"""Read replica routing
+
+`PrimaryReplicaRouter` sends every write to the `default` (primary)
+database. Reads go to the primary too, except inside view handlers
+decorated with `replica_reads`, whose reads are spread over the aliases in
+`settings.DATABASE_REPLICAS`. With no replicas configured everything stays
+on the primary.
+
+Replicas lag behind the primary, so a client that has just written must
+not read from one, or its own post could be missing from the list it is
+sent back to. The router notes every write made while handling a request
+(in a context variable, so writes made on another thread under ASGI count
+too), and `ReplicaPinningMiddleware` then pins that client to the primary for
+`settings.REPLICA_LAG_SECONDS`: by user in this process, and with a cookie
+that other worker processes see as well.
+
+See rare/settings_replicas.py for a local setup with two SQLite files,
+kept in step by the `sync_replicas` command.
+"""
+import asyncio
+import functools
+import random
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from rareapi.caching import TTLCache
+
+PIN_COOKIE = 'rare_primary'
+
+_state = threading.local()
+
+# Labels of the models written while handling the current request
+request_writes = ContextVar('rareapi_request_writes', default=None)
+
+# Users who wrote within the last REPLICA_LAG_SECONDS, in this process
+pinned_users = TTLCache(10000, getattr(settings, 'REPLICA_LAG_SECONDS', 5))
+
+
+class PrimaryReplicaRouter:
+    """Route writes to the primary and replica-safe reads to a replica"""
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if replicas and getattr(_state, 'replica', False):
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        writes = request_writes.get()
+        if writes is not None:
+            writes.add(model._meta.label)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every database holds the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema along with their data from the primary
+        return db not in settings.DATABASE_REPLICAS
+
+
+def replica_reads(handler):
+    """Let a view handler's reads go to a replica
+
+    Only for handlers that read and never write. Clients pinned to the
+    primary by a recent write keep reading from it.
+    """
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        if is_pinned(request):
+            return handler(view, request, *args, **kwargs)
+        _state.replica = True
+        try:
+            return handler(view, request, *args, **kwargs)
+        finally:
+            _state.replica = False
+    return wrapper
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, even in a `replica_reads` handler"""
+    previous = getattr(_state, 'replica', False)
+    _state.replica = False
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def is_pinned(request):
+    """Whether a client wrote recently and must read from the primary"""
+    if request.COOKIES.get(PIN_COOKIE):
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and pinned_users.get(user.pk) is not None
+
+
+class ReplicaPinningMiddleware:
+    """Pin clients that wrote during a request to the primary for a while"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            self._is_coroutine = asyncio.coroutines._is_coroutine  # pylint: disable=protected-access
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        writes = set()
+        token = request_writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_writes.reset(token)
+        return self.pin(request, response, writes)
+
+    async def __acall__(self, request):
+        writes = set()
+        token = request_writes.set(writes)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_writes.reset(token)
+        if writes:
+            # request.user may still be a lazy session lookup, which must
+            # not run on the event loop
+            response = await sync_to_async(self.pin)(request, response, writes)
+        return response
+
+    def pin(self, request, response, writes):
+        if writes and settings.DATABASE_REPLICAS:
+            lag = settings.REPLICA_LAG_SECONDS
+            user = getattr(request, 'user', None)
+            if user is not None and user.pk is not None:
+                pinned_users.set(user.pk, True)
+            response.set_cookie(PIN_COOKIE, '1', max_age=lag, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,125 @@
+"""Deleting categories, posts and users with large cascades in batches
+
+`Model.delete()` loads every row that cascades from the one deleted and
+removes them all in one transaction. For a popular category that is each
+of its posts with their comments and tags, and SQLite holds its single
+write lock for all of it, so every other writer waits.
+
+These rows are deleted in two steps instead:
+
+1. `hide` marks the row deleted (`deleted_at`, and `is_active` for a
+   user), which takes it and everything under it out of the API at once.
+2. The `deletion.purge` job in `rareapi.tasks` calls `purge_batch` until
+   the row is gone. Each call removes at most `batch_size` dependent rows
+   with one raw DELETE, deepest first (comments and tags before their
+   posts), and commits, so other writers get the lock between batches.
+
+A raw DELETE skips the ORM's cascade and signals, so the cascade is
+walked here from `_meta.related_objects`, and the counters in
+`rareapi.counters` that included the removed rows are adjusted, unless
+the row holding the count is going too. The search index keeps up with
+deleted posts through its own triggers. The row itself is deleted last
+through the ORM, when nothing is left to cascade to.
+"""
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.db.models import CASCADE, DO_NOTHING
+from django.utils import timezone
+
+from rareapi import counters
+from rareapi.models import Post, RareUser
+
+
+def hide(instance):
+    """Mark a category, post or user deleted so the API stops showing it"""
+    now = timezone.now()
+    if isinstance(instance, User):
+        # Saving evicts the user's tokens from the authentication cache,
+        # and an inactive user's token no longer authenticates
+        instance.is_active = False
+        instance.save(update_fields=['is_active'])
+        RareUser.objects.filter(user=instance).update(deleted_at=now)
+    elif isinstance(instance, Post):
+        # update() skips auto_now, and the post detail's ETag needs it
+        Post.objects.filter(pk=instance.pk).update(deleted_at=now, updated_at=now)
+    else:
+        # post_save invalidates the category cache
+        instance.deleted_at = now
+        instance.save(update_fields=['deleted_at'])
+
+
+def cascade_paths(model, path=()):
+    """Every model a delete of `model` cascades to, deepest first
+
+    Returns:
+        list -- `(related model, path)` pairs, where `path` holds the names
+        of the foreign keys leading from the related model to `model`
+    """
+    paths = []
+    for relation in model._meta.related_objects:
+        related = relation.related_model
+        if relation.many_to_many or relation.on_delete is DO_NOTHING:
+            continue
+        if relation.on_delete is not CASCADE:
+            raise ValueError(f'{related._meta.label}.{relation.field.name} does not '
+                             f'cascade, so {model._meta.label} cannot be deleted in batches')
+        fields = (relation.field.name, *path)
+        paths += cascade_paths(related, fields)
+        paths.append((related, fields))
+    return paths
+
+
+def purge_batch(model, pk, batch_size):
+    """Delete up to `batch_size` rows cascading from one row, or the row itself
+
+    Run it in a transaction that has already written, as `jobs.run` does
+    by deleting the job first: SQLite fails a transaction that reads and
+    then finds another writer holding the lock, rather than waiting.
+
+    Arguments:
+        model -- The model of the row being deleted, e.g. Category
+        pk -- Its primary key
+        batch_size -- Most dependent rows deleted in this call
+
+    Returns:
+        tuple -- Whether the row itself is gone, and a Counter of the rows
+        deleted in this call by model label
+    """
+    with transaction.atomic():
+        for related, path in cascade_paths(model):
+            # Counters on rows other than the one the path leads through,
+            # e.g. a deleted user's comments on other people's posts
+            adjusted = [counter for counter in counters.COUNTERS
+                        if counter.related is related and counter.fk != path[0]]
+            rows = list(related._base_manager
+                        .filter(**{'__'.join(path): pk})
+                        .order_by()
+                        .values_list('pk', *(counter.fk for counter in adjusted))[:batch_size])
+            if not rows:
+                continue
+            delete_rows(related, [row[0] for row in rows])
+            for column, counter in enumerate(adjusted, 1):
+                counters.adjust(counter, [row[column] for row in rows], sign=-1)
+            return False, Counter({related._meta.label: len(rows)})
+
+        # Nothing cascades from the row any more, so the ORM deletes just
+        # the row, and sends the signals that count and cache it
+        instance = model._base_manager.filter(pk=pk).first()
+        if instance is None:
+            return True, Counter()
+        instance.delete()
+        return True, Counter({model._meta.label: 1})
+
+
+def delete_rows(model, pks):
+    """Delete rows by primary key with raw DELETE statements"""
+    connection = connections[router.db_for_write(model)]
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), counters.CHUNK_SIZE):
+            chunk = pks[start:start + counters.CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({placeholders})', chunk)
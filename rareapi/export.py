@@ -0,0 +1,49 @@
+"""Streaming NDJSON export of posts and their comments
+
+Posts are read with `QuerySet.iterator()` so only one chunk of rows is in
+memory at a time. `iterator()` ignores `prefetch_related`, so the
+relations declared in the serializer's query plan are prefetched by hand
+for each chunk. Peak memory depends on the chunk size, not the table size.
+"""
+import json
+
+from django.db.models import prefetch_related_objects
+from rest_framework.utils.encoders import JSONEncoder
+
+from rareapi.models import Post
+from rareapi.query_plans import apply_query_plan, query_plan_prefetches
+
+DEFAULT_CHUNK_SIZE = 500
+# Each chunk's comments are fetched with one `IN (...)` query, and older
+# SQLite builds allow at most 999 parameters per statement
+MAX_CHUNK_SIZE = 900
+
+
+def iter_post_chunks(serializer_class, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of at most `chunk_size` posts, ready for `serializer_class`
+
+    `chunk_size` is kept between 1 and MAX_CHUNK_SIZE.
+    """
+    chunk_size = max(1, min(chunk_size, MAX_CHUNK_SIZE))
+    posts = apply_query_plan(Post.objects.alive().order_by('id'), serializer_class,
+                             prefetch=False)
+    chunk = []
+    for post in posts.iterator(chunk_size=chunk_size):
+        chunk.append(post)
+        if len(chunk) == chunk_size:
+            yield _prefetch(chunk, serializer_class)
+            chunk = []
+    if chunk:
+        yield _prefetch(chunk, serializer_class)
+
+
+def _prefetch(chunk, serializer_class):
+    prefetch_related_objects(chunk, *query_plan_prefetches(Post, serializer_class))
+    return chunk
+
+
+def export_posts_ndjson(serializer_class, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the export as bytes, one JSON document per line per post"""
+    for chunk in iter_post_chunks(serializer_class, chunk_size):
+        for row in serializer_class(chunk, many=True).data:
+            yield json.dumps(row, cls=JSONEncoder, ensure_ascii=False).encode('utf-8') + b'\n'
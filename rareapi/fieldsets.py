@@ -0,0 +1,111 @@
+"""Sparse fieldsets: the `?fields=` and `?expand=` query parameters
+
+A client can ask for just the fields it shows and choose which relations
+come back as nested objects:
+
+    GET /posts?fields=id,title,category&expand=
+    GET /posts/3?fields=title,rare_user,comments&expand=rare_user
+
+`fields` is a comma separated list of top level fields; without it every
+field is sent. `expand` lists the relations rendered as nested objects;
+relations left out come back as their id. Without `expand` every relation
+is expanded, so a request with neither parameter gets the full response.
+
+The choice also shapes the query: columns of fields that are not asked for
+are left out of the SELECT, and relations that are not expanded are not
+joined or prefetched.
+"""
+import zlib
+from collections import namedtuple
+
+from rest_framework import serializers
+
+
+class FieldsetError(ValueError):
+    """Raised for a `fields` or `expand` parameter naming unknown fields"""
+
+
+class Fieldset(namedtuple('Fieldset', 'fields expand')):
+    """The fields a client asked for, and the relations to expand
+
+    Arguments:
+        fields -- Tuple of field names to render, in the serializer's order
+        expand -- Frozenset of relation names to render as nested objects
+    """
+
+    def includes(self, name):
+        return name in self.fields
+
+    def expands(self, name):
+        return name in self.fields and name in self.expand
+
+
+def parse_fieldset(request, available, expandable):
+    """Read `?fields=` and `?expand=` from a request
+
+    Arguments:
+        request -- The full HTTP request object
+        available -- Every field the serializer can render, in order
+        expandable -- The fields that can be nested objects or ids
+
+    Returns:
+        Fieldset -- What to render, or None when the client asked for the
+        default of everything, fully expanded
+
+    Raises:
+        FieldsetError -- For names the serializer does not have
+    """
+    fields = request.query_params.get('fields')
+    expand = request.query_params.get('expand')
+    if fields is None and expand is None:
+        return None
+
+    if fields is None:
+        fields = tuple(available)
+    else:
+        requested = _names(fields)
+        unknown = requested - set(available)
+        if unknown:
+            raise FieldsetError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        fields = tuple(name for name in available if name in requested)
+
+    if expand is None:
+        expand = frozenset(expandable)
+    else:
+        expand = frozenset(_names(expand))
+        unknown = expand - set(expandable)
+        if unknown:
+            raise FieldsetError(f"Cannot expand: {', '.join(sorted(unknown))}")
+
+    return Fieldset(fields, expand)
+
+
+def _names(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def fieldset_tag(fieldset):
+    """A short token telling fieldsets apart, e.g. for ETags; '' for the default"""
+    if fieldset is None:
+        return ''
+    canonical = ','.join(fieldset.fields) + ';' + ','.join(sorted(fieldset.expand))
+    return format(zlib.crc32(canonical.encode()), '08x')
+
+
+class SparseFieldsetMixin:
+    """Let a ModelSerializer render only the fields of a `Fieldset`
+
+    Relations listed in `Meta.expandable` that the fieldset does not expand
+    are rendered as their primary key, which DRF reads from the foreign
+    key column without loading the related row.
+    """
+
+    def __init__(self, *args, fieldset=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fieldset is None:
+            return
+        for name in list(self.fields):
+            if not fieldset.includes(name):
+                self.fields.pop(name)
+            elif name in self.Meta.expandable and not fieldset.expands(name):
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
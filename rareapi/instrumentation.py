@@ -0,0 +1,286 @@
+"""Per-request performance instrumentation
+
+`PerformanceMiddleware` measures every request and reports where the time
+went, three ways:
+
+* a `Server-Timing` response header, which browser dev tools show next to
+  the request
+* one JSON log line per request on the `rareapi.performance` logger
+* rolling per-route histograms, read from GET /stats/performance
+
+The numbers collected are:
+
+* db -- the time spent executing SQL and the number of queries, counted by
+  `record_query`, which `rareapi.signals` installs on every database
+  connection as it is opened
+* serializer -- the time serializers spent turning rows into
+  `response.data`, not counting the queries they ran, measured by
+  `TimedSerializerMixin` on the serializers in `rareapi.views` and by
+  `timed_serialization` around `FastPostSerializer`
+* render -- the time DRF's renderer spent turning `response.data` into
+  bytes, measured by `TimedRendererMixin` on the renderers in
+  `rareapi.renderers`
+* view -- everything else inside the view: Python work in the view,
+  permission checks, pagination
+* total -- the whole request as seen by the middleware
+
+Recording a request costs a few `perf_counter()` calls per query and one
+deque append per metric, so the middleware can stay on in production.
+
+The middleware works under WSGI and ASGI alike. The request being
+measured is kept in a context variable rather than a thread-local, so
+queries are counted whichever thread the view runs its SQL on.
+
+Streaming responses (the NDJSON export) are measured up to the moment the
+first byte is handed back, since the body is produced after the middleware
+has returned.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from rareapi.utils import percentile
+
+logger = logging.getLogger('rareapi.performance')
+
+# How many of the latest requests each route keeps per metric
+ROLLING_WINDOW = 1000
+
+METRICS = ('total', 'view', 'db', 'serializer', 'render', 'queries')
+
+# The metrics of the request being handled, if any
+current_metrics = ContextVar('rareapi_performance_metrics', default=None)
+
+
+class RequestMetrics:
+    """The numbers collected for a single request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.render_seconds = 0.0
+        # Set while a serializer is being timed, so the ones nested in it
+        # are not counted twice
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        """Time one query; installed with `connection.execute_wrapper`"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+def record_query(execute, sql, params, many, context):
+    """Count a query towards the current request, if there is one"""
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_query_timer(connection):
+    """Add `record_query` to a connection's execute wrappers, once"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class RollingHistogram:
+    """The latest `window` values of one metric"""
+
+    def __init__(self, window=ROLLING_WINDOW):
+        self.values = deque(maxlen=window)
+
+    def record(self, value):
+        self.values.append(value)
+
+    def summary(self):
+        values = list(self.values)
+        return {
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'p99': percentile(values, 99),
+            'max': max(values, default=0.0),
+        }
+
+
+class RouteStats:
+    """Rolling histograms of every metric, kept per route"""
+
+    def __init__(self, window=ROLLING_WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, sample):
+        """Add a request's `{metric: value}` sample to its route"""
+        with self.lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = {
+                    'requests': 0,
+                    **{metric: RollingHistogram(self.window) for metric in METRICS},
+                }
+            stats['requests'] += 1
+            for metric in METRICS:
+                stats[metric].record(sample[metric])
+
+    def snapshot(self):
+        """Summaries of every route, with times in milliseconds"""
+        with self.lock:
+            routes = {
+                route: {metric: list(stats[metric].values) for metric in METRICS}
+                for route, stats in self.routes.items()
+            }
+            counts = {route: stats['requests'] for route, stats in self.routes.items()}
+
+        snapshot = {}
+        for route, metrics in sorted(routes.items()):
+            summary = {'requests': counts[route], 'window': len(metrics['total'])}
+            for metric, values in metrics.items():
+                histogram = RollingHistogram(self.window)
+                histogram.values.extend(values)
+                summary[metric] = histogram.summary()
+            snapshot[route] = summary
+        return snapshot
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+
+
+route_stats = RouteStats()
+
+
+class PerformanceMiddleware:
+    """Measure each request and report it as a header, a log line and stats"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Tells Django's handler this instance is a coroutine function,
+            # as MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine  # pylint: disable=protected-access
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics, started = self.start(request)
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        metrics, started = self.start(request)
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    def start(self, request):
+        metrics = RequestMetrics()
+        # DRF's Request passes attribute lookups through to this HttpRequest,
+        # which is how TimedRendererMixin finds it
+        request.performance_metrics = metrics
+        return metrics, time.perf_counter()
+
+    def finish(self, request, response, metrics, started):
+        total = time.perf_counter() - started
+        sample = {
+            'total': total * 1000,
+            'view': max(0.0, total - metrics.db_seconds - metrics.serializer_seconds
+                        - metrics.render_seconds) * 1000,
+            'db': metrics.db_seconds * 1000,
+            'serializer': metrics.serializer_seconds * 1000,
+            'render': metrics.render_seconds * 1000,
+            'queries': metrics.queries,
+        }
+        route = route_name(request)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={sample["db"]:.2f};desc="{metrics.queries} queries"',
+            f'view;dur={sample["view"]:.2f}',
+            f'serializer;dur={sample["serializer"]:.2f}',
+            f'render;dur={sample["render"]:.2f}',
+            f'total;dur={sample["total"]:.2f}',
+        ])
+        route_stats.record(route, sample)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'route': route,
+                'path': request.path,
+                'status': response.status_code,
+                **{metric: round(value, 3) for metric, value in sample.items()},
+            }))
+        return response
+
+
+def route_name(request):
+    """Name a request by method and URL name, e.g. `GET post-detail`
+
+    The URL name keeps every post id under one route. Requests that did not
+    match a URL are grouped together.
+    """
+    match = getattr(request, 'resolver_match', None)
+    view_name = match.view_name if match is not None and match.view_name else 'unresolved'
+    return f'{request.method} {view_name}'
+
+
+@contextmanager
+def timed_serialization():
+    """Add the time spent in the block, less its queries, to the serializer metric"""
+    metrics = current_metrics.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    started = time.perf_counter()
+    db_seconds = metrics.db_seconds
+    try:
+        yield
+    finally:
+        metrics.serializer_seconds += (time.perf_counter() - started
+                                       - (metrics.db_seconds - db_seconds))
+        metrics.serializing = False
+
+
+class TimedSerializerMixin:
+    """Add the time spent serializing to the request's performance metrics
+
+    A list serializer hands each row to its child, so the rows are timed
+    one by one; serializers nested in a timed one are part of its time.
+    """
+
+    def to_representation(self, instance):
+        with timed_serialization():
+            return super().to_representation(instance)
+
+
+class TimedRendererMixin:
+    """Add the time spent rendering to the request's performance metrics"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            request = (renderer_context or {}).get('request')
+            metrics = getattr(request, 'performance_metrics', None)
+            if metrics is not None:
+                metrics.render_seconds += time.perf_counter() - started
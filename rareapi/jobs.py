@@ -0,0 +1,152 @@
+"""A small job queue backed by the `Job` table
+
+Work that does not have to finish before the response is sent is moved
+out of the request: the view calls `enqueue`, which is one INSERT in the
+request's own transaction, and the `run_jobs` worker runs the job later.
+A job enqueued in a transaction that rolls back disappears with it, and a
+committed one survives restarts.
+
+Tasks are plain functions registered with `@task`, taking the job's JSON
+payload as keyword arguments:
+
+    @task('trending.rescale')
+    def rescale_trending_scores():
+        ...
+
+    enqueue('trending.rescale', key='trending.rescale')
+
+Jobs that share a `key` coalesce: while one is pending, enqueueing another
+does nothing. Failed jobs are retried with exponential backoff and marked
+failed after the task's `max_attempts`. A job whose worker died is handed
+out again once its lock is older than `LOCK_TIMEOUT`.
+
+A task and the deletion of its job commit together, so a task that only
+writes to the database runs exactly once. Anything outside the database
+(e.g. an email) runs at least once and must tolerate a retry.
+"""
+import datetime
+import logging
+import random
+import traceback
+import uuid
+from collections import namedtuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Subquery
+from django.utils import timezone
+
+from rareapi.models import Job
+
+logger = logging.getLogger('rareapi.jobs')
+
+LOCK_TIMEOUT = datetime.timedelta(minutes=10)
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 60 * 60
+
+Task = namedtuple('Task', 'function max_attempts')
+
+TASKS = {}
+
+
+def task(name, max_attempts=5):
+    """Register a function as the task run for jobs called `name`"""
+    def register(function):
+        TASKS[name] = Task(function, max_attempts)
+        return function
+    return register
+
+
+def enqueue(name, payload=None, key=None, delay=0):
+    """Add a job to the queue
+
+    Arguments:
+        name -- A name registered with `@task`
+        payload -- JSON-serializable dict passed to the task as keywords
+        key -- Coalescing key; nothing is added while a pending job has it
+        delay -- Seconds before the job may run
+    """
+    if name not in TASKS:
+        raise ValueError(f'No task is registered as {name!r}')
+    job = Job(name=name, key=key, payload=payload or {},
+              run_at=timezone.now() + datetime.timedelta(seconds=delay))
+    # INSERT OR IGNORE (ON CONFLICT DO NOTHING): a pending duplicate wins
+    Job.objects.bulk_create([job], ignore_conflicts=True)
+
+
+def claim(batch_size):
+    """Lock up to `batch_size` due jobs for this worker and return them
+
+    A single UPDATE takes the jobs, so two workers claiming at once never
+    get the same job. Databases with SKIP LOCKED also skip each other's
+    rows in the subquery; SQLite ignores it, as it has a single writer.
+    """
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    release_stale(now)
+    with transaction.atomic():
+        due = (Job.objects.select_for_update(skip_locked=True)
+               .filter(status=Job.PENDING, run_at__lte=now)
+               .order_by('run_at', 'id')
+               .values('id')[:batch_size])
+        Job.objects.filter(id__in=Subquery(due), status=Job.PENDING).update(
+            status=Job.RUNNING, locked_by=token, locked_at=now,
+            attempts=F('attempts') + 1)
+    return list(Job.objects.filter(locked_by=token, status=Job.RUNNING).order_by('run_at', 'id'))
+
+
+def release_stale(now):
+    """Put jobs of a worker that died mid-job back in the queue"""
+    for job in Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - LOCK_TIMEOUT):
+        logger.warning('Job %s (%s) was abandoned by its worker', job.pk, job.name)
+        _requeue(job, now)
+
+
+def run(job):
+    """Run a claimed job, deleting it on success and retrying it on failure
+
+    Returns:
+        bool -- Whether the task succeeded
+    """
+    registered = TASKS.get(job.name)
+    try:
+        if registered is None:
+            raise LookupError(f'No task is registered as {job.name!r}')
+        with transaction.atomic():
+            # Write before the task reads anything: SQLite fails a
+            # transaction at once, rather than waiting, when it has read and
+            # then finds another writer holding the lock
+            Job.objects.filter(pk=job.pk).delete()
+            registered.function(**job.payload)
+    except Exception:  # A failing task must not take the worker down
+        fail(job, registered, traceback.format_exc())
+        return False
+    return True
+
+
+def fail(job, registered, error):
+    """Schedule a retry with backoff, or give up after the last attempt"""
+    max_attempts = registered.max_attempts if registered else 1
+    job.last_error = error[-4000:]
+    if job.attempts >= max_attempts:
+        logger.error('Job %s (%s) failed for good after %s attempts',
+                     job.pk, job.name, job.attempts)
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.FAILED, locked_by='', locked_at=None, last_error=job.last_error)
+        return
+
+    # Doubles with each attempt, with jitter so failures do not retry in step
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (job.attempts - 1))
+    delay *= random.uniform(0.5, 1.0)
+    logger.warning('Job %s (%s) failed, retrying in %.0fs', job.pk, job.name, delay)
+    _requeue(job, timezone.now() + datetime.timedelta(seconds=delay))
+
+
+def _requeue(job, run_at):
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.PENDING, run_at=run_at, locked_by='', locked_at=None,
+                last_error=job.last_error)
+    except IntegrityError:
+        # A job with the same key was enqueued meanwhile and will do the work
+        Job.objects.filter(pk=job.pk).delete()
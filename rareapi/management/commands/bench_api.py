@@ -0,0 +1,284 @@
+"""Benchmark every API route through the Django test client
+
+Each route registered in rare/urls.py is requested a number of times and
+the command reports p50/p95 latency, queries per request and bytes per
+response. Results can be saved as JSON and compared against an earlier
+run to spot regressions. Everything the requests write is rolled back.
+
+Run it against a database filled by `manage.py seed_data`, since an empty
+database makes every route look fast.
+"""
+import datetime
+import itertools
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from rare.urls import router
+from rareapi.management.utils import rolled_back
+from rareapi.models import Category, Post, RareUser, Tag
+from rareapi.utils import percentile
+
+# The viewset methods DRF's router maps onto list and detail routes
+LIST_METHODS = {'get': 'list', 'post': 'create'}
+DETAIL_METHODS = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+                  'delete': 'destroy'}
+
+
+class Command(BaseCommand):
+    help = ('Request every API route repeatedly and report latency, queries and '
+            'response size, optionally comparing against a saved baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=30,
+                            help='Requests per route')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Compare against results saved with --output')
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help='Percent slowdown in p50/p95 counted as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        with rolled_back(), override_settings(ALLOWED_HOSTS=['testserver']):
+            context = self.make_context()
+            results = {}
+            for name, spec in self.routes(context):
+                if spec is None:
+                    self.stderr.write(f'No request spec for {name}, skipped')
+                    continue
+                results[name] = self.measure(context, spec, options['requests'])
+
+        self.report(results)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                regressions = self.compare(json.load(baseline), results, options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{regressions} routes regressed')
+
+    def make_context(self):
+        """Create the staff user and rows the request specs point at"""
+        user = User.objects.create_user(username='bench-api', password='bench-api')
+        user.is_staff = True
+        user.save()
+        rare_user = RareUser.objects.create(user=user, bio='', profile_image_url='',
+                                            created_on=datetime.date.today(), active=True)
+        token = Token.objects.create(user=user)
+        category = Category.objects.create(label='Bench')
+        tag = Tag.objects.create(label='bench')
+        post = Post.objects.create(rare_user=rare_user, category=category, title='Bench',
+                                   publication_date=datetime.date.today(), image_url='',
+                                   content='Benchmark post', approved=True)
+
+        # Record server errors as statuses instead of stopping the run
+        client = APIClient(raise_request_exception=False)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return {
+            'client': client,
+            'rare_user': rare_user,
+            'category': category,
+            'tag': tag,
+            'post': post,
+            'counter': itertools.count(),
+        }
+
+    def routes(self, context):
+        """Yield `(name, spec)` for every route in rare/urls.py
+
+        Router routes are found from the viewsets themselves, so a new action
+        shows up here (as skipped) until it gets an entry in `SPECS`.
+        """
+        names = []
+        for _, viewset, basename in router.registry:
+            for method, handler in LIST_METHODS.items():
+                if hasattr(viewset, handler):
+                    names.append(f'{method.upper()} {basename}-list')
+            for method, handler in DETAIL_METHODS.items():
+                if hasattr(viewset, handler):
+                    names.append(f'{method.upper()} {basename}-detail')
+            for extra in viewset.get_extra_actions():
+                for method in extra.mapping:
+                    names.append(f'{method.upper()} {basename}-{extra.url_name}')
+        # The admin/ and api-auth routes are browser UIs and not measured
+        names += ['GET api-root', 'POST register', 'POST login', 'POST user-import',
+                  'GET performance-stats', 'GET deletion-progress']
+
+        for name in names:
+            yield name, SPECS.get(name)
+
+    def measure(self, context, spec, count):
+        count = min(count, spec.get('max_requests', count))
+        timings, queries, sizes, statuses = [], [], [], {}
+
+        for _ in range(count):
+            method, url, body = spec['request'](context)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(context['client'], method)(url, body, format='json')
+                content = (b''.join(response.streaming_content)
+                           if response.streaming else response.content)
+                timings.append(time.perf_counter() - started)
+            queries.append(len(captured.captured_queries))
+            sizes.append(len(content))
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+        return {
+            'requests': count,
+            'p50_ms': round(percentile(timings, 50) * 1000, 3),
+            'p95_ms': round(percentile(timings, 95) * 1000, 3),
+            # The median, since the first request also fills the auth cache
+            'queries': percentile(queries, 50),
+            'bytes': round(sum(sizes) / count),
+            'statuses': statuses,
+        }
+
+    def report(self, results):
+        self.stdout.write(f'{"route":<32}{"p50 ms":>9}{"p95 ms":>9}{"queries":>9}'
+                          f'{"bytes":>10}  statuses')
+        for name, row in results.items():
+            self.stdout.write(
+                f'{name:<32}{row["p50_ms"]:>9.2f}{row["p95_ms"]:>9.2f}{row["queries"]:>9.1f}'
+                f'{row["bytes"]:>10}  {row["statuses"]}')
+
+    def compare(self, baseline, results, threshold):
+        """Print the change against a baseline and count regressed routes"""
+        self.stdout.write('')
+        self.stdout.write(f'{"change vs baseline":<32}{"p50":>9}{"p95":>9}{"queries":>9}'
+                          f'{"bytes":>10}')
+        regressions = 0
+        for name, row in results.items():
+            before = baseline.get(name)
+            if before is None:
+                self.stdout.write(f'{name:<32}  (new route)')
+                continue
+            p50 = change(before['p50_ms'], row['p50_ms'])
+            p95 = change(before['p95_ms'], row['p95_ms'])
+            regressed = (p50 > threshold or p95 > threshold
+                         or row['queries'] > before['queries'])
+            regressions += regressed
+            line = (f'{name:<32}{p50:>+8.0f}%{p95:>+8.0f}%'
+                    f'{row["queries"] - before["queries"]:>+9.1f}'
+                    f'{row["bytes"] - before["bytes"]:>+10}')
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+        return regressions
+
+
+def change(before, after):
+    """Percent change from `before` to `after`"""
+    if not before:
+        return 0.0
+    return (after - before) / before * 100
+
+
+def _post(context):
+    return context['post'].id
+
+
+def _new(model, **fields):
+    """Make a row for a DELETE request to remove"""
+    return model.objects.create(**fields).id
+
+
+SPECS = {
+    'GET post-list': {
+        'request': lambda c: ('get', '/posts', None),
+    },
+    'POST post-list': {
+        'request': lambda c: ('post', '/posts', {
+            'category_id': c['category'].id, 'title': 'Bench', 'image_url': '',
+            'content': 'Created by bench_api'}),
+    },
+    'GET post-detail': {
+        'request': lambda c: ('get', f'/posts/{_post(c)}', None),
+    },
+    'PUT post-detail': {
+        'request': lambda c: ('put', f'/posts/{_post(c)}', {
+            'categoryId': c['category'].id, 'category': c['category'].id,
+            'title': 'Bench', 'publication_date': str(datetime.date.today()),
+            'image_url': '', 'content': 'Updated by bench_api'}),
+    },
+    'DELETE post-detail': {
+        'request': lambda c: ('delete', '/posts/' + str(_new(
+            Post, rare_user=c['rare_user'], category=c['category'], title='Doomed',
+            publication_date=datetime.date.today(), image_url='', content='',
+            approved=True)), None),
+    },
+    'POST post-createComment': {
+        'request': lambda c: ('post', f'/posts/{_post(c)}/createComment',
+                              {'content': 'Bench comment'}),
+    },
+    'POST post-tags': {
+        'request': lambda c: ('post', f'/posts/{_post(c)}/tags',
+                              {'attach': [c['tag'].id], 'detach': []}),
+    },
+    'GET post-moderation': {
+        'request': lambda c: ('get', '/posts/moderation', None),
+    },
+    'POST post-moderation': {
+        'request': lambda c: ('post', '/posts/moderation',
+                              {'approve': [_post(c)], 'reject': []}),
+    },
+    'GET post-export': {
+        'request': lambda c: ('get', '/posts/export', None),
+        'max_requests': 3,
+    },
+    'GET category-list': {
+        'request': lambda c: ('get', '/categories', None),
+    },
+    'POST category-list': {
+        'request': lambda c: ('post', '/categories', {'label': 'Bench'}),
+    },
+    'GET category-detail': {
+        'request': lambda c: ('get', f'/categories/{c["category"].id}', None),
+    },
+    'DELETE category-detail': {
+        'request': lambda c: ('delete', '/categories/' + str(
+            _new(Category, label='Doomed')), None),
+    },
+    'GET tag-list': {
+        'request': lambda c: ('get', '/tags', None),
+    },
+    'POST tag-list': {
+        'request': lambda c: ('post', '/tags', {'label': 'bench'}),
+    },
+    'DELETE tag-detail': {
+        'request': lambda c: ('delete', '/tags/' + str(_new(Tag, label='doomed')), None),
+    },
+    'GET api-root': {
+        'request': lambda c: ('get', '/', None),
+    },
+    'POST user-import': {
+        'request': lambda c: ('post', '/users/import', [
+            {'username': f'bench-import-{next(c["counter"])}', 'password': 'bench'}
+            for _ in range(10)]),
+        'max_requests': 3,
+    },
+    'GET performance-stats': {
+        'request': lambda c: ('get', '/stats/performance', None),
+    },
+    'GET deletion-progress': {
+        'request': lambda c: ('get', '/stats/deletions', None),
+    },
+    'POST register': {
+        'request': lambda c: ('post', '/register', {
+            'username': f'bench-register-{next(c["counter"])}', 'email': '',
+            'password': 'bench', 'first_name': 'Bench', 'last_name': 'Mark'}),
+        # Password hashing is deliberately slow
+        'max_requests': 5,
+    },
+    'POST login': {
+        'request': lambda c: ('post', '/login', {'username': 'bench-api',
+                                                 'password': 'bench-api'}),
+        'max_requests': 5,
+    },
+}
@@ -0,0 +1,242 @@
+"""Load test the read endpoints under WSGI and ASGI
+
+The same concurrent clients read /posts, a post, /categories and /tags
+from three stacks, all in this process with no web server in between:
+
+* wsgi -- Django's WSGI handler on a pool of `--threads` server threads,
+  like gunicorn's threaded worker
+* asgi-sync -- Django's ASGI handler with the plain views, which Django
+  runs one at a time on its single thread for sync code
+* asgi-async -- the ASGI handler with the async read views from
+  `rareapi.async_reads`, running reads on `--threads` pool threads
+
+Latency is measured from the moment a client sends a request, so time
+spent queueing for a server thread counts.
+
+A local SQLite file answers from the page cache, so reads mostly cost
+CPU, and threads cannot make CPU-bound Python faster. `--query-latency`
+adds a sleep to every query. That stands in for a database across the
+network, where the thread sits idle while it waits.
+"""
+import asyncio
+import datetime
+import io
+import itertools
+import os
+import tempfile
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.urls import include, path
+from rest_framework.authtoken.models import Token
+
+from rare.urls import router
+from rareapi.async_reads import async_read_urls
+from rareapi.models import Category, Post, RareUser, Tag
+from rareapi.utils import percentile
+
+MODES = ('wsgi', 'asgi-sync', 'asgi-async')
+
+# The async read routes first; everything else falls through to rare.urls
+async_urls = types.ModuleType('bench_asgi_urls')
+async_urls.urlpatterns = [
+    path('', include(async_read_urls(router.urls))),
+    path('', include('rare.urls')),
+]
+
+
+class Command(BaseCommand):
+    help = ('Compare requests/sec and tail latency of the read endpoints under '
+            'WSGI, ASGI with sync views and ASGI with async read views.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=[*MODES, 'all'], default='all')
+        parser.add_argument('--concurrency', type=int, default=64,
+                            help='Clients with a request in flight at all times')
+        parser.add_argument('--threads', type=int, default=8,
+                            help='WSGI server threads, and the ASGI read pool size')
+        parser.add_argument('--seconds', type=float, default=10.0)
+        parser.add_argument('--posts', type=int, default=2000,
+                            help='Posts seeded before the run')
+        parser.add_argument('--query-latency', type=float, default=0.0,
+                            help='Milliseconds added to every query, like a network round trip')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Read this path instead of the default mix; repeatable')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('This benchmark is for the SQLite backend')
+
+        modes = MODES if options['mode'] == 'all' else [options['mode']]
+        database = connections.settings['default']
+        original = dict(database)
+
+        delay = add_query_latency(options['query_latency'] / 1000)
+
+        with tempfile.TemporaryDirectory() as directory:
+            database['NAME'] = os.path.join(directory, 'bench.sqlite3')
+            connections['default'].close()
+            try:
+                call_command('migrate', verbosity=0)
+                token, paths = self.seed(options['posts'])
+                paths = options['paths'] or paths
+                connections['default'].close()
+                connection_created.connect(delay)
+                with override_settings(ALLOWED_HOSTS=['testserver'],
+                                       ASYNC_READ_THREADS=options['threads']):
+                    results = [self.run_mode(mode, token, paths, options) for mode in modes]
+            finally:
+                connection_created.disconnect(delay)
+                connections.close_all()
+                database.clear()
+                database.update(original)
+
+        self.report(results)
+
+    def seed(self, count):
+        """Create the user and rows the clients read"""
+        user = User.objects.create_user(username='bench-asgi', password='bench-asgi')
+        rare_user = RareUser.objects.create(user=user, bio='', profile_image_url='',
+                                            created_on=datetime.date.today(), active=True)
+        categories = Category.objects.bulk_create(
+            [Category(label=f'Category {i}') for i in range(10)])
+        Tag.objects.bulk_create([Tag(label=f'tag-{i}') for i in range(30)])
+        categories = list(Category.objects.all())
+        today = datetime.date.today()
+        Post.objects.bulk_create([
+            Post(rare_user=rare_user, category=categories[i % len(categories)],
+                 title=f'Post {i}', publication_date=today - datetime.timedelta(days=i % 365),
+                 image_url='', content='Seeded for the benchmark ' * 20, approved=True)
+            for i in range(count)
+        ])
+        post_id = Post.objects.values_list('id', flat=True).first()
+        paths = ['/posts', f'/posts/{post_id}', '/posts', '/categories', '/posts', '/tags']
+        return Token.objects.create(user=user).key, paths
+
+    def run_mode(self, mode, token, paths, options):
+        if mode == 'wsgi':
+            pool = ThreadPoolExecutor(options['threads'])
+            handler = WSGIHandler()
+
+            async def request(url):
+                status = await asyncio.get_running_loop().run_in_executor(
+                    pool, call_wsgi, handler, url, token)
+                return status
+        else:
+            pool = None
+            handler = ASGIHandler()
+
+            async def request(url):
+                return await call_asgi(handler, url, token)
+
+        urlconf = async_urls if mode == 'asgi-async' else 'rare.urls'
+        with override_settings(ROOT_URLCONF=urlconf):
+            timings, errors, elapsed = asyncio.run(
+                self.load(request, paths, options['concurrency'], options['seconds']))
+        if pool is not None:
+            pool.shutdown()
+        connections.close_all()
+
+        return {
+            'mode': mode,
+            'requests_per_second': len(timings) / elapsed,
+            'p50_ms': percentile(timings, 50) * 1000,
+            'p95_ms': percentile(timings, 95) * 1000,
+            'p99_ms': percentile(timings, 99) * 1000,
+            'errors': errors,
+        }
+
+    async def load(self, request, paths, concurrency, seconds):
+        """Keep `concurrency` requests in flight for `seconds`"""
+        timings = []
+        errors = 0
+        deadline = time.perf_counter() + seconds
+
+        async def client(number):
+            nonlocal errors
+            for url in itertools.islice(itertools.cycle(paths), number, None):
+                if time.perf_counter() >= deadline:
+                    return
+                started = time.perf_counter()
+                status = await request(url)
+                if status >= 400:
+                    errors += 1
+                else:
+                    timings.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(number) for number in range(concurrency)))
+        return timings, errors, time.perf_counter() - started
+
+    def report(self, results):
+        self.stdout.write(f'{"mode":<12}{"req/s":>9}{"p50":>11}{"p95":>11}'
+                          f'{"p99":>11}{"errors":>8}')
+        for row in results:
+            self.stdout.write(
+                f'{row["mode"]:<12}{row["requests_per_second"]:>9.1f}'
+                f'{row["p50_ms"]:>9.1f}ms{row["p95_ms"]:>9.1f}ms'
+                f'{row["p99_ms"]:>9.1f}ms{row["errors"]:>8}')
+
+
+def add_query_latency(seconds):
+    """A connection_created receiver that slows every query down by `seconds`"""
+    def sleep_then_execute(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def receiver(sender, connection, **kwargs):
+        if seconds and sleep_then_execute not in connection.execute_wrappers:
+            connection.execute_wrappers.append(sleep_then_execute)
+    return receiver
+
+
+def call_wsgi(handler, path, token):
+    """Send a GET through a WSGI handler and return the status code"""
+    path, _, query = path.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver', 'HTTP_AUTHORIZATION': f'Token {token}',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(),
+        'wsgi.url_scheme': 'http', 'wsgi.version': (1, 0),
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    statuses = []
+    response = handler(environ, lambda status, headers: statuses.append(status))
+    try:
+        for _ in response:
+            pass
+    finally:
+        response.close()
+    return int(statuses[0].split()[0])
+
+
+async def call_asgi(handler, path, token):
+    """Send a GET through an ASGI handler and return the status code"""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'authorization', f'Token {token}'.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await handler(scope, receive, send)
+    return messages[0]['status']
@@ -0,0 +1,77 @@
+"""Compare PostSerializer with FastPostSerializer on a large post list"""
+import datetime
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from rareapi.management.utils import rolled_back
+from rareapi.models import Category, Post, RareUser
+from rareapi.query_plans import apply_query_plan
+from rareapi.views.post import FastPostSerializer, PostSerializer
+
+
+class Command(BaseCommand):
+    help = ('Serialize the same posts with PostSerializer and FastPostSerializer '
+            'and report query+serialize time. Rows are created in a transaction '
+            'that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Runs per serializer; the best one is reported')
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self.seed(options['rows'])
+            self.compare(options['rows'], options['repeat'])
+
+    def seed(self, count):
+        users = []
+        for i in range(20):
+            user = User.objects.create_user(username=f'bench-serializer-{i}',
+                                            first_name='Bench', last_name=str(i))
+            users.append(RareUser.objects.create(
+                user=user, bio='', profile_image_url='',
+                created_on=datetime.date.today(), active=True))
+        categories = [Category.objects.create(label=f'Bench {i}') for i in range(10)]
+        today = datetime.date.today()
+        Post.objects.bulk_create([
+            Post(rare_user=users[i % len(users)], category=categories[i % len(categories)],
+                 title=f'Benchmark post {i}', publication_date=today,
+                 image_url='https://example.com/image.png',
+                 content='Serializer benchmark content', approved=True)
+            for i in range(count)
+        ])
+
+    def compare(self, count, repeat):
+        posts = Post.objects.order_by('-id')[:count]
+        renderer = JSONRenderer()
+
+        def slow():
+            return PostSerializer(apply_query_plan(posts, PostSerializer), many=True).data
+
+        def fast():
+            return FastPostSerializer(FastPostSerializer.rows(posts), many=True).data
+
+        timings = {}
+        payloads = {}
+        for name, run in (('PostSerializer', slow), ('FastPostSerializer', fast)):
+            best = None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                data = run()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+            payloads[name] = renderer.render(data)
+
+        for name, elapsed in timings.items():
+            self.stdout.write(f'{name:<20}{elapsed * 1000:>10.1f} ms for {count} rows')
+        self.stdout.write(f'speedup: {timings["PostSerializer"] / timings["FastPostSerializer"]:.1f}x')
+
+        if payloads['PostSerializer'] == payloads['FastPostSerializer']:
+            self.stdout.write(self.style.SUCCESS('Rendered JSON is byte-identical'))
+        else:
+            self.stdout.write(self.style.ERROR('Rendered JSON differs'))
@@ -0,0 +1,100 @@
+"""Compare render time and size of the JSON and MessagePack renderers"""
+import datetime
+import gzip
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from rareapi.management.utils import rolled_back
+from rareapi.models import Category, Post, RareUser
+from rareapi.models.comment import Comment
+from rareapi.query_plans import apply_query_plan
+from rareapi.renderers import MessagePackRenderer, OrjsonRenderer, msgpack, orjson
+from rareapi.views.post import FastPostSerializer, PostDetailSerializer
+
+
+class Command(BaseCommand):
+    help = ('Render a large post list and a post detail with many comments with '
+            'each renderer and report render time, size and gzipped size. Rows '
+            'are created in a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Posts in the list')
+        parser.add_argument('--comments', type=int, default=2000,
+                            help='Comments on the detail post')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Renders per payload; the best one is reported')
+
+    def handle(self, *args, **options):
+        renderers = {'json (stdlib)': JSONRenderer()}
+        if orjson is not None:
+            renderers['orjson'] = OrjsonRenderer()
+        else:
+            self.stderr.write('orjson is not installed, skipping it')
+        if msgpack is not None:
+            renderers['msgpack'] = MessagePackRenderer()
+        else:
+            self.stderr.write('msgpack is not installed, skipping it')
+
+        with rolled_back():
+            payloads = self.payloads(options['rows'], options['comments'])
+
+        for name, data in payloads.items():
+            self.stdout.write(f'{name}')
+            self.stdout.write(f'  {"renderer":<16}{"ms":>9}{"bytes":>12}{"gzipped":>12}')
+            reference = json.loads(JSONRenderer().render(data))
+            for renderer_name, renderer in renderers.items():
+                best = None
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    body = renderer.render(data)
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                self.stdout.write(f'  {renderer_name:<16}{best * 1000:>9.1f}{len(body):>12}'
+                                  f'{len(gzip.compress(body)):>12}')
+                if decode(renderer, body) != reference:
+                    self.stdout.write(self.style.ERROR(
+                        f'  {renderer_name} does not decode to the same data'))
+
+    def payloads(self, rows, comments):
+        """Serialize the list and detail payloads the renderers get"""
+        users = []
+        for i in range(20):
+            user = User.objects.create_user(username=f'bench-renderer-{i}',
+                                            first_name='Bench', last_name=str(i))
+            users.append(RareUser.objects.create(
+                user=user, bio='', profile_image_url='',
+                created_on=datetime.date.today(), active=True))
+        category = Category.objects.create(label='Bench')
+        today = datetime.date.today()
+        Post.objects.bulk_create([
+            Post(rare_user=users[i % len(users)], category=category,
+                 title=f'Benchmark post {i}', publication_date=today,
+                 image_url='https://example.com/image.png',
+                 content='Renderer benchmark content', approved=True)
+            for i in range(rows)
+        ])
+        post = Post.objects.order_by('-id').first()
+        Comment.objects.bulk_create([
+            Comment(post=post, author=users[i % len(users)],
+                    content=f'Renderer benchmark comment {i}', created_on=today)
+            for i in range(comments)
+        ])
+
+        posts = Post.objects.order_by('-id')[:rows]
+        detail = apply_query_plan(Post.objects.all(), PostDetailSerializer).get(pk=post.pk)
+        return {
+            f'PostView.list, {rows} posts':
+                FastPostSerializer(FastPostSerializer.rows(posts), many=True).data,
+            f'PostDetailSerializer, {comments} comments':
+                PostDetailSerializer(detail).data,
+        }
+
+
+def decode(renderer, body):
+    if isinstance(renderer, MessagePackRenderer):
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
@@ -0,0 +1,156 @@
+"""Measure read throughput on /posts while other threads create posts"""
+import datetime
+import os
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+
+from rare import settings_production
+from rareapi.models import Category, Post, RareUser
+from rareapi.utils import percentile
+
+# Connection settings compared by the benchmark. The default profile spells
+# out the rollback journal since WAL mode sticks to the database file.
+PROFILES = {
+    'default': {
+        'CONN_MAX_AGE': 0,
+        'SQLITE_PRAGMAS': {'journal_mode': 'DELETE'},
+    },
+    'production': {
+        'CONN_MAX_AGE': settings_production.DATABASES['default']['CONN_MAX_AGE'],
+        'SQLITE_PRAGMAS': settings_production.SQLITE_PRAGMAS,
+    },
+}
+
+
+class Command(BaseCommand):
+    help = ('Run GET /posts readers against POST /posts writers on a scratch '
+            'SQLite database and compare the default and production profiles.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=[*PROFILES, 'both'], default='both')
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=10.0)
+        parser.add_argument('--posts', type=int, default=2000,
+                            help='Posts seeded before the run')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('This benchmark is for the SQLite backend')
+
+        names = list(PROFILES) if options['profile'] == 'both' else [options['profile']]
+        database = connections.settings['default']
+        original = dict(database)
+
+        with tempfile.TemporaryDirectory() as directory:
+            database['NAME'] = os.path.join(directory, 'bench.sqlite3')
+            connections['default'].close()
+            try:
+                call_command('migrate', verbosity=0)
+                token, category_id = self.seed(options['posts'])
+                connections['default'].close()
+
+                results = [self.run_profile(name, token, category_id, options) for name in names]
+            finally:
+                connections['default'].close()
+                database.clear()
+                database.update(original)
+
+        self.report(results)
+
+    def seed(self, count):
+        """Create the user, category and posts the threads work with"""
+        user = User.objects.create_user(username='bench', password='bench')
+        rare_user = RareUser.objects.create(user=user, bio='', profile_image_url='',
+                                            created_on=datetime.date.today(), active=True)
+        category = Category.objects.create(label='Bench')
+        today = datetime.date.today()
+        Post.objects.bulk_create([
+            Post(rare_user=rare_user, category=category, title=f'Post {i}',
+                 publication_date=today - datetime.timedelta(days=i % 365),
+                 image_url='', content='Seeded for the benchmark', approved=True)
+            for i in range(count)
+        ])
+        return Token.objects.create(user=user).key, category.id
+
+    def run_profile(self, name, token, category_id, options):
+        profile = PROFILES[name]
+        database = connections.settings['default']
+        database['CONN_MAX_AGE'] = profile['CONN_MAX_AGE']
+
+        reads, writes, errors = [], [], []
+        stop = threading.Event()
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'}
+
+        def worker(action, timings):
+            client = Client()
+            try:
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    try:
+                        response = action(client)
+                    except Exception as ex:  # The whole point is to count these
+                        errors.append(str(ex))
+                        continue
+                    if response.status_code >= 400:
+                        errors.append(f'HTTP {response.status_code}')
+                        continue
+                    timings.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        def read(client):
+            return client.get('/posts', **headers)
+
+        def write(client):
+            return client.post('/posts', {
+                'category_id': category_id, 'title': 'Written during the benchmark',
+                'image_url': '', 'content': 'Mixed load'}, content_type='application/json',
+                **headers)
+
+        with override_settings(SQLITE_PRAGMAS=profile['SQLITE_PRAGMAS'],
+                               ALLOWED_HOSTS=['testserver']):
+            threads = (
+                [threading.Thread(target=worker, args=(read, reads))
+                 for _ in range(options['readers'])] +
+                [threading.Thread(target=worker, args=(write, writes))
+                 for _ in range(options['writers'])]
+            )
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            time.sleep(options['seconds'])
+            stop.set()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+        return {
+            'profile': name,
+            'reads_per_second': len(reads) / elapsed,
+            'writes_per_second': len(writes) / elapsed,
+            'read_p50_ms': percentile(reads, 50) * 1000,
+            'read_p95_ms': percentile(reads, 95) * 1000,
+            'errors': len(errors),
+            'locked_errors': sum('locked' in error for error in errors),
+        }
+
+    def report(self, results):
+        header = (f'{"profile":<12}{"reads/s":>10}{"writes/s":>10}'
+                  f'{"read p50":>11}{"read p95":>11}{"errors":>8}{"locked":>8}')
+        self.stdout.write(header)
+        for row in results:
+            self.stdout.write(
+                f'{row["profile"]:<12}{row["reads_per_second"]:>10.1f}'
+                f'{row["writes_per_second"]:>10.1f}{row["read_p50_ms"]:>9.1f}ms'
+                f'{row["read_p95_ms"]:>9.1f}ms{row["errors"]:>8}{row["locked_errors"]:>8}')
+
@@ -0,0 +1,144 @@
+"""Run EXPLAIN QUERY PLAN over the queries behind every list/retrieve route"""
+import datetime
+import re
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import NoReverseMatch, reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from rare.urls import router
+from rareapi.management.utils import rolled_back
+from rareapi.models import RareUser
+
+# Query strings exercised on top of the bare list route
+LIST_VARIANTS = {
+    'post': [
+        'get_posts_by_user=1',
+        'tags=1',
+        'tags=1,2&tags_match=all',
+        'q=road trip',
+        'sort=trending',
+    ],
+}
+
+
+class Command(BaseCommand):
+    help = ('Request every list and retrieve route, EXPLAIN each query they run '
+            'and flag full table scans.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pk', default='1',
+                            help='Primary key used for the retrieve routes')
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='Print the plan of every query, not just flagged ones')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN output is only understood for SQLite')
+
+        self.verbose_plans = options['verbose_plans']
+        self.flagged = 0
+
+        # The throwaway user made for the run is rolled back with the rest
+        with rolled_back(), override_settings(ALLOWED_HOSTS=['testserver']):
+            client = self.make_client()
+            for url in self.urls(options['pk']):
+                self.explain_route(client, url)
+
+        if self.flagged:
+            raise CommandError(f'{self.flagged} queries scan a whole table')
+        self.stdout.write(self.style.SUCCESS('No full table scans found'))
+
+    def make_client(self):
+        """Authenticate as a throwaway user that is rolled back afterwards"""
+        user = User.objects.create_user(username='explain-queries-user')
+        RareUser.objects.create(user=user, bio='', profile_image_url='',
+                                created_on=datetime.date.today(), active=True)
+        token = Token.objects.create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def urls(self, pk):
+        for _, viewset, basename in router.registry:
+            if hasattr(viewset, 'list'):
+                url = reverse(f'{basename}-list')
+                yield url
+                for query in LIST_VARIANTS.get(basename, []):
+                    yield f'{url}?{query}'
+            if hasattr(viewset, 'retrieve'):
+                try:
+                    yield reverse(f'{basename}-detail', kwargs={'pk': pk})
+                except NoReverseMatch:
+                    continue
+
+    def explain_route(self, client, url):
+        captured = []
+
+        def capture(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                captured.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            response = client.get(url)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'GET {url} -> {response.status_code}, {len(captured)} queries'))
+        for sql, params in captured:
+            self.explain(sql, params)
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = [row[-1] for row in cursor.fetchall()]
+
+        scans = full_scans(sql, plan)
+        if scans:
+            self.flagged += 1
+        if scans or self.verbose_plans:
+            self.stdout.write(f'  {sql}')
+            for detail in plan:
+                style = self.style.ERROR if detail in scans else str
+                self.stdout.write(style(f'    {detail}'))
+
+
+def full_scans(sql, plan):
+    """Pick out the plan lines that read an entire table
+
+    A scan of the outermost table is fine when the query stops after LIMIT
+    rows and walks the table in the order asked for, as the keyset
+    paginated lists do; it only costs the whole table when there is no
+    LIMIT or the rows have to be sorted first. Virtual tables such as the
+    FTS5 search index do their own lookups, so they are not counted, and
+    neither are partial indexes, which only hold the few rows matching
+    their condition (e.g. deleted categories).
+    """
+    partial = partial_indexes()
+    bounded = ' LIMIT ' in sql.upper() and not any(
+        'TEMP B-TREE FOR ORDER BY' in detail for detail in plan)
+    return [
+        detail for position, detail in enumerate(plan)
+        if detail.startswith('SCAN ')
+        and 'CONSTANT ROW' not in detail
+        and 'VIRTUAL TABLE' not in detail
+        and index_name(detail) not in partial
+        and not (bounded and position == 0)
+    ]
+
+
+def partial_indexes():
+    """Names of the indexes declared with a condition"""
+    return {index.name for model in apps.get_models()
+            for index in model._meta.indexes if index.condition is not None}
+
+
+def index_name(detail):
+    """The index a plan line reads, or None"""
+    match = re.search(r'USING (?:COVERING )?INDEX (\w+)', detail)
+    return match and match.group(1)
@@ -0,0 +1,30 @@
+"""Write every post with its comments as newline-delimited JSON"""
+from django.core.management.base import BaseCommand
+
+from rareapi.export import DEFAULT_CHUNK_SIZE, export_posts_ndjson
+from rareapi.views.post import PostDetailSerializer
+
+
+class Command(BaseCommand):
+    help = 'Export posts and their comments as NDJSON, reading the table in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o',
+                            help='File to write to; defaults to standard output')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Posts read from the database at a time')
+
+    def handle(self, *args, **options):
+        lines = export_posts_ndjson(PostDetailSerializer, options['chunk_size'])
+
+        if options['output'] is None:
+            for line in lines:
+                self.stdout.write(line.decode('utf-8'), ending='')
+            return
+
+        count = 0
+        with open(options['output'], 'wb') as output:
+            for line in lines:
+                output.write(line)
+                count += 1
+        self.stderr.write(f'Exported {count} posts to {options["output"]}')
@@ -0,0 +1,54 @@
+"""Import users from a CSV or JSON file"""
+import csv
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rareapi.registration import import_users
+
+
+class Command(BaseCommand):
+    help = ('Create a User, RareUser and token for every row of a CSV file (with a '
+            'header row) or a JSON array. Rows have username and password, and '
+            'optionally email, first_name, last_name, bio and profile_image_url. '
+            'Either every row is imported or none are.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='A .csv or .json file')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Password hashing processes, defaults to one per CPU')
+        parser.add_argument('--tokens', help='Write username,token for every new user to this CSV file')
+
+    def handle(self, *args, **options):
+        rows = self.read_rows(options['path'])
+
+        started = time.perf_counter()
+        tokens, errors = import_users(rows, processes=options['processes'])
+        if errors:
+            for line, row_errors in enumerate(errors, start=1):
+                if row_errors:
+                    self.stderr.write(f'row {line}: {row_errors}')
+            raise CommandError(f'{sum(map(bool, errors))} invalid rows, nothing imported')
+
+        if options['tokens']:
+            with open(options['tokens'], 'w', newline='') as output:
+                writer = csv.writer(output)
+                writer.writerow(['username', 'token'])
+                writer.writerows((token.user.username, token.key) for token in tokens)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {len(tokens)} users in {time.perf_counter() - started:.1f}s'))
+
+    def read_rows(self, path):
+        try:
+            with open(path, newline='') as source:
+                if path.endswith('.json'):
+                    rows = json.load(source)
+                else:
+                    rows = list(csv.DictReader(source))
+        except (OSError, ValueError) as ex:
+            raise CommandError(f'Could not read {path}: {ex}')
+        if not isinstance(rows, list):
+            raise CommandError('The JSON file must hold an array of users')
+        return rows
@@ -0,0 +1,17 @@
+"""Rebuild the full-text search index over posts"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from rareapi.search import install_search_index, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Recreate the FTS5 triggers if needed and rebuild the post search index.'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Post search uses SQLite FTS5')
+
+        install_search_index(connection)
+        rebuild_search_index(connection)
+        self.stdout.write(self.style.SUCCESS('Rebuilt the post search index'))
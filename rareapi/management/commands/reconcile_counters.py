@@ -0,0 +1,29 @@
+"""Repair drift in the denormalized counter columns"""
+from django.core.management.base import BaseCommand
+
+from rareapi.counters import COUNTERS, reconcile
+
+
+class Command(BaseCommand):
+    help = ('Recount Post.comment_count, Category.post_count and Tag.post_count in '
+            'batches and fix every row whose stored count has drifted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows checked per transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drifted rows without fixing them')
+
+    def handle(self, *args, **options):
+        for counter in COUNTERS:
+            name = counter.name
+            checked = drifted = 0
+            for rows, pks in reconcile(counter, options['batch_size'], options['dry_run']):
+                checked += rows
+                drifted += len(pks)
+                if pks and options['verbosity'] > 1:
+                    self.stdout.write(f'{name}: drifted ids {pks}')
+
+            verb = 'found' if options['dry_run'] else 'fixed'
+            style = self.style.WARNING if drifted else self.style.SUCCESS
+            self.stdout.write(style(f'{name}: checked {checked}, {verb} {drifted} drifted'))
@@ -0,0 +1,59 @@
+"""Run the background jobs queued with `rareapi.jobs.enqueue`"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from rareapi import jobs
+
+
+class Command(BaseCommand):
+    help = ('Claim due jobs in batches and run them on a pool of threads. '
+            'Failed jobs are retried with backoff.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Jobs run at the same time; 1 runs them in this thread')
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help='Jobs claimed per trip to the database')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Stop once no job is due instead of polling')
+
+    def handle(self, *args, **options):
+        threads = max(1, options['threads'])
+        pool = ThreadPoolExecutor(threads) if threads > 1 else None
+        succeeded = failed = 0
+        try:
+            while True:
+                batch = jobs.claim(options['batch_size'])
+                if not batch:
+                    if options['once']:
+                        break
+                    # Drop the connection while idle rather than hold it open
+                    close_old_connections()
+                    time.sleep(options['poll'])
+                    continue
+                if pool is None:
+                    results = [jobs.run(job) for job in batch]
+                else:
+                    results = list(pool.map(run_in_thread, batch))
+                succeeded += results.count(True)
+                failed += results.count(False)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self.stdout.write(f'{succeeded} jobs succeeded, {failed} failed')
+
+
+def run_in_thread(job):
+    """Run a job on a pool thread, which has its own database connection"""
+    try:
+        return jobs.run(job)
+    finally:
+        # Pool threads outlive requests, so nothing else closes it
+        connection.close()
@@ -0,0 +1,135 @@
+"""Fill the database with a synthetic dataset for load testing"""
+import datetime
+import random
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from rareapi import counters
+from rareapi.bulk import bulk_insert
+from rareapi.models import Category, Post, PostTag, RareUser, Tag
+from rareapi.models.comment import Comment
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = ('Generate users, RareUsers, tokens, categories, tags, posts, post tags '
+            'and comments with bulk inserts. Every seeded user has the password '
+            '"seed-password".')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--tags-per-post', type=int, default=3,
+                            help='Most tags put on one post; each post gets 0 to this many')
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Random seed, for a reproducible dataset')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Keeps usernames unique when the command runs more than once
+        run = uuid.UUID(int=rng.getrandbits(128)).hex[:6]
+        today = datetime.date.today()
+
+        rare_user_ids = self.seed_users(options['users'], run, today)
+        category_ids = [category.id for category in bulk_insert(
+            Category, [Category(label=f'Category {run}-{i}')
+                       for i in range(options['categories'])])]
+        tag_ids = [tag.id for tag in bulk_insert(
+            Tag, [Tag(label=f'Tag {run}-{i}') for i in range(options['tags'])])]
+        self.stdout.write(f'{len(rare_user_ids)} users, {len(category_ids)} categories, '
+                          f'{len(tag_ids)} tags')
+
+        post_ids = []
+        for start, size in batches(options['posts']):
+            with transaction.atomic():
+                posts = bulk_insert(Post, [
+                    Post(rare_user_id=rng.choice(rare_user_ids),
+                         category_id=rng.choice(category_ids),
+                         title=f'Seeded post {start + i}',
+                         publication_date=today - datetime.timedelta(days=rng.randrange(730)),
+                         image_url=f'https://picsum.photos/seed/{start + i}/400',
+                         content=' '.join(rng.choices(WORDS, k=12))[:100],
+                         approved=rng.random() > 0.05)
+                    for i in range(size)
+                ])
+                # bulk_create skips the signals that keep the counters
+                counters.adjust(counters.CATEGORY_POSTS, [post.category_id for post in posts])
+            post_ids.extend(post.id for post in posts)
+        self.stdout.write(f'{len(post_ids)} posts')
+
+        post_tags = 0
+        if tag_ids:
+            for start, size in batches(len(post_ids)):
+                rows = [
+                    PostTag(post_id_id=post_id, tag_id_id=tag_id)
+                    for post_id in post_ids[start:start + size]
+                    for tag_id in rng.sample(
+                        tag_ids, rng.randint(0, min(options['tags_per_post'], len(tag_ids))))
+                ]
+                with transaction.atomic():
+                    PostTag.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+                    counters.adjust(counters.TAG_POSTS, [row.tag_id_id for row in rows])
+                post_tags += len(rows)
+        self.stdout.write(f'{post_tags} post tags')
+
+        comments = 0
+        if post_ids:
+            for _, size in batches(options['comments']):
+                rows = [
+                    Comment(post_id=rng.choice(post_ids),
+                            author_id=rng.choice(rare_user_ids),
+                            content=' '.join(rng.choices(WORDS, k=20)),
+                            created_on=today - datetime.timedelta(days=rng.randrange(365)))
+                    for _ in range(size)
+                ]
+                with transaction.atomic():
+                    Comment.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+                    counters.adjust(counters.POST_COMMENTS, [row.post_id for row in rows])
+                comments += size
+        self.stdout.write(f'{comments} comments')
+
+    def seed_users(self, count, run, today):
+        """Create users with their RareUser and token, returning RareUser ids"""
+        # Hash once: the hasher is deliberately slow and every user shares it
+        password = make_password('seed-password')
+        rare_user_ids = []
+        for start, size in batches(count):
+            users = bulk_insert(User, [
+                User(username=f'seed-{run}-{start + i}', password=password,
+                     first_name='Seed', last_name=f'User {start + i}',
+                     email=f'seed-{run}-{start + i}@example.com')
+                for i in range(size)
+            ])
+            rare_users = bulk_insert(RareUser, [
+                RareUser(user_id=user.id, bio='', profile_image_url='',
+                         created_on=today, active=True)
+                for user in users
+            ])
+            with transaction.atomic():
+                # bulk_create skips Token.save(), which is what makes the key
+                Token.objects.bulk_create([
+                    Token(key=Token.generate_key(), user_id=user.id) for user in users])
+            rare_user_ids.extend(rare_user.id for rare_user in rare_users)
+        return rare_user_ids
+
+
+def batches(total, size=BATCH_SIZE):
+    """Yield (start, size) pairs covering `total` items in batches"""
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+WORDS = (
+    'road trip highway diner motel canyon desert mountain lake river coast '
+    'sunset campfire map detour gas station playlist snacks scenic route '
+    'national park trail view postcard souvenir adventure weekend'
+).split()
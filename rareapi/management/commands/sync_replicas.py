@@ -0,0 +1,42 @@
+"""Copy the primary SQLite database into every replica"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = ('Stand-in for replication on SQLite: copy the primary database into '
+            'each alias in DATABASE_REPLICAS with SQLite\'s online backup, which '
+            'takes a consistent snapshot while the primary is being written.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep syncing every this many seconds, like a lagging replica')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('DATABASE_REPLICAS is empty, see rare/settings_replicas.py')
+        aliases = ['default', *settings.DATABASE_REPLICAS]
+        if any(connections[alias].vendor != 'sqlite' for alias in aliases):
+            raise CommandError('Real databases replicate themselves; this is for SQLite only')
+
+        while True:
+            started = time.perf_counter()
+            for alias in settings.DATABASE_REPLICAS:
+                sync_replica(alias)
+            self.stdout.write(f'Synced {", ".join(settings.DATABASE_REPLICAS)} in '
+                              f'{(time.perf_counter() - started) * 1000:.0f} ms')
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
+
+
+def sync_replica(alias):
+    """Overwrite the replica `alias` with a snapshot of the primary"""
+    primary = connections['default']
+    replica = connections[alias]
+    primary.ensure_connection()
+    replica.ensure_connection()
+    primary.connection.backup(replica.connection)
@@ -0,0 +1,19 @@
+"""Helpers shared by the benchmark and diagnostic management commands"""
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+class Rollback(Exception):
+    """Raised to throw away everything a command wrote"""
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is always rolled back"""
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback()
+    except Rollback:
+        pass
@@ -0,0 +1,14 @@
+# Generated by Django 3.2.9 on 2021-11-18 16:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rareapi', '0004_alter_comment_post'),
+        ('rareapi', '0004_posttag'),
+    ]
+
+    operations = [
+    ]
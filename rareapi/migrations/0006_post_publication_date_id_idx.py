@@ -0,0 +1,17 @@
+# Generated by Django 3.2.9 on 2021-11-19 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rareapi', '0005_merge_0004_alter_comment_post_0004_posttag'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['publication_date', 'id'], name='post_publication_date_id_idx'),
+        ),
+    ]
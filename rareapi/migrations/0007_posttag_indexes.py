@@ -0,0 +1,47 @@
+# Generated by Django 3.2.9 on 2021-11-19 15:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Min
+
+
+def remove_duplicate_post_tags(apps, schema_editor):
+    """Keep the oldest row of each (post, tag) pair so the constraint applies"""
+    PostTag = apps.get_model('rareapi', 'PostTag')
+    keep = (PostTag.objects.values('post_id', 'tag_id')
+            .annotate(keep_id=Min('id')).values('keep_id'))
+    PostTag.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rareapi', '0006_post_publication_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='post_tag',
+            field=models.ManyToManyField(related_name='tag', through='rareapi.PostTag', to='rareapi.Tag'),
+        ),
+        migrations.AlterField(
+            model_name='posttag',
+            name='post_id',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='rareapi.post'),
+        ),
+        migrations.AlterField(
+            model_name='posttag',
+            name='tag_id',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='rareapi.tag'),
+        ),
+        migrations.AddIndex(
+            model_name='posttag',
+            index=models.Index(fields=['tag_id', 'post_id'], name='post_tag_tag_post_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_post_tags, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='posttag',
+            constraint=models.UniqueConstraint(fields=('post_id', 'tag_id'), name='post_tag_unique_post_tag'),
+        ),
+    ]
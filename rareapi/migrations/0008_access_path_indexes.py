@@ -0,0 +1,36 @@
+# Generated by Django 3.2.9 on 2021-11-22 14:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rareapi', '0007_posttag_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='post',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='rareapi.post'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='rare_user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='rareapi.rareuser'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created_on'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['rare_user', 'publication_date'], name='post_user_publication_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['approved', 'publication_date'], name='post_approved_publication_idx'),
+        ),
+    ]
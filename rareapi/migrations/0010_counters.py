@@ -0,0 +1,44 @@
+# Generated by Django 3.2.9 on 2021-11-24 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rareapi', '0009_post_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        # Count the rows that already exist; from here on rareapi.counters
+        # keeps the columns current
+        migrations.RunSQL(
+            """
+            UPDATE rareapi_post SET comment_count = (
+                SELECT COUNT(*) FROM rareapi_comment
+                WHERE rareapi_comment.post_id = rareapi_post.id);
+            UPDATE rareapi_category SET post_count = (
+                SELECT COUNT(*) FROM rareapi_post
+                WHERE rareapi_post.category_id = rareapi_category.id);
+            UPDATE rareapi_tag SET post_count = (
+                SELECT COUNT(*) FROM rareapi_posttag
+                WHERE rareapi_posttag.tag_id_id = rareapi_tag.id);
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.9 on 2021-11-30 10:41
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+EXCERPT_LENGTH = 80
+
+
+def make_excerpt(content):
+    # Copied from rareapi.models.post as it was when this migration was
+    # written, so later changes there do not change what it does
+    content = ' '.join(content.split())
+    if len(content) <= EXCERPT_LENGTH:
+        return content
+    cut = content[:EXCERPT_LENGTH + 1]
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut[:EXCERPT_LENGTH].rstrip(' ,;:.-') + '…'
+
+
+def fill_excerpts(apps, schema_editor):
+    # Historical models have neither the custom save() nor bulk_create()
+    Post = apps.get_model('rareapi', 'Post')
+    posts = Post.objects.using(schema_editor.connection.alias)
+    last_id = 0
+    while True:
+        batch = list(posts.only('id', 'content').filter(id__gt=last_id).order_by('id')[:BATCH_SIZE])
+        if not batch:
+            break
+        for post in batch:
+            post.excerpt = make_excerpt(post.content)
+        posts.bulk_update(batch, ['excerpt'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rareapi', '0012_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(blank=True, default='', editable=False, max_length=81),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
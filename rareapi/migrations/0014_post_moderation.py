@@ -0,0 +1,22 @@
+# Generated by Django 3.2.9 on 2021-12-01 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rareapi', '0013_post_excerpt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='rejected',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('approved', False), ('rejected', False)), fields=['id'], name='post_moderation_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.9 on 2021-12-02 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rareapi', '0014_post_moderation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='rareuser',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['id'], name='category_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rareuser',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['id'], name='rareuser_deleted_idx'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 3.2.9 on 2021-12-03 15:47
+
+import datetime
+import math
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+import django.db.models.deletion
+
+# Copied from rareapi.trending as they were when this migration was
+# written, so later changes there do not change what it does
+HALF_LIFE = datetime.timedelta(hours=24)
+COMMENT_WEIGHT = 1.0
+POST_WEIGHT = 1.0
+MIN_SCORE = 0.01
+WINDOW = HALF_LIFE * math.log2(COMMENT_WEIGHT / MIN_SCORE)
+
+
+def growth(at, epoch):
+    return 2 ** ((at - epoch) / HALF_LIFE)
+
+
+def score_recent_activity(apps, schema_editor):
+    # Score the posts and comments of the last WINDOW as though each had
+    # been recorded when it happened; only their dates are stored, so
+    # they count from midnight
+    db = schema_editor.connection.alias
+    Post = apps.get_model('rareapi', 'Post')
+    Comment = apps.get_model('rareapi', 'Comment')
+    PostScore = apps.get_model('rareapi', 'PostScore')
+    TrendingEpoch = apps.get_model('rareapi', 'TrendingEpoch')
+
+    now = timezone.now()
+    since = (now - WINDOW).date()
+
+    def midnight(day):
+        return datetime.datetime.combine(day, datetime.time(), tzinfo=datetime.timezone.utc)
+
+    scores = defaultdict(float)
+    posts = (Post.objects.using(db).filter(publication_date__gte=since)
+             .values_list('id', 'publication_date'))
+    for pk, day in posts.iterator():
+        scores[pk] += POST_WEIGHT * growth(midnight(day), now)
+    comments = (Comment.objects.using(db).filter(created_on__gte=since)
+                .order_by().values('post_id', 'created_on').annotate(n=Count('id'))
+                .values_list('post_id', 'created_on', 'n'))
+    for pk, day, count in comments.iterator():
+        scores[pk] += COMMENT_WEIGHT * count * growth(midnight(day), now)
+
+    TrendingEpoch.objects.using(db).create(pk=1, started_at=now)
+    PostScore.objects.using(db).bulk_create(
+        [PostScore(post_id=pk, score=score) for pk, score in scores.items() if score >= MIN_SCORE],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rareapi', '0015_soft_delete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='rareapi.post')),
+                ('score', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingEpoch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='postscore',
+            index=models.Index(fields=['score', 'post'], name='post_score_trending_idx'),
+        ),
+        migrations.RunPython(score_recent_activity, migrations.RunPython.noop),
+    ]
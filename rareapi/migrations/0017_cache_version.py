@@ -0,0 +1,20 @@
+# Generated by Django 3.2.9 on 2021-12-04 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rareapi', '0016_trending_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('namespace', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('token', models.CharField(max_length=32)),
+            ],
+        ),
+    ]
@@ -3,3 +3,8 @@ from .post import Post
 from .category import Category
 from .tag import Tag
 from .post_tag import PostTag
+from .post_search import PostSearch
+from .job import Job
+from .post_score import PostScore
+from .trending_epoch import TrendingEpoch
+from .cache_version import CacheVersion
@@ -0,0 +1,11 @@
+from django.db import models
+
+
+class CacheVersion(models.Model):
+    """The current version of a `VersionedCache`, shared by every process
+
+    Bumping writes a new random token, so a bump that is rolled back never
+    comes back as the version of some later write.
+    """
+    namespace = models.CharField(max_length=50, primary_key=True)
+    token = models.CharField(max_length=32)
@@ -1,7 +1,20 @@
 from django.db import models
+from django.db.models import Q
 from django.db.models.deletion import CASCADE
 
 class Category(models.Model):
 
     label = models.CharField(max_length=50)
-    
\ No newline at end of file
+    # Kept up to date by rareapi.counters
+    post_count = models.PositiveIntegerField(default=0)
+    # Set when the category is deleted; it is hidden from then on, while
+    # rareapi.deletion removes its posts in batches
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Deleted categories, whose posts are left out of post lists.
+            # Partial, so it only holds the few being removed
+            models.Index(fields=['id'], condition=Q(deleted_at__isnull=False),
+                         name='category_deleted_idx'),
+        ]
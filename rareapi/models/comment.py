@@ -4,8 +4,15 @@ from django.db.models.deletion import CASCADE
 
 class Comment(models.Model):
 
+    # Indexed by the (post, created_on) index below
     post = models.ForeignKey("Post", on_delete=CASCADE,
-                             related_name='comments')
+                             related_name='comments', db_index=False)
     author = models.ForeignKey("RareUser", on_delete=CASCADE)
     content = models.CharField(max_length=500)
     created_on = models.DateField()
+
+    class Meta:
+        indexes = [
+            # A post's comments in the order they are shown
+            models.Index(fields=['post', 'created_on'], name='comment_post_created_idx'),
+        ]
@@ -0,0 +1,43 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """A side effect waiting to be run by the `run_jobs` worker
+
+    Jobs are enqueued with `rareapi.jobs.enqueue` and the row is deleted once
+    the job succeeds, so the table only holds pending, running and failed
+    jobs.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    # Jobs with the same key coalesce while pending, see the constraint below
+    key = models.CharField(max_length=200, null=True, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=32, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # At most one pending job per key: enqueueing a duplicate is a
+            # no-op until the worker picks the pending one up
+            models.UniqueConstraint(fields=['key'], condition=Q(status='pending'),
+                                    name='job_unique_pending_key'),
+        ]
+        indexes = [
+            # The worker claims the oldest due pending jobs
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
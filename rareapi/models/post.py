@@ -1,14 +1,136 @@
 from django.db import models
+from django.db.models import Q
 from django.db.models.deletion import CASCADE
+from django.utils import timezone
+
+# Longest excerpt shown in post lists, not counting the ellipsis
+EXCERPT_LENGTH = 80
+
+
+def make_excerpt(content):
+    """Shorten post content to a preview of at most EXCERPT_LENGTH characters
+
+    Long content is cut at the last word that fits and gets an ellipsis.
+    """
+    content = ' '.join(content.split())
+    if len(content) <= EXCERPT_LENGTH:
+        return content
+    cut = content[:EXCERPT_LENGTH + 1]
+    # Drop the word the limit falls in, unless it is the only one
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut[:EXCERPT_LENGTH].rstrip(' ,;:.-') + '…'
+
+
+class PostQuerySet(models.QuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create never calls save(), so fill in the excerpts here
+        objs = list(objs)
+        for post in objs:
+            post.excerpt = make_excerpt(post.content)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def update(self, **kwargs):
+        # update() never calls save() either, so recompute the excerpt
+        # whenever the content is set to a plain value
+        if 'content' in kwargs and 'excerpt' not in kwargs:
+            if not isinstance(kwargs['content'], str):
+                raise ValueError('Post content can only be updated to a string, '
+                                 'which the excerpt is made from')
+            kwargs['excerpt'] = make_excerpt(kwargs['content'])
+        return super().update(**kwargs)
+
+    def alive(self):
+        """Posts not deleted, nor in a deleted category, nor by a deleted user
+
+        The deleted categories and users come from small partial indexes,
+        so this costs next to nothing while none are being removed.
+        """
+        from rareapi.models import Category, RareUser
+        return (self.filter(deleted_at__isnull=True)
+                .exclude(category__in=Category.objects.filter(deleted_at__isnull=False))
+                .exclude(rare_user__in=RareUser.objects.filter(deleted_at__isnull=False)))
+
+    def visible_to(self, rare_user):
+        """Approved posts, and the posts `rare_user` wrote whatever their state"""
+        return self.filter(Q(approved=True) | Q(rare_user=rare_user))
+
+    def awaiting_moderation(self):
+        """Posts neither approved nor rejected, read from a partial index"""
+        return self.filter(approved=False, rejected=False)
+
+    def approve(self):
+        """Approve every post in the queryset with one UPDATE
+
+        Returns:
+            int -- The number of posts approved
+        """
+        # update() skips auto_now, and the post detail's ETag needs it
+        return self.exclude(approved=True).update(
+            approved=True, rejected=False, updated_at=timezone.now())
+
+    def reject(self):
+        """Reject every post in the queryset with one UPDATE
+
+        Rejected posts leave the moderation queue and are only shown to
+        their authors, like posts still waiting for approval.
+
+        Returns:
+            int -- The number of posts rejected
+        """
+        return self.exclude(rejected=True).update(
+            approved=False, rejected=True, updated_at=timezone.now())
+
 
 class Post(models.Model):
 
-    rare_user = models.ForeignKey("RareUser", on_delete=CASCADE)
+    # Indexed by the (rare_user, publication_date) index below
+    rare_user = models.ForeignKey("RareUser", on_delete=CASCADE, db_index=False)
     category = models.ForeignKey("Category", on_delete=CASCADE)
     title = models.CharField(max_length=50)
     publication_date = models.DateField()
     image_url = models.CharField(max_length=100)
     content = models.CharField(max_length=100)
+    # The start of `content`, rendered by post lists so they can leave the
+    # full content unloaded; kept in step by save() and bulk_create()
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH + 1, blank=True, default='', editable=False)
+    # Posts by staff are approved as they are written; the rest wait in the
+    # moderation queue until a moderator approves or rejects them
     approved = models.BooleanField()
+    rejected = models.BooleanField(default=False)
     post_tag = models.ManyToManyField("Tag", through="PostTag", related_name="tag")
-    
+    # Kept up to date by rareapi.counters
+    comment_count = models.PositiveIntegerField(default=0)
+    # Changes whenever the post or its comments do; the post detail route
+    # builds its ETag and Last-Modified headers from it
+    updated_at = models.DateTimeField(auto_now=True)
+    # Set when the post is deleted; it is hidden from then on, while
+    # rareapi.deletion removes its comments and tags in batches
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination seeks on (publication_date, id)
+            models.Index(fields=['publication_date', 'id'],
+                         name='post_publication_date_id_idx'),
+            # A user's own posts, newest first
+            models.Index(fields=['rare_user', 'publication_date'],
+                         name='post_user_publication_idx'),
+            # Approved (or waiting) posts, newest first
+            models.Index(fields=['approved', 'publication_date'],
+                         name='post_approved_publication_idx'),
+            # The moderation queue, oldest first. Partial, so it only holds
+            # the few posts waiting and costs nothing to keep up otherwise
+            models.Index(fields=['id'], condition=Q(approved=False, rejected=False),
+                         name='post_moderation_queue_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.excerpt = make_excerpt(self.content)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'excerpt'}
+        super().save(*args, **kwargs)
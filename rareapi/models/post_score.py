@@ -0,0 +1,18 @@
+from django.db import models
+from django.db.models.deletion import CASCADE
+
+
+class PostScore(models.Model):
+    """A post's trending score, kept up to date by rareapi.trending
+
+    Only posts with recent activity have a row; the rest have decayed away.
+    """
+    post = models.OneToOneField("Post", on_delete=CASCADE, primary_key=True,
+                                related_name='trending')
+    score = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            # ?sort=trending reads the top posts straight off this index
+            models.Index(fields=['score', 'post'], name='post_score_trending_idx'),
+        ]
@@ -0,0 +1,35 @@
+from django.db import models
+from django.db.models import Lookup
+from django.db.models.deletion import DO_NOTHING
+
+
+class SearchDocumentField(models.TextField):
+    """The hidden column of an FTS5 table named after the table itself"""
+
+
+@SearchDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class PostSearch(models.Model):
+    """Read-only view of the FTS5 index over post titles and content
+
+    The table and the triggers that fill it are created by
+    `rareapi.search.install_search_index`, not by Django.
+    """
+    post = models.OneToOneField("Post", on_delete=DO_NOTHING, primary_key=True,
+                                db_column='rowid', related_name='search')
+    document = SearchDocumentField(db_column='rareapi_post_fts')
+    title = models.TextField()
+    content = models.TextField()
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'rareapi_post_fts'
@@ -2,5 +2,18 @@ from django.db import models
 from django.db.models.deletion import CASCADE
 
 class PostTag(models.Model):
-    tag_id = models.ForeignKey('Tag', on_delete=CASCADE)
-    post_id = models.ForeignKey('Post', on_delete=CASCADE)
+    # The composite indexes below lead with each of these columns, so the
+    # single-column foreign key indexes would only be dead weight
+    tag_id = models.ForeignKey('Tag', on_delete=CASCADE, db_index=False)
+    post_id = models.ForeignKey('Post', on_delete=CASCADE, db_index=False)
+
+    class Meta:
+        constraints = [
+            # Also serves as the (post, tag) index for a post's tags
+            models.UniqueConstraint(fields=['post_id', 'tag_id'],
+                                    name='post_tag_unique_post_tag'),
+        ]
+        indexes = [
+            # Posts carrying a tag, for ?tags= filtering
+            models.Index(fields=['tag_id', 'post_id'], name='post_tag_tag_post_idx'),
+        ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models import Q
 from django.db.models.deletion import CASCADE
 
 class RareUser(models.Model):
@@ -8,4 +9,15 @@ class RareUser(models.Model):
     bio = models.CharField(max_length=50)
     profile_image_url = models.CharField(max_length=100)
     created_on = models.DateField()
-    active = models.BooleanField()
\ No newline at end of file
+    active = models.BooleanField()
+    # Set when the user is deleted; their posts are hidden from then on,
+    # while rareapi.deletion removes them and the user in batches
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Deleted users, whose posts are left out of post lists.
+            # Partial, so it only holds the few being removed
+            models.Index(fields=['id'], condition=Q(deleted_at__isnull=False),
+                         name='rareuser_deleted_idx'),
+        ]
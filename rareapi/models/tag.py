@@ -2,4 +2,6 @@ from django.db import models
 from django.db.models.deletion import CASCADE
 
 class Tag(models.Model):
-    label = models.CharField(max_length=50)
\ No newline at end of file
+    label = models.CharField(max_length=50)
+    # Kept up to date by rareapi.counters
+    post_count = models.PositiveIntegerField(default=0)
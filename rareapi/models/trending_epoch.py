@@ -0,0 +1,6 @@
+from django.db import models
+
+
+class TrendingEpoch(models.Model):
+    """The single row holding the time trending scores are measured from"""
+    started_at = models.DateTimeField()
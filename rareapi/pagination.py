@@ -0,0 +1,169 @@
+"""Keyset (cursor) pagination for the list endpoints"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Paginate a queryset by seeking past the last row of the previous page
+
+    Unlike OFFSET pagination the database never has to walk over the rows
+    before the current page, so every page costs the same no matter how
+    deep the client has scrolled. The `ordering` fields must be unique
+    when taken together, which is why they always end in `id`.
+
+    The cursor handed to clients is an opaque base64 string holding the
+    ordering values of the row to seek past and the direction to read in.
+    """
+    ordering = ('id',)
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return the rows for the page the request's cursor points at"""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        position, reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(self._flip(field) for field in ordering)
+        queryset = queryset.order_by(*ordering)
+
+        if position is not None:
+            try:
+                queryset = queryset.filter(self._seek(ordering, position))
+            except (TypeError, ValueError, ValidationError):
+                # A value the ordering field cannot hold, e.g. a date of "x"
+                raise NotFound(self.invalid_cursor_message)
+
+        # Fetch one extra row to find out if there is anything after this page
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_page_size(self, request):
+        """Use the `page_size` query parameter when it is a sane number"""
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, row, reverse):
+        """Build the URL of the page that starts right after (or before) `row`"""
+        position = [getattr(row, field.lstrip('-')) for field in self.ordering]
+        payload = json.dumps({'p': position, 'r': int(reverse)},
+                             cls=DjangoJSONEncoder, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        """Return the `(position, reverse)` pair stored in the cursor"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            position = payload['p']
+            reverse = bool(payload['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # Cursors only ever hold dates and ids as strings and numbers
+        if not all(isinstance(value, (str, int, float)) for value in position):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def _seek(ordering, position):
+        """Build `(a, b) > (x, y)` as `a > x OR (a = x AND b > y)`
+
+        The comparison for each field follows its direction in `ordering`.
+        """
+        condition = Q()
+        equal_so_far = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal_so_far & Q(**{f'{name}__{lookup}': value})
+            equal_so_far &= Q(**{name: value})
+        return condition
+
+
+class PostPagination(KeysetPagination):
+    """Newest posts first, ties on the same day broken by id"""
+    ordering = ('-publication_date', '-id')
+
+
+class SearchPagination(KeysetPagination):
+    """Best search matches first, by the `search_rank` annotation
+
+    Search cursors are not stable. The rank is bm25, which weighs every
+    match against the whole index, so writing, editing or deleting any
+    post moves the ranks of the others. A cursor seeks past the rank its
+    page ended on, so after such a write the next page can skip matches
+    or repeat ones already shown. Clients that need every match exactly
+    once should page through the plain post list instead.
+    """
+    ordering = ('search_rank', 'id')
+
+
+class TrendingPagination(KeysetPagination):
+    """Trending posts first, by the `trending_score` annotation
+
+    Scores move as comments come in, so a post can shift between pages
+    while a client pages through them.
+    """
+    ordering = ('-trending_score', '-trending_id')
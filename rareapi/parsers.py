@@ -0,0 +1,34 @@
+"""Request body parsers matching the renderers in `rareapi.renderers`
+
+Create endpoints accept JSON, decoded with orjson when it is installed,
+and MessagePack bodies sent with `Content-Type: application/msgpack`.
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+from rareapi.renderers import MessagePackRenderer, msgpack, orjson
+
+
+class FastJSONParser(JSONParser):
+    """DRF's JSONParser with orjson doing the decoding"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            # orjson only reads UTF-8, which is what JSON bodies are
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MessagePackParser(BaseParser):
+    """Parse MessagePack request bodies"""
+    media_type = MessagePackRenderer.media_type
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (TypeError, ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
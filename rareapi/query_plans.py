@@ -0,0 +1,100 @@
+"""Query plans declared by serializers
+
+Each serializer that renders related objects lists the relations it walks
+on its `Meta` class, so the view can load them up front instead of letting
+the serializer fire one query per row:
+
+    class Meta:
+        select_related = ('rare_user__user', 'category')
+        prefetch_related = {'comments': CommentSerializer}
+
+`select_related` holds forward foreign key / one-to-one lookups that are
+joined into the main query. `prefetch_related` maps a reverse or
+many-to-many relation to the serializer used for its rows, and that
+serializer's own plan is applied to the prefetch query. An optional
+`ordering` sorts the rows of a prefetch, e.g. comments by `created_on`,
+and `defer` names columns the serializer never renders, such as the full
+content of posts in a list, which are then left unloaded.
+
+Given a sparse `Fieldset` (see `rareapi.fieldsets`), the plan shrinks to
+match: only the model columns of requested fields are selected, plus any
+named in `Meta.always_load`, and relations are only joined or prefetched
+when they are requested and expanded.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+
+
+def apply_query_plan(queryset, serializer_class, prefetch=True, fieldset=None):
+    """Apply the eager loading declared by a serializer to a queryset
+
+    Arguments:
+        queryset -- The queryset the view is about to serialize
+        serializer_class -- Serializer whose `Meta` declares the plan
+        prefetch -- Pass False to leave out the prefetches, for callers
+            that run them themselves with `query_plan_prefetches`
+        fieldset -- Optional `Fieldset` the serializer will render
+
+    Returns:
+        QuerySet -- The queryset with select/prefetch related applied
+    """
+    meta = getattr(serializer_class, 'Meta', None)
+    select_related = getattr(meta, 'select_related', ())
+    ordering = getattr(meta, 'ordering', ())
+
+    if fieldset is not None:
+        select_related = [lookup for lookup in select_related
+                          if fieldset.expands(lookup.split('__')[0])]
+        queryset = queryset.only(*_columns(queryset.model, meta, fieldset))
+    elif getattr(meta, 'defer', ()):
+        queryset = queryset.defer(*meta.defer)
+
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+
+    if ordering:
+        queryset = queryset.order_by(*ordering)
+
+    if prefetch:
+        queryset = queryset.prefetch_related(
+            *query_plan_prefetches(queryset.model, serializer_class, fieldset))
+
+    return queryset
+
+
+def _columns(model, meta, fieldset):
+    """Names of the model's own columns a fieldset needs"""
+    columns = []
+    for name in fieldset.fields:
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if field.concrete:
+            columns.append(name)
+    return [*columns, *getattr(meta, 'always_load', ())]
+
+
+def query_plan_prefetches(model, serializer_class, fieldset=None):
+    """Build the `Prefetch` objects declared by a serializer
+
+    They can be passed to `prefetch_related_objects` to load relations for
+    instances that were fetched some other way, such as in chunks from
+    `QuerySet.iterator()`, which ignores `prefetch_related`.
+
+    Returns:
+        list -- One `Prefetch` per entry in `Meta.prefetch_related`, less
+        those a `fieldset` leaves out
+    """
+    meta = getattr(serializer_class, 'Meta', None)
+    prefetch_related = getattr(meta, 'prefetch_related', {})
+
+    prefetches = []
+    for lookup, child_serializer in prefetch_related.items():
+        if fieldset is not None and not fieldset.includes(lookup):
+            continue
+        related_model = model._meta.get_field(lookup).related_model
+        child_queryset = apply_query_plan(
+            related_model.objects.all(), child_serializer)
+        prefetches.append(Prefetch(lookup, queryset=child_queryset))
+    return prefetches
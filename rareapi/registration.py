@@ -0,0 +1,142 @@
+"""Bulk user import
+
+Importing a community means creating a User, a RareUser and a Token for
+every member. Two things make that slow when done one member at a time:
+
+* Password hashing is deliberately expensive (PBKDF2 with hundreds of
+  thousands of iterations), so `hash_passwords` spreads it over a process
+  pool, one hash per CPU at a time.
+* Three autocommit writes per member is three fsyncs on SQLite, so the
+  rows are inserted with `bulk_create` inside one transaction, after all
+  the hashing is done so the write lock is held only for the inserts.
+
+The /users/import endpoint takes at most `MAX_IMPORT_ROWS` users and
+hashes them in the request's own process; bigger imports go through the
+`import_users` command, which uses the pool.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from rareapi import counters
+from rareapi.bulk import RowError, build_objects, bulk_insert
+from rareapi.models import RareUser
+
+# Below this many passwords starting worker processes costs more than it saves
+MIN_POOL_PASSWORDS = 16
+# Most users /users/import takes, about a second of hashing per ten users
+MAX_IMPORT_ROWS = 25
+# Columns that must hold strings when present; username and password are required
+TEXT_FIELDS = ('username', 'password', 'email', 'first_name', 'last_name',
+               'bio', 'profile_image_url')
+
+
+def _setup_worker():
+    """Make Django usable in a pool worker started with "spawn" (macOS, Windows)"""
+    django.setup()
+
+
+def hash_passwords(passwords, processes=None):
+    """Hash raw passwords with the default hasher, in parallel
+
+    Arguments:
+        passwords -- The raw passwords
+        processes -- Worker processes, defaults to one per CPU; 1 hashes
+        in this process
+
+    Returns:
+        list -- The hashes, in the order given
+    """
+    passwords = list(passwords)
+    if processes == 1 or len(passwords) < MIN_POOL_PASSWORDS:
+        return [make_password(password) for password in passwords]
+
+    processes = processes or os.cpu_count() or 1
+    # Big chunks keep the pickling overhead small next to the hashing
+    chunksize = max(1, len(passwords) // (processes * 4))
+    with ProcessPoolExecutor(max_workers=processes, initializer=_setup_worker) as pool:
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def import_users(rows, processes=None):
+    """Create a User, RareUser and Token for every row
+
+    Every row is validated before anything is hashed or written, and either
+    all of the rows are imported or none are.
+
+    Arguments:
+        rows -- Dicts with username and password, and optionally email,
+        first_name, last_name, bio and profile_image_url
+        processes -- Passed on to `hash_passwords`
+
+    Returns:
+        tuple -- The created tokens, each with `.user.rareuser` set, and
+        None; or an empty list and a list of per-row error dicts
+    """
+    users, errors = build_objects(rows, _build_user)
+    errors = errors or [{} for _ in rows]
+    _check_usernames(rows, errors)
+    if any(errors):
+        return [], errors
+
+    for user, password in zip(users, hash_passwords(
+            [row['password'] for row in rows], processes)):
+        user.password = password
+
+    with transaction.atomic():
+        bulk_insert(User, users)
+        rare_users = bulk_insert(RareUser, [
+            RareUser(user=user, bio=row.get('bio', ''),
+                     profile_image_url=row.get('profile_image_url', ''),
+                     created_on=user.date_joined.date(), active=True)
+            for user, row in zip(users, rows)
+        ])
+        # bulk_create skips Token.save(), which is what makes the key
+        tokens = Token.objects.bulk_create([
+            Token(key=Token.generate_key(), user=user) for user in users])
+
+    for user, rare_user in zip(users, rare_users):
+        user.rareuser = rare_user
+    return tokens, None
+
+
+def _build_user(row):
+    # Model fields would turn a number into a string, and make_password
+    # raises on anything but a string, so check the types first
+    wrong = {field: ['Not a valid string.'] for field in TEXT_FIELDS
+             if field in row and not isinstance(row[field], str)}
+    if wrong:
+        raise RowError(wrong)
+    # bulk.build_objects does not check empty strings, so do it here
+    for field in ('username', 'password'):
+        if not row[field]:
+            raise RowError({field: ['This field may not be blank.']})
+    # The password is hashed once every row is known to be valid
+    return User(username=row['username'], email=row.get('email', ''),
+                first_name=row.get('first_name', ''), last_name=row.get('last_name', ''))
+
+
+def _check_usernames(rows, errors):
+    """Flag usernames that repeat in the import or are already taken"""
+    # Rows without a string username were flagged by _build_user already
+    usernames = [row.get('username') if isinstance(row, dict) else None for row in rows]
+    usernames = [name if isinstance(name, str) and name else None for name in usernames]
+    # In chunks, as SQLite limits the parameters of one statement
+    names = list({name for name in usernames if name})
+    taken = set()
+    for start in range(0, len(names), counters.CHUNK_SIZE):
+        taken.update(User.objects.filter(username__in=names[start:start + counters.CHUNK_SIZE])
+                     .values_list('username', flat=True))
+    seen = set()
+    for index, username in enumerate(usernames):
+        if username is None:
+            continue
+        if username in taken or username in seen:
+            errors[index].setdefault('username', []).append(
+                'A user with that username already exists.')
+        seen.add(username)
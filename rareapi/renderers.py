@@ -0,0 +1,82 @@
+"""Response renderers
+
+`FastJSONRenderer` renders JSON with orjson, which is several times
+faster than the standard library encoder on large lists of posts. The
+output is DRF's `JSONRenderer`'s, U+2028 and U+2029 escaped included,
+with one exception: a NaN or infinite float, which DRF refuses to render
+under STRICT_JSON, comes out as `null`. Without orjson installed, or with
+UNICODE_JSON off, it falls back to `JSONRenderer`.
+
+`MessagePackRenderer` renders MessagePack, a binary encoding of the same
+data that is smaller than JSON and quicker for mobile clients to decode.
+Clients ask for it with `Accept: application/msgpack`. It needs the
+msgpack package, and rare/settings.py only enables it when that is
+installed.
+
+Both are timed by `rareapi.instrumentation`.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+from rareapi.instrumentation import TimedRendererMixin
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional format
+    msgpack = None
+
+# Whatever orjson or msgpack cannot encode natively (Decimal, lazy
+# translations, querysets) is handed to DRF's encoder, the one
+# JSONRenderer uses, so the output is the same
+_drf_encoder = encoders.JSONEncoder()
+
+
+class OrjsonRenderer(JSONRenderer):
+    """DRF's JSONRenderer with orjson doing the encoding"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or self.ensure_ascii
+                or self.get_indent(accepted_media_type, renderer_context or {})):
+            # orjson only writes UTF-8, and indented output is for people
+            # reading it; leave both to DRF
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        ret = orjson.dumps(
+            data, default=_drf_encoder.default,
+            # Datetimes go through DRF's encoder too, which trims them to
+            # milliseconds and writes UTC as "Z"
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        # Escaped as DRF does, for JavaScript engines that end a string
+        # literal at these line terminators
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace(
+            '\u2029'.encode(), b'\\u2029')
+
+
+class FastJSONRenderer(TimedRendererMixin, OrjsonRenderer):
+    """The default JSON renderer, timed"""
+
+
+class MessagePackRenderer(TimedRendererMixin, BaseRenderer):
+    """Render responses as MessagePack"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_msgpack_default, use_bin_type=True)
+
+
+def _msgpack_default(obj):
+    # DRF's encoder returns a tuple for querysets and generators, which
+    # msgpack only accepts as a list
+    value = _drf_encoder.default(obj)
+    return list(value) if isinstance(value, tuple) else value
@@ -0,0 +1,104 @@
+"""Full-text search over posts with SQLite FTS5
+
+`rareapi_post_fts` is an external-content FTS5 table over the title and
+content of `rareapi_post`: it stores only the index and reads the text
+back from the post table. Triggers on `rareapi_post` keep it in step with
+every insert, update and delete, including `bulk_create` and
+`QuerySet.update()` which never send model signals.
+
+Django's SQLite backend rebuilds a table to alter it, which drops that
+table's triggers, so `install_search_index` is run again after every
+`migrate` (see `rareapi.signals`). Everything in it is idempotent.
+"""
+import re
+
+from django.db import connection as default_connection
+from django.db.models import F
+
+FTS_TABLE = 'rareapi_post_fts'
+
+INSTALL_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, content, content='rareapi_post', content_rowid='id'
+    )""",
+    # Rank title matches well above content matches
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES('rank', 'bm25(10.0, 1.0)')",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON rareapi_post BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON rareapi_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF title, content ON rareapi_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO {FTS_TABLE}(rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END""",
+]
+
+UNINSTALL_STATEMENTS = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+TERM = re.compile(r'\w+')
+
+
+def install_search_index(connection=default_connection):
+    """Create the FTS5 table and its triggers if they are missing"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in INSTALL_STATEMENTS:
+            cursor.execute(statement)
+
+
+def uninstall_search_index(connection=default_connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in UNINSTALL_STATEMENTS:
+            cursor.execute(statement)
+
+
+def rebuild_search_index(connection=default_connection):
+    """Rebuild the whole index from the post table and merge its segments"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('optimize')")
+
+
+def match_expression(text):
+    """Turn free text from a client into a safe FTS5 query
+
+    Each word becomes a quoted string, so FTS5 operators and stray quotes
+    in the input cannot cause syntax errors; the words are ANDed together
+    and the last one matches as a prefix to support search-as-you-type.
+
+    Returns:
+        str -- The MATCH expression, or None if the text has no words
+    """
+    terms = TERM.findall(text)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search_posts(posts, text):
+    """Narrow a post queryset to matches for `text`, annotated with their rank
+
+    The rank is FTS5's bm25 score, where lower is a better match.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return posts.none()
+    return (posts.filter(search__document__match=expression)
+            .annotate(search_rank=F('search__rank')))
@@ -0,0 +1,157 @@
+"""Model signal handlers for the rareapi app"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from rareapi import counters, trending
+from rareapi.authentication import CachedTokenAuthentication
+from rareapi.caching import category_cache, invalidate, tag_cache
+from rareapi.instrumentation import install_query_timer
+from rareapi.models import Category, Post, PostTag, RareUser, Tag
+from rareapi.models.comment import Comment
+from rareapi.search import install_search_index
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_categories(sender, **kwargs):
+    invalidate(category_cache)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    invalidate(tag_cache)
+
+
+# The columns of categories and users that the post detail renders
+CATEGORY_DETAIL_FIELDS = {'label'}
+USER_DETAIL_FIELDS = {'first_name', 'last_name', 'username'}
+
+
+def renders_changed(update_fields, rendered):
+    """Whether a save may have changed one of the `rendered` columns"""
+    return update_fields is None or not rendered.isdisjoint(update_fields)
+
+
+@receiver(post_save, sender=Category)
+def touch_category_posts(sender, instance, created, raw, update_fields, **kwargs):
+    # The post detail renders the category label, so its ETag must change
+    if created or raw or not renders_changed(update_fields, CATEGORY_DETAIL_FIELDS):
+        return
+    Post.objects.filter(category=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=User)
+def touch_user_posts(sender, instance, created, raw, update_fields, **kwargs):
+    # Names are rendered on the user's posts and on every post they
+    # commented on. Logging in only saves last_login, so it touches nothing
+    if created or raw or not renders_changed(update_fields, USER_DETAIL_FIELDS):
+        return
+    commented = Comment.objects.filter(author__user=instance).values('post_id')
+    Post.objects.filter(Q(rare_user__user=instance) | Q(pk__in=commented)).update(
+        updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    CachedTokenAuthentication.forget_token(instance.key)
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_user_tokens(sender, instance, **kwargs):
+    CachedTokenAuthentication.forget_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=RareUser)
+def forget_rare_user_tokens(sender, instance, **kwargs):
+    CachedTokenAuthentication.forget_user(instance.user_id)
+
+
+@receiver(post_migrate)
+def reinstall_search_index(sender, using, **kwargs):
+    # Altering rareapi_post on SQLite rebuilds the table and drops the
+    # triggers that keep the search index current, so put them back
+    if sender.name != 'rareapi':
+        return
+    connection = connections[using]
+    if 'rareapi_post' in connection.introspection.table_names():
+        install_search_index(connection)
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    # Counts queries towards the request PerformanceMiddleware is measuring
+    install_query_timer(connection)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created:
+        # Also sets the post's updated_at
+        counters.adjust(counters.POST_COMMENTS, [instance.post_id])
+        trending.record_later([instance.post_id], trending.COMMENT_WEIGHT)
+    else:
+        # An edited comment changes the post detail too
+        Post.objects.filter(pk=instance.post_id).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.adjust(counters.POST_COMMENTS, [instance.post_id], sign=-1)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_category(sender, instance, raw, **kwargs):
+    # An edit may move the post to another category, which post_save can
+    # only tell from the category the row had before
+    instance._counted_category_id = None
+    if not raw and not instance._state.adding and instance.pk is not None:
+        instance._counted_category_id = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('category_id', flat=True).first())
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.adjust(counters.CATEGORY_POSTS, [instance.category_id])
+        trending.record_later([instance.pk], trending.POST_WEIGHT)
+        return
+    previous = getattr(instance, '_counted_category_id', None)
+    if previous is not None and previous != instance.category_id:
+        counters.adjust(counters.CATEGORY_POSTS, [previous], sign=-1)
+        counters.adjust(counters.CATEGORY_POSTS, [instance.category_id])
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.adjust(counters.CATEGORY_POSTS, [instance.category_id], sign=-1)
+
+
+@receiver(post_save, sender=PostTag)
+def count_new_post_tag(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        counters.adjust(counters.TAG_POSTS, [instance.tag_id_id])
+
+
+@receiver(post_delete, sender=PostTag)
+def count_deleted_post_tag(sender, instance, **kwargs):
+    counters.adjust(counters.TAG_POSTS, [instance.tag_id_id], sign=-1)
@@ -0,0 +1,75 @@
+"""Tasks run by the `run_jobs` worker, see `rareapi.jobs`
+
+Imported when the app is ready so every task is registered before a job
+is enqueued or run.
+"""
+import logging
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from rareapi import counters
+from rareapi.counters import CHUNK_SIZE
+from rareapi.deletion import hide, purge_batch
+from rareapi.jobs import enqueue, task
+from rareapi.models import Post
+from rareapi.trending import RECORD, RESCALE, record, rescale
+
+logger = logging.getLogger('rareapi.deletion')
+
+PURGE = 'deletion.purge'
+
+
+@task(counters.RECONCILE)
+def reconcile_counter_rows(counter, ids):
+    """Recount the rows a bulk write counted itself, see `rareapi.counters`"""
+    counters.reconcile_rows(counters.by_name(counter), ids)
+
+
+@task(RECORD)
+def record_trending_activity(post_ids, weight, at):
+    """Score the posts and comments written in one request, see `rareapi.trending`"""
+    # Posts deleted since have no score to add to
+    existing = set()
+    for start in range(0, len(post_ids), CHUNK_SIZE):
+        existing.update(Post.objects.filter(pk__in=post_ids[start:start + CHUNK_SIZE])
+                        .values_list('pk', flat=True))
+    record([pk for pk in post_ids if pk in existing], weight, parse_datetime(at))
+
+
+@task(RESCALE)
+def rescale_trending_scores():
+    """Move the trending scores to a new epoch, see `rareapi.trending`
+
+    Enqueued with a key once the epoch is old, so it runs once per
+    RESCALE_INTERVAL at most.
+    """
+    rescale()
+
+
+def delete_later(instance):
+    """Hide a category, post or user now and delete it in the background"""
+    hide(instance)
+    label = instance._meta.label
+    enqueue(PURGE, {'model': label, 'pk': instance.pk}, key=f'{PURGE}:{label}:{instance.pk}')
+
+
+@task(PURGE)
+def purge(model, pk, deleted=None, batches=0):
+    """Delete one batch of the rows cascading from a hidden row, then queue the next
+
+    Every batch is a job of its own, committed on its own, so other
+    writers get the database in between. The payload carries the rows
+    deleted so far, which /stats/deletions reports.
+    """
+    done, removed = purge_batch(apps.get_model(model), pk, settings.PURGE_BATCH_SIZE)
+    deleted = Counter(deleted) + removed
+    batches += 1
+    if done:
+        logger.info('Deleted %s %s in %s batches: %s', model, pk, batches, dict(deleted))
+        return
+    logger.info('Deleting %s %s, batch %s: %s', model, pk, batches, dict(removed))
+    enqueue(PURGE, {'model': model, 'pk': pk, 'deleted': dict(deleted), 'batches': batches},
+            key=f'{PURGE}:{model}:{pk}')
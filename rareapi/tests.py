@@ -1,3 +1,1386 @@
-from django.test import TestCase
+import asyncio
+import base64
+import datetime
+import io
+import json
+import os
+import tempfile
+import time
+import types
+import unittest
+import unittest.mock
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import include, path
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from rareapi.authentication import CachedTokenAuthentication
+from rareapi import counters, jobs, trending
+from rareapi.async_reads import ASYNC_READ_ROUTES, async_read_urls
+from rareapi.caching import VersionedCache, category_cache, tag_cache
+from rareapi.db_routers import (PIN_COOKIE, PrimaryReplicaRouter, pinned_users,
+                                primary_reads, replica_reads)
+from rareapi.export import iter_post_chunks
+from rareapi.fieldsets import Fieldset
+from rareapi.instrumentation import route_stats
+from rareapi.registration import MAX_IMPORT_ROWS, hash_passwords, import_users
+from rareapi.renderers import FastJSONRenderer, msgpack
+from rareapi.models import RareUser, Post, PostTag, Category, Tag, Job, PostScore, TrendingEpoch
+from rareapi.models.post import EXCERPT_LENGTH, make_excerpt
+from rareapi.models.comment import Comment
+from rareapi.query_plans import apply_query_plan
+from rareapi.signals import apply_sqlite_pragmas
+from rareapi.tasks import delete_later
+from rareapi.views.post import FastPostSerializer, PostDetailSerializer, PostSerializer
+from rare.urls import router
+
+
+class RareTestCase(TestCase):
+    """Base test case with an authenticated client and a few helpers"""
+
+    def setUp(self):
+        # The in-process caches outlive the rolled back test transactions,
+        # which put the shared versions back to what they were
+        category_cache.clear()
+        tag_cache.clear()
+        CachedTokenAuthentication.cache.clear()
+
+        self.user = User.objects.create_user(
+            username='steve', password='Admin8*', first_name='Steve',
+            last_name='Brownlee')
+        self.rare_user = RareUser.objects.create(
+            user=self.user, bio='', profile_image_url='',
+            created_on=datetime.date.today(), active=True)
+        self.token = Token.objects.create(user=self.user)
+        self.category = Category.objects.create(label='Travel')
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def make_user(self, username):
+        user = User.objects.create_user(username=username, password='Admin8*')
+        return RareUser.objects.create(
+            user=user, bio='', profile_image_url='',
+            created_on=datetime.date.today(), active=True)
+
+    def make_post(self, rare_user=None, category=None, **kwargs):
+        fields = {
+            'rare_user': rare_user or self.rare_user,
+            'category': category or self.category,
+            'title': 'Hello World',
+            'publication_date': datetime.date.today(),
+            'image_url': '',
+            'content': 'This is soooo much fun!',
+            'approved': True,
+        }
+        fields.update(kwargs)
+        return Post.objects.create(**fields)
+
+    def make_comment(self, post, author=None, **kwargs):
+        fields = {
+            'post': post,
+            'author': author or self.rare_user,
+            'content': 'Nice post',
+            'created_on': datetime.date.today(),
+        }
+        fields.update(kwargs)
+        return Comment.objects.create(**fields)
+
+
+class PostQueryPlanTests(RareTestCase):
+    """The post endpoints run a fixed number of queries"""
+
+    def count_queries(self, url):
+        # Warm the token cache so only the post queries are counted
+        self.client.get('/tags')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_list_queries_do_not_grow_with_posts(self):
+        self.make_post()
+        few = self.count_queries('/posts')
+
+        for i in range(10):
+            author = self.make_user(f'author{i}')
+            self.make_post(rare_user=author, category=Category.objects.create(label=f'c{i}'))
+        many = self.count_queries('/posts')
+
+        self.assertEqual(few, many)
+
+    def test_retrieve_queries_do_not_grow_with_comments(self):
+        post = self.make_post()
+        self.make_comment(post)
+        few = self.count_queries(f'/posts/{post.id}')
+
+        for i in range(10):
+            self.make_comment(post, author=self.make_user(f'commenter{i}'))
+        many = self.count_queries(f'/posts/{post.id}')
+
+        self.assertEqual(few, many)
+
+
+class KeysetPaginationTests(RareTestCase):
+    """List endpoints page through rows with opaque cursors"""
+
+    def test_posts_walk_forward_and_back(self):
+        today = datetime.date.today()
+        posts = [self.make_post(publication_date=today - datetime.timedelta(days=i % 3))
+                 for i in range(7)]
+        expected = [post.id for post in sorted(
+            posts, key=lambda post: (post.publication_date, post.id), reverse=True)]
+
+        seen = []
+        pages = []
+        url = '/posts?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            seen.extend(post['id'] for post in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0]['previous'])
+
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual([post['id'] for post in response.data['results']], expected[3:6])
+
+    def test_categories_and_tags_are_paginated_by_id(self):
+        for i in range(4):
+            Category.objects.create(label=f'Category {i}')
+            Tag.objects.create(label=f'Tag {i}')
+
+        response = self.client.get('/categories?page_size=2')
+        ids = [category['id'] for category in response.data['results']]
+        self.assertEqual(ids, sorted(Category.objects.values_list('id', flat=True))[:2])
+        self.assertIsNotNone(response.data['next'])
+
+        response = self.client.get('/tags?page_size=10')
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/posts?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+        for payload in ('{"p":[{},1],"r":0}', '{"p":[null,1],"r":0}', '{"p":["x",[1]],"r":0}',
+                        '{"p":["someday","x"],"r":0}', '{"p":["2021-11-24","x"],"r":1}'):
+            cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+            self.assertEqual(self.client.get(f'/posts?cursor={cursor}').status_code, 404, payload)
+
+
+class ReferenceDataCacheTests(RareTestCase):
+    """Category and tag payloads are cached until a row changes"""
+
+    def test_repeat_list_skips_the_database(self):
+        Category.objects.create(label='Food')
+        first = self.client.get('/categories')
+
+        # The token is cached by the first request too, so only the shared
+        # version is read
+        with self.assertNumQueries(1):
+            second = self.client.get('/categories')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get('/tags')['ETag']
+        response = self.client.get('/tags', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_category_is_404_with_a_current_etag(self):
+        etag = self.client.get('/categories')['ETag']
+        response = self.client.get('/categories/999', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+        category = Category.objects.create(label='Food')
+        etag = self.client.get(f'/categories/{category.id}')['ETag']
+        response = self.client.get(f'/categories/{category.id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.delete(f'/categories/{category.id}')
+        response = self.client.get(f'/categories/{category.id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_writes_invalidate(self):
+        etag = self.client.get('/tags')['ETag']
+        self.client.post('/tags', {'label': 'Roadtrip'}, format='json')
+
+        response = self.client.get('/tags', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([tag['label'] for tag in response.data['results']], ['Roadtrip'])
+
+        category = Category.objects.create(label='Old')
+        self.client.get(f'/categories/{category.id}')
+        category.label = 'New'
+        category.save()
+        response = self.client.get(f'/categories/{category.id}')
+        self.assertEqual(response.data['label'], 'New')
+
+    def test_post_counts_are_refreshed_after_the_ttl(self):
+        now = time.time()
+        clock = unittest.mock.patch('rareapi.caching.time.time', return_value=now)
+        with clock:
+            etag = self.client.get('/categories')['ETag']
+            self.make_post()
+            response = self.client.get('/categories', HTTP_IF_NONE_MATCH=etag)
+        # Counting a post does not empty the cache...
+        self.assertEqual(response.status_code, 304)
+
+        # ...but the payload is rebuilt once the ttl has passed
+        with unittest.mock.patch('rareapi.caching.time.time',
+                                 return_value=now + category_cache.ttl):
+            response = self.client.get('/categories', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['post_count'], 1)
+
+    def test_writes_reach_other_processes(self):
+        # Two caches of one namespace stand in for two worker processes
+        here, elsewhere = VersionedCache('shared'), VersionedCache('shared')
+        version = here.version()
+        self.assertEqual(here.get_or_set(version, 'key', lambda: 'old'), 'old')
+        elsewhere.bump()
+
+        self.assertNotEqual(here.version(), version)
+        self.assertEqual(here.get_or_set(here.version(), 'key', lambda: 'new'), 'new')
+
+
+class CachedTokenAuthenticationTests(RareTestCase):
+    """Tokens resolve to their RareUser in one query and are then cached"""
+
+    def test_token_resolves_in_one_query(self):
+        # One query for the token, user and RareUser, then the tag cache's
+        # version and the tags
+        with self.assertNumQueries(3):
+            response = self.client.get('/tags')
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            self.client.get('/tags')
+
+    def test_rare_user_is_attached_to_request(self):
+        post = self.make_post()
+        self.make_post(rare_user=self.make_user('someone'))
+        response = self.client.get('/posts?get_posts_by_user=1')
+        self.assertEqual([row['id'] for row in response.data['results']], [post.id])
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get('/tags')
+        self.token.delete()
+        response = self.client.get('/tags')
+        self.assertEqual(response.status_code, 401)
+
+    def test_requests_get_their_own_instances(self):
+        authentication = CachedTokenAuthentication()
+        first, _ = authentication.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            second, token = authentication.authenticate_credentials(self.token.key)
+        self.assertIsNot(first, second)
+        self.assertEqual((second.pk, token.rare_user.pk), (self.user.pk, self.rare_user.pk))
+        # Tokens revoked elsewhere stop working within seconds
+        self.assertLessEqual(CachedTokenAuthentication.cache.ttl, 5)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/tags')
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get('/tags')
+        self.assertEqual(response.status_code, 401)
+
+
+class BulkCreateTests(RareTestCase):
+    """Create endpoints accept JSON arrays"""
+
+    def post_rows(self, **overrides):
+        row = {'category_id': self.category.id, 'title': 'Bulk',
+               'image_url': '', 'content': 'Imported'}
+        row.update(overrides)
+        return row
+
+    def test_bulk_posts(self):
+        rows = [self.post_rows(title=f'Post {i}') for i in range(5)]
+        response = self.client.post('/posts', rows, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        titles = [row['title'] for row in response.data]
+        self.assertEqual(titles, [f'Post {i}' for i in range(5)])
+        for row in response.data:
+            self.assertEqual(Post.objects.get(pk=row['id']).title, row['title'])
+
+    def test_bulk_posts_report_row_errors(self):
+        rows = [self.post_rows(), self.post_rows(category_id=9999),
+                {'category_id': self.category.id}, self.post_rows(title='x' * 51)]
+        response = self.client.post('/posts', rows, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        errors = response.data['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('category_id', errors[1])
+        self.assertIn('title', errors[2])
+        self.assertIn('title', errors[3])
+        self.assertFalse(Post.objects.exists())
+
+    def test_bulk_comments(self):
+        post = self.make_post()
+        rows = [{'content': f'Comment {i}'} for i in range(3)]
+        response = self.client.post(f'/posts/{post.id}/createComment', rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(post.comments.count(), 3)
+
+    def test_bulk_tags_invalidate_cache(self):
+        self.client.get('/tags')
+        response = self.client.post('/tags', [{'label': 'a'}, {'label': 'b'}], format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get('/tags')
+        self.assertEqual([tag['label'] for tag in response.data['results']], ['a', 'b'])
+
+
+class PostTagTests(RareTestCase):
+    """Posts can be tagged in bulk and filtered by tag"""
+
+    def setUp(self):
+        super().setUp()
+        self.road, self.food, self.camp = [
+            Tag.objects.create(label=label) for label in ('road', 'food', 'camp')]
+        self.both = self.make_post(title='both')
+        self.only_road = self.make_post(title='road')
+        self.untagged = self.make_post(title='none')
+        self.client.post(f'/posts/{self.both.id}/tags',
+                         {'attach': [self.road.id, self.food.id]}, format='json')
+        self.client.post(f'/posts/{self.only_road.id}/tags',
+                         {'attach': [self.road.id]}, format='json')
+
+    def titles(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return sorted(post['title'] for post in response.data['results'])
+
+    def test_any_and_all(self):
+        tags = f'{self.road.id},{self.food.id}'
+        self.assertEqual(self.titles(f'/posts?tags={tags}'), ['both', 'road'])
+        self.assertEqual(self.titles(f'/posts?tags={tags}&tags_match=all'), ['both'])
+        self.assertEqual(self.titles(f'/posts?tags={self.camp.id}'), [])
+
+    def test_attach_is_idempotent_and_detach(self):
+        response = self.client.post(
+            f'/posts/{self.both.id}/tags',
+            {'attach': [self.road.id, self.camp.id], 'detach': [self.food.id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([tag['label'] for tag in response.data], ['road', 'camp'])
+        self.assertEqual(PostTag.objects.filter(post_id=self.both).count(), 2)
+
+    def test_bad_input(self):
+        response = self.client.post(f'/posts/{self.both.id}/tags',
+                                    {'attach': [9999]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/posts?tags=road')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(f'/posts/{self.both.id}/tags', [self.road.id], format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ExplainQueriesCommandTests(RareTestCase):
+    """The read routes stay on indexes"""
+
+    def test_no_full_table_scans(self):
+        post = self.make_post()
+        self.make_comment(post)
+        out = io.StringIO()
+        call_command('explain_queries', pk=str(post.id), stdout=out)
+        self.assertIn('No full table scans found', out.getvalue())
+
+
+class PostSearchTests(RareTestCase):
+    """?q= searches post titles and content through FTS5"""
+
+    def setUp(self):
+        super().setUp()
+        self.in_title = self.make_post(title='Road trip to Utah', content='Arches')
+        self.in_content = self.make_post(title='Weekend', content='a short road trip')
+        self.make_post(title='Recipes', content='Soup')
+
+    def search(self, text):
+        response = self.client.get('/posts', {'q': text})
+        self.assertEqual(response.status_code, 200)
+        return [post['id'] for post in response.data['results']]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search('road trip'), [self.in_title.id, self.in_content.id])
+        self.assertEqual(self.search('uta'), [self.in_title.id])
+        self.assertEqual(self.search('"( OR'), [])
+
+    def test_index_follows_writes(self):
+        self.in_content.content = 'nothing here'
+        self.in_content.save()
+        self.in_title.delete()
+        Post.objects.filter(title='Recipes').update(title='Road soup')
+        self.assertEqual([post.title for post in Post.objects.filter(id__in=self.search('road'))],
+                         ['Road soup'])
+
+    def test_search_pages(self):
+        for i in range(5):
+            self.make_post(title=f'Camping {i}')
+        first = self.client.get('/posts', {'q': 'camping', 'page_size': 3}).data
+        second = self.client.get(first['next']).data
+        ids = [post['id'] for post in first['results'] + second['results']]
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_rebuild_command(self):
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(len(self.search('road')), 2)
+
+
+class PostExportTests(RareTestCase):
+    """Posts stream out as NDJSON, a chunk at a time"""
+
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = True
+        self.user.save()
+        for i in range(5):
+            post = self.make_post(title=f'Post {i}')
+            self.make_comment(post, content=f'Comment {i}')
+
+    def read_export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        body = b''.join(response.streaming_content).decode('utf-8')
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_export_matches_detail(self):
+        rows = self.read_export('/posts/export?chunk_size=2')
+        self.assertEqual(len(rows), 5)
+        detail = self.client.get(f'/posts/{rows[0]["id"]}').data
+        self.assertEqual(rows[0], json.loads(json.dumps(detail)))
+
+    def test_queries_grow_per_chunk_not_per_row(self):
+        self.client.get('/tags')
+        with CaptureQueriesContext(connection) as context:
+            self.read_export('/posts/export?chunk_size=2')
+        # The post query plus one comment query for each of the 3 chunks
+        self.assertEqual(len(context.captured_queries), 4)
+
+    def test_export_needs_staff(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get('/posts/export').status_code, 403)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_posts', chunk_size=3, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 5)
+
+    def test_chunk_size_is_bounded(self):
+        self.assertEqual([len(chunk) for chunk in iter_post_chunks(PostDetailSerializer, 0)],
+                         [1] * 5)
+        with unittest.mock.patch('rareapi.export.MAX_CHUNK_SIZE', 2):
+            chunks = list(iter_post_chunks(PostDetailSerializer, 5000))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+
+
+class SqlitePragmaTests(TestCase):
+    """SQLITE_PRAGMAS runs on new connections"""
+
+    def test_pragmas_applied(self):
+        with self.settings(SQLITE_PRAGMAS={'cache_size': -1234}):
+            apply_sqlite_pragmas(sender=connection.__class__, connection=connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -1234)
+
+
+class FastPostSerializerTests(RareTestCase):
+    """The list fast path renders exactly what PostSerializer does"""
+
+    def test_parity(self):
+        other = self.make_user('zoë')
+        other.user.first_name = 'Zoë'
+        other.user.last_name = 'O\'Brien "Z"'
+        other.user.save()
+        self.make_post(title='Ünïcode ✓', content='Line\nbreak', image_url='http://x/y.png')
+        self.make_post(rare_user=other, category=Category.objects.create(label='Ünïcode'),
+                       publication_date=datetime.date(2021, 1, 2))
+
+        posts = Post.objects.order_by('id')
+        slow = PostSerializer(apply_query_plan(posts, PostSerializer), many=True).data
+        fast = FastPostSerializer(FastPostSerializer.rows(posts), many=True).data
+        self.assertEqual(JSONRenderer().render(slow), JSONRenderer().render(fast))
+
+    def test_list_uses_fast_path(self):
+        self.make_post()
+        response = self.client.get('/posts')
+        expected = PostSerializer(Post.objects.all(), many=True).data
+        self.assertEqual(JSONRenderer().render(response.data['results']),
+                         JSONRenderer().render(expected))
+
+
+class PostExcerptTests(RareTestCase):
+    """Lists render a stored excerpt and never load the full content"""
+
+    def test_make_excerpt(self):
+        self.assertEqual(make_excerpt('  Short\n post '), 'Short post')
+        words = 'road ' * 30
+        excerpt = make_excerpt(words)
+        self.assertTrue(excerpt.endswith('road…'))
+        self.assertLessEqual(len(excerpt), EXCERPT_LENGTH + 1)
+        self.assertEqual(make_excerpt('x' * 100), 'x' * EXCERPT_LENGTH + '…')
+
+    def test_kept_in_step_on_save_and_bulk_create(self):
+        long_content = 'A long day of driving through the desert, ' * 2
+        post = self.make_post(content=long_content)
+        self.assertEqual(post.excerpt, make_excerpt(long_content))
+        post.content = 'Changed'
+        post.save(update_fields=['content'])
+        post.refresh_from_db()
+        self.assertEqual(post.excerpt, 'Changed')
+
+        response = self.client.post('/posts', [{'category_id': self.category.id, 'title': 'Bulk',
+                                                'image_url': '', 'content': long_content}],
+                                    format='json')
+        self.assertEqual(response.json()[0]['excerpt'], make_excerpt(long_content))
+        self.assertEqual(Post.objects.get(title='Bulk').excerpt, make_excerpt(long_content))
+
+        Post.objects.filter(pk=post.pk).update(content=long_content)
+        self.assertEqual(Post.objects.get(pk=post.pk).excerpt, make_excerpt(long_content))
+
+    def test_create_responses_include_content(self):
+        row = {'category_id': self.category.id, 'title': 'New', 'image_url': '',
+               'content': 'The whole thing'}
+        self.assertEqual(self.client.post('/posts', row, format='json').json()['content'],
+                         'The whole thing')
+        self.assertEqual(self.client.post('/posts', [row], format='json').json()[0]['content'],
+                         'The whole thing')
+
+    def test_list_defers_content(self):
+        post = self.make_post(content='word ' * 19 + 'end')
+        with CaptureQueriesContext(connection) as captured:
+            row = self.client.get('/posts').json()['results'][0]
+        self.assertEqual(row['excerpt'], post.excerpt)
+        self.assertNotIn('content', row)
+        self.assertFalse(any('"content"' in query['sql'] for query in captured.captured_queries))
+        self.assertEqual(self.client.get('/posts?fields=content').status_code, 400)
+
+        detail = self.client.get(f'/posts/{post.id}').json()
+        self.assertEqual(detail['content'], post.content)
+        self.assertNotIn('excerpt', detail)
+
+    def test_query_plan_defers_content(self):
+        self.make_post()
+        post = apply_query_plan(Post.objects.all(), PostSerializer).get()
+        self.assertEqual(post.get_deferred_fields() & {'content'}, {'content'})
+
+
+class ModerationTests(RareTestCase):
+    """Posts by non-staff wait in a moderation queue until approved or rejected"""
+
+    def setUp(self):
+        super().setUp()
+        self.moderator = User.objects.create_user(username='mod', password='Admin8*',
+                                                  is_staff=True)
+        self.moderator_client = APIClient()
+        self.moderator_client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.moderator).key}')
+        self.other = APIClient()
+        self.other.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(
+            user=self.make_user('other').user).key)
+
+    def create(self, title):
+        return self.client.post('/posts', {'category_id': self.category.id, 'title': title,
+                                           'image_url': '', 'content': 'Pending'},
+                                 format='json').json()['id']
+
+    def test_new_posts_wait_for_approval(self):
+        pending = self.create('Pending')
+        approved = self.make_post(title='Approved').id
+
+        self.assertEqual([post['id'] for post in self.client.get('/posts').json()['results']],
+                         [approved, pending])
+        self.assertEqual([post['id'] for post in self.other.get('/posts').json()['results']],
+                         [approved])
+        self.assertEqual(self.other.get(f'/posts/{pending}').status_code, 404)
+        self.assertEqual(self.moderator_client.get(f'/posts/{pending}').status_code, 200)
+
+    def test_hidden_posts_cannot_be_written_to(self):
+        pending = self.create('Pending')
+        tag = Tag.objects.create(label='road')
+        comment = {'content': 'Hi'}
+        tags = {'attach': [tag.id]}
+        self.assertEqual(self.other.post(f'/posts/{pending}/createComment', comment,
+                                         format='json').status_code, 404)
+        self.assertEqual(self.other.post(f'/posts/{pending}/createComment', [comment],
+                                         format='json').status_code, 404)
+        self.assertEqual(self.other.post(f'/posts/{pending}/tags', tags,
+                                         format='json').status_code, 404)
+        tag.refresh_from_db()
+        self.assertEqual((tag.post_count, Post.objects.get(pk=pending).comment_count), (0, 0))
+
+        # The author and moderators still can
+        self.assertEqual(self.client.post(f'/posts/{pending}/createComment', comment,
+                                          format='json').status_code, 200)
+        self.assertEqual(self.moderator_client.post(f'/posts/{pending}/tags', tags,
+                                                    format='json').status_code, 200)
+
+        self.assertEqual(self.client.get('/posts/moderation').status_code, 403)
+        queue = self.moderator_client.get('/posts/moderation').json()['results']
+        self.assertEqual([(post['id'], post['content']) for post in queue], [(pending, 'Pending')])
+
+    def test_bulk_moderation(self):
+        posts = [self.create(f'Post {i}') for i in range(4)]
+        before = Post.objects.get(pk=posts[0]).updated_at
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.moderator_client.post(
+                '/posts/moderation', {'approve': posts[:2], 'reject': posts[2:3]}, format='json')
+        self.assertEqual(response.json(), {'approved': 2, 'rejected': 1})
+        updates = [query['sql'] for query in captured.captured_queries
+                   if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertGreater(Post.objects.get(pk=posts[0]).updated_at, before)
+
+        queue = self.moderator_client.get('/posts/moderation').json()['results']
+        self.assertEqual([post['id'] for post in queue], posts[3:])
+        self.assertEqual([post['id'] for post in self.other.get('/posts').json()['results']],
+                         posts[1::-1])
+        self.assertEqual(self.moderator_client.post(
+            '/posts/moderation', {'approve': [1], 'reject': [1]}, format='json').status_code, 400)
+        self.assertEqual(self.moderator_client.post(
+            '/posts/moderation', [1], format='json').status_code, 400)
+
+    def test_queue_reads_the_partial_index(self):
+        sql, params = Post.objects.awaiting_moderation().order_by('id').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('post_moderation_queue_idx', plan)
+
+    def test_admin_actions(self):
+        pending = self.create('Pending')
+        self.client.force_login(self.moderator)
+        self.moderator.is_superuser = True
+        self.moderator.save()
+        url = '/admin/rareapi/post/'
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get(url + '?approved__exact=0').status_code, 200)
+        # Only the filtered count for the paginator, not the full one too
+        counts = [query['sql'] for query in captured.captured_queries if 'COUNT(*)' in query['sql']]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('WHERE', counts[0])
+
+        self.client.post(url, {'action': 'approve_posts', '_selected_action': [pending]})
+        self.assertTrue(Post.objects.get(pk=pending).approved)
+        self.client.post(url, {'action': 'reject_posts', '_selected_action': [pending]})
+        post = Post.objects.get(pk=pending)
+        self.assertEqual((post.approved, post.rejected), (False, True))
+
+
+class SeedAndBenchmarkCommandTests(TestCase):
+    """seed_data fills every table and bench_api covers every route"""
+
+    def test_seed_then_bench(self):
+        call_command('seed_data', users=3, categories=2, tags=4, posts=20, comments=30,
+                     seed=1, stdout=io.StringIO())
+        self.assertEqual(RareUser.objects.count(), 3)
+        self.assertEqual(Token.objects.exclude(key='').count(), 3)
+        self.assertEqual(Post.objects.count(), 20)
+        self.assertEqual(Comment.objects.count(), 30)
+        self.assertTrue(PostTag.objects.exists())
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            err = io.StringIO()
+            call_command('bench_api', requests=1, output=output,
+                         stdout=io.StringIO(), stderr=err)
+            with open(output) as results:
+                routes = json.load(results)
+        self.assertNotIn('No request spec', err.getvalue())
+        self.assertIn('GET post-list', routes)
+        self.assertEqual(routes['GET post-list']['statuses'], {'200': 1})
+
+
+class PerformanceMiddlewareTests(RareTestCase):
+    """Every request is timed into a header, a log line and the route stats"""
+
+    def setUp(self):
+        super().setUp()
+        route_stats.reset()
+
+    def test_server_timing_header(self):
+        self.make_post()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/posts')
+
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'db', 'view', 'serializer', 'render', 'total'})
+        self.assertIn(f'desc="{len(captured.captured_queries)} queries"', timing['db'])
+        # Serializing the posts is reported apart from the rest of the view
+        self.assertGreater(float(timing['serializer'].split('=')[1]), 0)
+
+    def test_log_line(self):
+        with self.assertLogs('rareapi.performance', 'INFO') as logs:
+            self.client.get('/tags')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['route'], 'GET tag-list')
+        self.assertEqual(line['status'], 200)
+        self.assertGreater(line['render'], 0)
+
+    def test_stats_endpoint(self):
+        self.client.get('/posts')
+        self.client.get('/posts')
+
+        self.assertEqual(self.client.get('/stats/performance').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        stats = self.client.get('/stats/performance').json()
+        self.assertEqual(stats['GET post-list']['requests'], 2)
+        self.assertEqual(set(stats['GET post-list']['total']), {'p50', 'p95', 'p99', 'max'})
+
+        self.assertEqual(self.client.delete('/stats/performance').status_code, 204)
+        # Only the DELETE itself, recorded after the reset
+        self.assertEqual(list(route_stats.snapshot()), ['DELETE performance-stats'])
+
+
+# A fast hasher, since these tests hash a lot of passwords
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserRegistrationTests(RareTestCase):
+    """Registration is atomic and users can be imported in bulk"""
+
+    def test_register_is_atomic(self):
+        client = APIClient()
+        body = {'username': 'joe', 'email': 'joe@example.com', 'password': 'pw',
+                'first_name': 'Joe', 'last_name': 'Shepherd'}
+        with CaptureQueriesContext(connection) as captured:
+            self.assertIn('token', client.post('/register', body, format='json').json())
+        # All the writes happen inside one transaction
+        sql = [query['sql'] for query in captured.captured_queries]
+        self.assertTrue(sql[0].startswith('SAVEPOINT'))
+        self.assertEqual(RareUser.objects.filter(user__username='joe').count(), 1)
+
+    def test_hash_passwords_in_pool(self):
+        hashes = hash_passwords([f'pw{i}' for i in range(20)], processes=2)
+        self.assertEqual(len(hashes), 20)
+        self.assertTrue(check_password('pw7', hashes[7]))
+
+    def test_import_endpoint(self):
+        rows = [{'username': f'member{i}', 'password': f'pw{i}', 'first_name': 'M'}
+                for i in range(3)]
+        self.assertEqual(self.client.post('/users/import', rows, format='json').status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.post('/users/import', rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        created = response.json()
+        self.assertEqual([row['username'] for row in created], ['member0', 'member1', 'member2'])
+
+        member = RareUser.objects.get(id=created[1]['id'])
+        self.assertTrue(member.user.check_password('pw1'))
+        self.assertEqual(Token.objects.get(user=member.user).key, created[1]['token'])
+
+    def test_import_rejects_every_row_when_one_is_bad(self):
+        self.user.is_staff = True
+        self.user.save()
+        rows = [{'username': 'fresh', 'password': 'pw'},
+                {'username': 'steve', 'password': 'pw'},
+                {'username': 'fresh', 'password': ''}]
+        response = self.client.post('/users/import', rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('username', errors[1])
+        self.assertEqual(set(errors[2]), {'username', 'password'})
+        self.assertFalse(User.objects.filter(username='fresh').exists())
+
+    def test_taken_usernames_are_found_in_every_chunk(self):
+        rows = [{'username': f'member{i}', 'password': 'pw'} for i in range(4)]
+        rows.append({'username': 'steve', 'password': 'pw'})
+        with unittest.mock.patch('rareapi.counters.CHUNK_SIZE', 2):
+            with CaptureQueriesContext(connection) as captured:
+                tokens, errors = import_users(rows, processes=1)
+        self.assertEqual(tokens, [])
+        self.assertEqual([bool(row) for row in errors], [False] * 4 + [True])
+        self.assertEqual(sum('"username" IN' in query['sql'] for query in captured.captured_queries), 3)
+
+    def test_import_checks_types_and_size(self):
+        self.user.is_staff = True
+        self.user.save()
+        rows = [{'username': 'fresh', 'password': 1234},
+                {'username': ['list'], 'password': 'pw', 'bio': None}]
+        response = self.client.post('/users/import', rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [
+            {'password': ['Not a valid string.']},
+            {'username': ['Not a valid string.'], 'bio': ['Not a valid string.']}])
+
+        rows = [{'username': f'member{i}', 'password': 'pw'} for i in range(MAX_IMPORT_ROWS + 1)]
+        response = self.client.post('/users/import', rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('import_users command', response.json()['reason'])
+
+    def test_import_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'users.csv')
+            with open(source, 'w') as rows:
+                rows.write('username,password,email\nann,pw1,ann@example.com\nbob,pw2,\n')
+            tokens = os.path.join(directory, 'tokens.csv')
+            call_command('import_users', source, tokens=tokens, stdout=io.StringIO())
+            with open(tokens) as output:
+                lines = output.read().splitlines()
+        self.assertEqual(lines[0], 'username,token')
+        self.assertEqual(RareUser.objects.filter(user__username__in=['ann', 'bob']).count(), 2)
+
+
+class CounterTests(RareTestCase):
+    """Counter columns follow creates and deletes and can be reconciled"""
+
+    def counts(self, post, tag):
+        post.refresh_from_db()
+        self.category.refresh_from_db()
+        tag.refresh_from_db()
+        return post.comment_count, self.category.post_count, tag.post_count
+
+    def test_single_and_bulk_writes(self):
+        tag = Tag.objects.create(label='desert')
+        post = self.make_post()
+        comment = self.make_comment(post)
+        self.client.post(f'/posts/{post.id}/createComment',
+                         [{'content': 'one'}, {'content': 'two'}], format='json')
+        # Attaching twice counts the tag once
+        self.client.post(f'/posts/{post.id}/tags', {'attach': [tag.id, tag.id]}, format='json')
+        self.client.post(f'/posts/{post.id}/tags', {'attach': [tag.id]}, format='json')
+        self.client.post('/posts', [{'category_id': self.category.id, 'title': 'Bulk',
+                                     'image_url': '', 'content': ''}], format='json')
+        self.assertEqual(self.counts(post, tag), (3, 2, 1))
+
+        comment.delete()
+        self.client.post(f'/posts/{post.id}/tags', {'detach': [tag.id]}, format='json')
+        self.assertEqual(self.counts(post, tag), (2, 2, 0))
+
+        # Uncounted once the job worker has deleted it
+        self.client.delete(f'/posts/{post.id}')
+        call_command('run_jobs', once=True, threads=1, stdout=io.StringIO())
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.post_count, 1)
+
+    def test_counters_in_list_serializers(self):
+        post = self.make_post()
+        self.make_comment(post)
+        row = self.client.get('/posts').json()['results'][0]
+        self.assertEqual(row['comment_count'], 1)
+        self.assertEqual(row['category']['post_count'], 1)
+        categories = self.client.get('/categories').json()['results']
+        self.assertEqual(categories[0]['post_count'], 1)
+
+    def test_reconcile(self):
+        posts = [self.make_post() for _ in range(5)]
+        self.make_comment(posts[3])
+        Post.objects.filter(pk=posts[1].pk).update(comment_count=7)
+        Post.objects.filter(pk=posts[3].pk).update(comment_count=0)
+
+        drifted = [pks for _, pks in counters.reconcile(counters.POST_COMMENTS, batch_size=2)]
+        self.assertEqual(drifted, [[posts[1].pk], [posts[3].pk], []])
+        self.assertEqual(
+            list(Post.objects.order_by('pk').values_list('comment_count', flat=True)),
+            [0, 0, 0, 1, 0])
+
+        out = io.StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('Post.comment_count: checked 5, fixed 0 drifted', out.getvalue())
+
+
+class PostConditionalGetTests(RareTestCase):
+    """Post detail answers conditional requests with 304 from one query"""
+
+    def setUp(self):
+        super().setUp()
+        self.post = self.make_post()
+        self.make_comment(self.post)
+        # Warm the token cache so only the view's own queries are counted
+        self.client.get('/tags')
+
+    def test_validators_and_304(self):
+        response = self.client.get(f'/posts/{self.post.id}')
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(f'/posts/{self.post.id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(captured.captured_queries), 1)
+
+        response = self.client.get(f'/posts/{self.post.id}',
+                                   HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_comment_writes_change_etag(self):
+        etag = self.client.get(f'/posts/{self.post.id}')['ETag']
+        self.client.post(f'/posts/{self.post.id}/createComment', {'content': 'Hi'},
+                         format='json')
+
+        response = self.client.get(f'/posts/{self.post.id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['comments']), 2)
+
+        etag = response['ETag']
+        Comment.objects.filter(post=self.post).first().delete()
+        response = self.client.get(f'/posts/{self.post.id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_renames_change_etag(self):
+        commenter = self.make_user('ann')
+        self.make_comment(self.post, author=commenter)
+        renames = [
+            (self.category, 'label', 'Road trips'),
+            (self.user, 'first_name', 'Stephen'),
+            (commenter.user, 'last_name', 'Smith'),
+        ]
+        for instance, field, value in renames:
+            response = self.client.get(f'/posts/{self.post.id}')
+            setattr(instance, field, value)
+            instance.save()
+            changed = self.client.get(f'/posts/{self.post.id}',
+                                      HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(changed.status_code, 200, field)
+            self.assertNotEqual(changed['ETag'], response['ETag'])
+            self.assertIn(value, changed.content.decode())
+
+        # Saving fields the detail does not render leaves it alone
+        etag = self.client.get(f'/posts/{self.post.id}')['ETag']
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        response = self.client.get(f'/posts/{self.post.id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class SparseFieldsetTests(RareTestCase):
+    """?fields= and ?expand= shrink both the JSON and the query"""
+
+    def setUp(self):
+        super().setUp()
+        self.posts = [self.make_post(title=f'Post {i}') for i in range(3)]
+        self.make_comment(self.posts[0])
+        self.client.get('/tags')
+
+    def test_list(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/posts?fields=title,category&expand=&page_size=2')
+        body = response.json()
+        self.assertEqual(body['results'][0], {'title': 'Post 2', 'category': self.category.id})
+        self.assertIsNotNone(body['next'])
+        sql = captured.captured_queries[-1]['sql']
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('"content"', sql)
+
+        second = self.client.get(body['next']).json()['results']
+        self.assertEqual([row['title'] for row in second], ['Post 0'])
+
+    def test_list_matches_post_serializer(self):
+        posts = Post.objects.order_by('id')
+        for fieldset in (Fieldset(('id', 'rare_user', 'category'), frozenset({'rare_user'})),
+                         Fieldset(('title', 'comment_count'), frozenset())):
+            slow = PostSerializer(apply_query_plan(posts, PostSerializer, fieldset=fieldset),
+                                  many=True, fieldset=fieldset).data
+            fast = FastPostSerializer(FastPostSerializer.rows(posts, fieldset=fieldset),
+                                      many=True, fieldset=fieldset).data
+            self.assertEqual(JSONRenderer().render(slow), JSONRenderer().render(fast))
+
+    def test_retrieve(self):
+        post = self.posts[0]
+        full = self.client.get(f'/posts/{post.id}')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(f'/posts/{post.id}?fields=title,rare_user,comments'
+                                       '&expand=')
+        self.assertEqual(set(response.json()), {'title', 'rare_user', 'comments'})
+        self.assertEqual(response.json()['rare_user'], self.rare_user.id)
+        post_sql = captured.captured_queries[0]['sql']
+        self.assertNotIn('JOIN', post_sql)
+        self.assertNotIn('"content"', post_sql)
+        self.assertEqual(len(captured.captured_queries), 2)
+        self.assertNotEqual(response['ETag'], full['ETag'])
+
+        response = self.client.get(f'/posts/{post.id}?fields=title')
+        self.assertEqual(response.json(), {'title': 'Post 0'})
+
+    def test_unknown_fields(self):
+        self.assertEqual(self.client.get('/posts?fields=title,secret').status_code, 400)
+        self.assertEqual(
+            self.client.get(f'/posts/{self.posts[0].id}?expand=comments').status_code, 400)
+
+
+class RendererTests(RareTestCase):
+    """orjson renders DRF's JSON, but for non-finite floats; MessagePack is negotiated"""
+
+    def test_fast_json_matches_drf(self):
+        data = {
+            'when': datetime.datetime(2021, 11, 24, 9, 30, 15, 123456,
+                                      tzinfo=datetime.timezone.utc),
+            'day': datetime.date(2021, 11, 24),
+            'price': Decimal('1.50'),
+            'errors': Post.objects.none(),
+            'text': 'Café\u2028\u2029',
+            1: None,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_non_finite_floats_render_as_null(self):
+        # The one difference from DRF, which raises under STRICT_JSON
+        self.assertEqual(FastJSONRenderer().render({'score': float('nan')}), b'{"score":null}')
+        with self.assertRaises(ValueError):
+            JSONRenderer().render({'score': float('nan')})
+
+    def test_invalid_json_body(self):
+        response = self.client.post('/tags', b'{"label": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    @unittest.skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack(self):
+        self.make_post()
+        json_body = self.client.get('/posts').json()
+        response = self.client.get('/posts', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), json_body)
+
+        response = self.client.post('/tags', msgpack.packb([{'label': 'one'}, {'label': 'two'}]),
+                                    content_type='application/msgpack',
+                                    HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([tag['label'] for tag in msgpack.unpackb(response.content)],
+                         ['one', 'two'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(RareTestCase):
+    """Reads in replica_reads handlers go to a replica unless the client just wrote"""
+
+    def setUp(self):
+        super().setUp()
+        pinned_users.clear()
+        self.router = PrimaryReplicaRouter()
+
+        class View:
+            @replica_reads
+            def list(view, request):
+                with primary_reads():
+                    forced = self.router.db_for_read(Post)
+                return self.router.db_for_read(Post), forced
+
+        self.view = View()
+
+    def request(self, **cookies):
+        request = RequestFactory().get('/posts')
+        request.COOKIES.update(cookies)
+        request.user = self.user
+        return request
+
+    def test_routing(self):
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertEqual(self.view.list(self.request()), ('replica', 'default'))
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'rareapi'))
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        response = self.client.post('/tags', {'label': 'new'}, format='json')
+        self.assertEqual(response.cookies[PIN_COOKIE].value, '1')
+        # Pinned by user in this process, and by cookie in any process
+        self.assertEqual(self.view.list(self.request()), ('default', 'default'))
+        pinned_users.clear()
+        self.assertEqual(self.view.list(self.request(**{PIN_COOKIE: '1'})),
+                         ('default', 'default'))
+        self.assertEqual(self.view.list(self.request()), ('replica', 'default'))
+
+
+class JobQueueTests(RareTestCase):
+    """Enqueued jobs are run, retried and recovered by the worker"""
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        jobs.task('test.record')(lambda **payload: self.calls.append(payload))
+        jobs.task('test.fail', max_attempts=2)(lambda: 1 / 0)
+        self.addCleanup(jobs.TASKS.pop, 'test.record')
+        self.addCleanup(jobs.TASKS.pop, 'test.fail')
+
+    def run_jobs(self):
+        out = io.StringIO()
+        call_command('run_jobs', once=True, threads=1, stdout=out)
+        return out.getvalue()
+
+    def test_writes_return_before_their_side_effects_run(self):
+        post = self.make_post()
+        tag = Tag.objects.create(label='road')
+        self.run_jobs()
+        response = self.client.post('/posts', [{'category_id': self.category.id, 'title': title,
+                                                'image_url': '', 'content': ''} for title in 'ab'],
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.client.post(f'/posts/{post.id}/tags', {'attach': [tag.id]}, format='json')
+        self.client.post(f'/posts/{post.id}/createComment', [{'content': 'Hi'}], format='json')
+        self.assertEqual(list(Job.objects.order_by('id').values_list('name', flat=True)), [
+            counters.RECONCILE, trending.RECORD,
+            counters.RECONCILE,
+            counters.RECONCILE, trending.RECORD,
+        ])
+        # Nothing scored yet; the counts the client reads back are already right
+        self.assertFalse(PostScore.objects.exclude(post=post).exists())
+        self.assertEqual(self.client.get('/categories').json()['results'][0]['post_count'], 3)
+
+        # A count that went wrong (two requests attaching the same tag at
+        # once) is recounted by the job
+        Tag.objects.update(post_count=2)
+        self.assertIn('5 jobs succeeded, 0 failed', self.run_jobs())
+        self.assertEqual(PostScore.objects.count(), 3)
+        self.assertEqual(Tag.objects.get().post_count, 1)
+
+    def test_runs_payload_and_coalesces_by_key(self):
+        jobs.enqueue('test.record', {'post': 1}, key='post:1')
+        jobs.enqueue('test.record', {'post': 1}, key='post:1')
+        jobs.enqueue('test.record', {'post': 2})
+        jobs.enqueue('test.record', {'post': 3}, delay=60)
+        self.run_jobs()
+        self.assertEqual(self.calls, [{'post': 1}, {'post': 2}])
+        self.assertEqual(Job.objects.get().payload, {'post': 3})
+
+        with self.assertRaises(ValueError):
+            jobs.enqueue('test.missing')
+
+    def test_failures_back_off_then_fail(self):
+        jobs.enqueue('test.fail')
+        with self.assertLogs('rareapi.jobs', 'WARNING'):
+            self.assertIn('0 jobs succeeded, 1 failed', self.run_jobs())
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertGreater(job.run_at, datetime.datetime.now(datetime.timezone.utc))
+        self.assertIn('ZeroDivisionError', job.last_error)
+
+        Job.objects.update(run_at=job.created_at)
+        with self.assertLogs('rareapi.jobs', 'ERROR'):
+            self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        # Failed jobs stay for inspection but are never claimed again
+        self.assertEqual(jobs.claim(10), [])
+
+    def test_abandoned_jobs_are_recovered(self):
+        jobs.enqueue('test.record', {'post': 1}, key='post:1')
+        self.assertEqual(len(jobs.claim(10)), 1)
+        # The worker died; a new job with the same key arrived meanwhile
+        jobs.enqueue('test.record', {'post': 1}, key='post:1')
+        jobs.enqueue('test.record', {'post': 2}, key='post:2')
+        Job.objects.filter(status=Job.RUNNING).update(locked_at=datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc))
+
+        with self.assertLogs('rareapi.jobs', 'WARNING'):
+            self.run_jobs()
+        self.assertEqual(self.calls, [{'post': 1}, {'post': 2}])
+        self.assertFalse(Job.objects.exists())
+
+
+async_urls = types.ModuleType('async_urls')
+async_urls.urlpatterns = [path('', include(async_read_urls(router.urls)))]
+
+
+@override_settings(ROOT_URLCONF=async_urls, ASYNC_READ_THREADS=0)
+class AsyncReadTests(RareTestCase):
+    """The async read views answer like the sync ones through the ASGI stack"""
+
+    def setUp(self):
+        super().setUp()
+        self.async_client = AsyncClient()
+
+    def async_request(self, method, url, *args, **kwargs):
+        # Django 3.2's AsyncClient sends extra keywords as raw header names
+        async def send():
+            return await getattr(self.async_client, method)(
+                url, *args, authorization=f'Token {self.token.key}', **kwargs)
+        return async_to_sync(send)()
+
+    def test_only_read_routes_are_async(self):
+        swapped = {pattern.name: asyncio.iscoroutinefunction(pattern.callback)
+                   for pattern in async_read_urls(router.urls) if pattern.name}
+        self.assertEqual({name for name, is_async in swapped.items() if is_async},
+                         set(ASYNC_READ_ROUTES))
+
+    def test_reads_match_the_sync_views(self):
+        post = self.make_post()
+        Tag.objects.create(label='desert')
+        for url in ['/posts', f'/posts/{post.id}', '/categories', '/tags', '/posts?fields=id']:
+            response = self.async_request('get', url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(json.loads(response.content), self.client.get(url).json(), url)
+            # Queries made by the view are still counted
+            self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+    def test_writes_go_through_and_pin_the_client(self):
+        with override_settings(DATABASE_REPLICAS=['replica']):
+            response = self.async_request(
+                'post', '/posts', {'category_id': self.category.id, 'title': 'Async',
+                           'image_url': '', 'content': ''}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies[PIN_COOKIE].value, '1')
+        self.assertTrue(Post.objects.filter(title='Async').exists())
+
+
+
+class BackgroundDeletionTests(RareTestCase):
+    """Deleted rows are hidden at once and removed in batches by the worker"""
+
+    def setUp(self):
+        super().setUp()
+        self.other = self.make_user('carrie')
+        self.tag = Tag.objects.create(label='desert')
+
+    def make_busy_post(self, **kwargs):
+        post = self.make_post(**kwargs)
+        for _ in range(2):
+            self.make_comment(post, author=self.other)
+        PostTag.objects.create(post_id=post, tag_id=self.tag)
+        # Score it, as the worker would have long before it is deleted
+        call_command('run_jobs', once=True, threads=1, stdout=io.StringIO())
+        return post
+
+    def run_jobs(self, batch_size=2):
+        with override_settings(PURGE_BATCH_SIZE=batch_size):
+            with self.assertLogs('rareapi.deletion', 'INFO') as logs:
+                call_command('run_jobs', once=True, threads=1, stdout=io.StringIO())
+        return logs.output
+
+    def test_category_posts_are_deleted_in_batches(self):
+        doomed = [self.make_busy_post() for _ in range(3)]
+        kept = self.make_busy_post(category=Category.objects.create(label='Kept'))
+
+        response = self.client.delete(f'/categories/{self.category.id}')
+        self.assertEqual(response.status_code, 204)
+        # Hidden straight away, though nothing is deleted yet
+        self.assertEqual(Post.objects.count(), 4)
+        self.assertNotIn(self.category.id,
+                         [row['id'] for row in self.client.get('/categories').json()['results']])
+        self.assertEqual([row['id'] for row in self.client.get('/posts').json()['results']],
+                         [kept.id])
+        self.assertEqual(self.client.get(f'/posts/{doomed[0].id}').status_code, 404)
+        self.assertEqual(self.client.delete(f'/categories/{self.category.id}').status_code, 404)
+
+        # 6 comments, 3 post tags, 3 trending scores and 3 posts, two at a
+        # time, then the category
+        self.assertEqual(len(self.run_jobs()), 10)
+        self.assertFalse(Category.objects.filter(pk=self.category.id).exists())
+        self.assertEqual(list(Post.objects.values_list('id', flat=True)), [kept.id])
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertEqual(Tag.objects.get().post_count, 1)
+        self.assertFalse(Job.objects.exists())
+
+    def test_post_deletion_progress_is_reported(self):
+        post = self.make_busy_post()
+        self.assertEqual(self.client.delete(f'/posts/{post.id}').status_code, 204)
+
+        with override_settings(PURGE_BATCH_SIZE=1):
+            jobs.run(jobs.claim(1)[0])
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get('/stats/deletions').json(), [{
+            'model': 'rareapi.Post', 'id': post.id, 'batches': 1,
+            'deleted': {'rareapi.PostTag': 1}, 'status': 'pending', 'attempts': 0,
+            'last_error': '',
+        }])
+
+        self.run_jobs()
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(Tag.objects.get().post_count, 0)
+        self.assertEqual(Category.objects.get().post_count, 0)
+
+    def test_deleted_users_lose_access_and_their_comments_are_uncounted(self):
+        theirs = self.make_busy_post(rare_user=self.other)
+        mine = self.make_busy_post()
+        token = Token.objects.create(user=self.other.user)
+
+        delete_later(self.other.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(client.get('/posts').status_code, 401)
+        self.assertEqual([row['id'] for row in self.client.get('/posts').json()['results']],
+                         [mine.id])
+
+        self.run_jobs(batch_size=100)
+        self.assertFalse(User.objects.filter(pk=self.other.user_id).exists())
+        self.assertFalse(Post.objects.filter(pk=theirs.pk).exists())
+        mine.refresh_from_db()
+        self.assertEqual(mine.comment_count, 0)
+        self.assertEqual(Tag.objects.get().post_count, 1)
+
+
+class TrendingTests(RareTestCase):
+    """?sort=trending ranks posts by recent activity from stored scores"""
+
+    def trending_ids(self, url='/posts?sort=trending'):
+        return [row['id'] for row in self.client.get(url).json()['results']]
+
+    def run_jobs(self):
+        call_command('run_jobs', once=True, threads=1, stdout=io.StringIO())
+
+    def test_most_active_posts_first(self):
+        quiet, busy, busiest = self.make_post(), self.make_post(), self.make_post()
+        self.make_comment(busy)
+        self.client.post(f'/posts/{busiest.id}/createComment',
+                         [{'content': 'one'}, {'content': 'two'}], format='json')
+        # Scored by the job worker, not by the writes
+        self.assertEqual(self.trending_ids(), [])
+        self.run_jobs()
+        self.assertEqual(self.trending_ids(), [busiest.id, busy.id, quiet.id])
+
+        response = self.client.get('/posts?sort=trending&page_size=2')
+        self.assertEqual(self.trending_ids(response.json()['next']), [quiet.id])
+
+        self.assertEqual(self.client.get('/posts?sort=oldest').status_code, 400)
+        self.assertEqual(self.client.get('/posts?sort=trending&q=fun').status_code, 400)
+
+    def test_old_activity_decays_and_is_rescaled(self):
+        old = self.make_post()
+        for _ in range(3):
+            self.make_comment(old)
+        faded = self.make_post()
+        self.run_jobs()
+        PostScore.objects.filter(post=faded).update(score=trending.MIN_SCORE * 2)
+
+        # Two half-lives later one new comment outweighs three old ones
+        TrendingEpoch.objects.update(
+            started_at=TrendingEpoch.objects.get().started_at - 2 * trending.HALF_LIFE)
+        new = self.make_post()
+        self.make_comment(new)
+
+        # The epoch is overdue, so recording queued a rescale, which the
+        # worker runs in the same pass
+        self.run_jobs()
+        scores = dict(PostScore.objects.values_list('post_id', 'score'))
+        self.assertAlmostEqual(scores[old.id], 1.0, places=2)
+        self.assertAlmostEqual(scores[new.id], 2.0, places=2)
+        self.assertNotIn(faded.id, scores)
+        self.assertEqual(self.trending_ids(), [new.id, old.id])
+
+    def test_posts_deleted_before_scoring_are_skipped(self):
+        kept, gone = self.make_post(), self.make_post()
+        gone.delete()
+        out = io.StringIO()
+        call_command('run_jobs', once=True, threads=1, stdout=out)
+        self.assertIn('0 failed', out.getvalue())
+        self.assertEqual(list(PostScore.objects.values_list('post_id', flat=True)), [kept.id])
+
+    def test_epoch_is_read_after_taking_the_write_lock(self):
+        post = self.make_post()
+        with CaptureQueriesContext(connection) as context:
+            trending.record([post.id], trending.COMMENT_WEIGHT)
+        statements = [query['sql'].split()[0] for query in context.captured_queries
+                      if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        # A rescale committing between the epoch read and the UPDATE would
+        # inflate the event, so the epoch is read inside the writing transaction
+        self.assertEqual(statements, ['INSERT', 'SELECT', 'UPDATE'])
@@ -0,0 +1,134 @@
+"""Trending scores for ?sort=trending
+
+A post's trending score is the sum of its activity (being written, and
+every comment on it), each event weighted by how recent it is: an event
+counts half as much after `HALF_LIFE`, a quarter after two, and so on.
+
+Decaying every score on every tick would rewrite the whole table, so
+scores are stored relative to an epoch instead. An event at time t adds
+`weight * 2 ** ((t - epoch) / HALF_LIFE)`, which grows as time goes on,
+so recent events outweigh old ones exactly as decay would have it, and
+the scores of all posts keep their order without ever being touched.
+Recording an event is an UPDATE of one `PostScore` row, and the top posts
+are read from the index on `score`, so ?sort=trending costs the same
+however many posts and comments there are.
+
+The added amounts double every `HALF_LIFE`, so once the epoch is older
+than `RESCALE_INTERVAL` the `trending.rescale` job is queued. It divides
+every score by the growth since the epoch, moves the epoch to now, and
+drops posts whose score has decayed below `MIN_SCORE`, which keeps the
+table down to posts with recent activity.
+
+Scores need not follow a write the moment it commits, so writes do not
+score anything themselves: `record_later` queues a `trending.record` job
+holding the time of the event, and the worker scores it with that time.
+New posts and comments are queued by the signal handlers in
+`rareapi.signals`; `bulk_create` sends no signals, so the bulk views call
+`record_later` themselves, one job per request.
+"""
+import datetime
+import math
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from rareapi import jobs
+from rareapi.counters import CHUNK_SIZE
+from rareapi.models import PostScore, TrendingEpoch
+
+RECORD = 'trending.record'
+RESCALE = 'trending.rescale'
+
+HALF_LIFE = datetime.timedelta(hours=24)
+RESCALE_INTERVAL = datetime.timedelta(hours=6)
+# What one comment right now is worth
+COMMENT_WEIGHT = 1.0
+POST_WEIGHT = 1.0
+# Posts below this, about a week after their last comment, are dropped
+MIN_SCORE = 0.01
+# How far back an event can still be worth MIN_SCORE
+WINDOW = HALF_LIFE * math.log2(COMMENT_WEIGHT / MIN_SCORE)
+
+
+def growth(at, epoch):
+    """What an event at `at` is worth, relative to one at `epoch`"""
+    return 2 ** ((at - epoch) / HALF_LIFE)
+
+
+def current_epoch():
+    epoch, _ = TrendingEpoch.objects.get_or_create(
+        pk=1, defaults={'started_at': timezone.now()})
+    return epoch.started_at
+
+
+def record_later(post_ids, weight):
+    """Queue `record` for the job worker as one job, stamped with the current time"""
+    post_ids = [pk for pk in post_ids if pk is not None]
+    if post_ids:
+        jobs.enqueue(RECORD, {'post_ids': post_ids, 'weight': weight,
+                              'at': timezone.now().isoformat()})
+
+
+def record(post_ids, weight, at=None):
+    """Add an event worth `weight` to each post, once per time it is given
+
+    Arguments:
+        post_ids -- Primary keys of posts, e.g. the post of every new comment
+        weight -- COMMENT_WEIGHT or POST_WEIGHT
+        at -- When the events happened, defaults to now
+    """
+    times = Counter(pk for pk in post_ids if pk is not None)
+    if not times:
+        return
+
+    by_count = defaultdict(list)
+    for pk, count in times.items():
+        by_count[count].append(pk)
+
+    now = timezone.now()
+    at = at or now
+    with transaction.atomic():
+        # INSERT OR IGNORE the missing rows, then add to all of them, so two
+        # writers scoring the same new post never lose an event. Writing
+        # first takes SQLite's write lock, so the epoch read after it cannot
+        # be moved by a rescale before the scores below are updated.
+        PostScore.objects.bulk_create([PostScore(post_id=pk) for pk in times],
+                                      ignore_conflicts=True)
+        epoch = current_epoch()
+        value = weight * growth(at, epoch)
+        for count, pks in by_count.items():
+            for start in range(0, len(pks), CHUNK_SIZE):
+                PostScore.objects.filter(post_id__in=pks[start:start + CHUNK_SIZE]).update(
+                    score=F('score') + count * value)
+
+    if now - epoch > RESCALE_INTERVAL:
+        jobs.enqueue(RESCALE, key=RESCALE)
+
+
+def rescale():
+    """Bring every score back to the present and drop the decayed ones
+
+    Runs in one transaction, and `record` reads the epoch inside its own
+    transaction after it has written, so an event is always added with
+    the epoch its transaction sees committed: either before the rescale
+    against the old epoch, or after it against the new one.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        factor = 1 / growth(now, current_epoch())
+        PostScore.objects.update(score=F('score') * factor)
+        PostScore.objects.filter(score__lt=MIN_SCORE).delete()
+        TrendingEpoch.objects.filter(pk=1).update(started_at=now)
+
+
+def trending_posts(posts):
+    """Posts with a trending score, annotated for TrendingPagination
+
+    Both annotations are `PostScore` columns: ordered by them, SQLite walks
+    the score index and looks each post up by its key, where ordering by
+    the post's own id would make it sort every scored post first.
+    """
+    return posts.filter(trending__isnull=False).annotate(
+        trending_score=F('trending__score'), trending_id=F('trending__post_id'))
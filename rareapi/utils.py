@@ -0,0 +1,10 @@
+"""Small helpers shared by the app and its management commands"""
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a list of numbers, 0 when it is empty"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
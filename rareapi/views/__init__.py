@@ -1,4 +1,5 @@
-from .auth import login_user, register_user
+from .auth import import_users_view, login_user, register_user
 from .post import PostView
 from. tag import TagView
 from .category import CategoryView
+from .stats import deletion_progress, performance_stats
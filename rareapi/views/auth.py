@@ -1,11 +1,14 @@
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.db.models.fields import DateTimeField
+from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rareapi.models import RareUser
+from rareapi.registration import MAX_IMPORT_ROWS, import_users
 import datetime
 
 @api_view(['POST'])
@@ -45,28 +48,70 @@ def register_user(request):
       request -- The full HTTP request object
     '''
 
-    # Create a new user by invoking the `create_user` helper method
-    # on Django's built-in User model
-    new_user = User.objects.create_user(
-        username=request.data['username'],
-        email=request.data['email'],
-        password=request.data['password'],
-        first_name=request.data['first_name'],
-        last_name=request.data['last_name']
-    )
-
-    # Now save the extra info in the levelupapi_RareUser table
-    rare_user = RareUser.objects.create(
-
-        user=new_user,
-        profile_image_url="",
-        created_on=datetime.date.today(),
-        active=True
-    )
-
-    # Use the REST Framework's token generator on the new user account
-    token = Token.objects.create(user=rare_user.user)
+    # The three rows are written in one transaction, so a failure part way
+    # cannot leave a user without a RareUser or token behind, and SQLite
+    # commits once instead of three times
+    with transaction.atomic():
+        # Create a new user by invoking the `create_user` helper method
+        # on Django's built-in User model
+        new_user = User.objects.create_user(
+            username=request.data['username'],
+            email=request.data['email'],
+            password=request.data['password'],
+            first_name=request.data['first_name'],
+            last_name=request.data['last_name']
+        )
+
+        # Now save the extra info in the levelupapi_RareUser table
+        rare_user = RareUser.objects.create(
+
+            user=new_user,
+            profile_image_url="",
+            created_on=datetime.date.today(),
+            active=True
+        )
+
+        # Use the REST Framework's token generator on the new user account
+        token = Token.objects.create(user=rare_user.user)
     # Return the token to the client
     data = { 'token': token.key }
     return Response(data)
 
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def import_users_view(request):
+    '''Handles registering many users at once
+
+    The body is a JSON array of objects with the same fields as /register,
+    plus optional bio and profile_image_url. Every row is validated first
+    and either all of them are imported or none are. Hashing the passwords
+    holds up the request, so it takes at most MAX_IMPORT_ROWS users; the
+    import_users command takes any number.
+
+    Method arguments:
+      request -- The full HTTP request object
+
+    Returns:
+        Response -- 201 with the id, username and token of every new
+        RareUser, or 400 with per-row errors
+    '''
+    rows = request.data
+    if not isinstance(rows, list):
+        return Response({"reason": "Expected a list of users"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if len(rows) > MAX_IMPORT_ROWS:
+        return Response({"reason": f"At most {MAX_IMPORT_ROWS} users per request, "
+                                   "use the import_users command for more"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # A process pool has nothing to gain on this few users, and forking
+    # a web server worker is best avoided
+    tokens, errors = import_users(rows, processes=1)
+    if errors:
+        return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    data = [
+        {'id': token.user.rareuser.id, 'username': token.user.username, 'token': token.key}
+        for token in tokens
+    ]
+    return Response(data, status=status.HTTP_201_CREATED)
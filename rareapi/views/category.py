@@ -3,8 +3,11 @@ from django.http import HttpResponseServerError
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers
+from rareapi.caching import cached_response, category_cache
+from rareapi.instrumentation import TimedSerializerMixin
 from rareapi.models import Category
-from rareapi.models import RareUser
+from rareapi.pagination import KeysetPagination
+from rareapi.tasks import delete_later
 from django.core.exceptions import ValidationError
 from rest_framework import status
 
@@ -18,8 +21,8 @@ class CategoryView(ViewSet):
             Response -- JSON serialized game instance
         """
 
-        # Uses the token passed in the `Authorization` header
-        rare_user = RareUser.objects.get(user=request.auth.user)
+        # Looked up from the `Authorization` header token by the authenticator
+        rare_user = request.rare_user
 
         # Use the Django ORM to get the record from the database
         # whose `id` is what the client passed as the
@@ -53,10 +56,17 @@ class CategoryView(ViewSet):
         Returns:
             Response -- JSON serialized category
         """
+        categories = Category.objects.filter(pk=pk, deleted_at__isnull=True)
+
+        def serialize():
+            serializer = CategorySerializer(categories.get(), context={'request': request})
+            return serializer.data
+
         try:
-            category = Category.objects.get(pk=pk)
-            serializer = CategorySerializer(category, context={'request': request})
-            return Response(serializer.data)
+            return cached_response(request, category_cache, ('retrieve', pk), serialize,
+                                   exists=categories.exists)
+        except Category.DoesNotExist as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
         except Exception as ex:
             return HttpResponseServerError(ex)
 
@@ -64,26 +74,36 @@ class CategoryView(ViewSet):
         """Handle GET requests to get all categories
 
         Returns:
-            Response -- JSON serialized list of game types
+            Response -- JSON serialized page of categories
         """
-        categories = Category.objects.all()
-
-        # Note the additional `many=True` argument to the
-        # serializer. It's needed when you are serializing
-        # a list of objects instead of a single object.
-        serializer = CategorySerializer(
-            categories, many=True, context={'request': request})
-        return Response(serializer.data)
+        def serialize():
+            categories = Category.objects.filter(deleted_at__isnull=True)
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(categories, request, view=self)
+
+            # Note the additional `many=True` argument to the
+            # serializer. It's needed when you are serializing
+            # a list of objects instead of a single object.
+            serializer = CategorySerializer(
+                page, many=True, context={'request': request})
+            return paginator.get_paginated_response(serializer.data).data
+
+        # The page is cached per URL since the cursor lives in the query string
+        return cached_response(
+            request, category_cache, ('list', request.build_absolute_uri()), serialize)
     
     def destroy(self, request, pk=None):
         """Handle DELETE requests for a single post
 
+        The category is hidden at once, and its posts are deleted in
+        batches by the job worker, see rareapi/deletion.py
+
         Returns:
-            Response -- 200, 404, or 500 status code
+            Response -- 204, 404, or 500 status code
         """
         try:
-            category = Category.objects.get(pk=pk)
-            category.delete()
+            category = Category.objects.get(pk=pk, deleted_at__isnull=True)
+            delete_later(category)
 
             return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -93,7 +113,7 @@ class CategoryView(ViewSet):
         except Exception as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """JSON serializer for game types
 
     Arguments:
@@ -101,4 +121,4 @@ class CategorySerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = Category
-        fields = ('id', 'label')
\ No newline at end of file
+        fields = ('id', 'label', 'post_count')
\ No newline at end of file
@@ -1,6 +1,6 @@
 from django.core.exceptions import ValidationError
 from rest_framework import status
-from django.http import HttpResponseServerError
+from django.http import HttpResponseServerError, StreamingHttpResponse
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers
@@ -10,10 +10,31 @@ from django.contrib.auth import get_user_model
 from rareapi.models import RareUser
 from rareapi.models import Category
 from rareapi.models import Tag
+from rareapi.models import PostTag
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from django.db import transaction
+from django.db.models import Count
 import datetime
+from collections import OrderedDict
+from operator import attrgetter
 
 from rareapi.models.comment import Comment
+from rareapi import counters, trending
+from rareapi.bulk import RowError, bulk_create_response
+from rareapi.caching import not_modified, validator_headers
+from rareapi.db_routers import replica_reads
+from rareapi.fieldsets import (FieldsetError, SparseFieldsetMixin, fieldset_tag,
+                               parse_fieldset)
+from rareapi.export import DEFAULT_CHUNK_SIZE, export_posts_ndjson
+from rareapi.instrumentation import TimedSerializerMixin, timed_serialization
+from rareapi.pagination import (KeysetPagination, PostPagination, SearchPagination,
+                                TrendingPagination)
+from rareapi.query_plans import apply_query_plan
+from rareapi.search import search_posts
+from rareapi.tasks import delete_later
+from rareapi.views.category import CategorySerializer
+from rareapi.views.tag import TagSerializer
 
 
 class PostView(ViewSet):
@@ -22,18 +43,25 @@ class PostView(ViewSet):
     def create(self, request):
         """Handle POST operations
 
+        The body may also be a JSON array of posts, which are validated
+        together and inserted in a single transaction.
+
         Returns:
             Response -- JSON serialized game instance
         """
 
-        # Uses the token passed in the `Authorization` header
-        rare_user = RareUser.objects.get(user=request.auth.user)
+        # Looked up from the `Authorization` header token by the authenticator
+        rare_user = request.rare_user
+
+        if isinstance(request.data, list):
+            return self.create_many(request, rare_user)
 
         # Use the Django ORM to get the record from the database
         # whose `id` is what the client passed as the
         # `gameTypeId` in the body of the request.
 
-        category = Category.objects.get(pk=request.data["category_id"])
+        # Deleted categories take no new posts
+        category = Category.objects.get(pk=request.data["category_id"], deleted_at__isnull=True)
 
         # Try to save the new game to the database, then
         # serialize the game instance as JSON, and send the
@@ -49,9 +77,10 @@ class PostView(ViewSet):
                 publication_date=datetime.date.today(),
                 image_url=request.data["image_url"],
                 content=request.data["content"],
-                approved=True
+                # Everyone else's posts wait in the moderation queue
+                approved=request.user.is_staff
             )
-            serializer = PostSerializer(post, context={'request': request})
+            serializer = CreatedPostSerializer(post, context={'request': request})
             return Response(serializer.data)
 
         # If anything went wrong, catch the exception and
@@ -60,17 +89,80 @@ class PostView(ViewSet):
         except ValidationError as ex:
             return Response({"reason": ex.message}, status=status.HTTP_400_BAD_REQUEST)
 
+    def create_many(self, request, rare_user):
+        """Bulk insert the posts in a JSON array body
+
+        Returns:
+            Response -- JSON serialized posts, or per-post errors
+        """
+        def category_pk(row):
+            try:
+                return int(row["category_id"])
+            except (TypeError, ValueError):
+                return None
+
+        # Look up every category the batch refers to in one query
+        categories = Category.objects.filter(deleted_at__isnull=True).in_bulk(
+            {category_pk(row) for row in request.data
+             if isinstance(row, dict) and "category_id" in row} - {None})
+        today = datetime.date.today()
+
+        def build(row):
+            category = categories.get(category_pk(row))
+            if category is None:
+                raise RowError({"category_id": ["Category does not exist."]})
+            return Post(
+                rare_user=rare_user,
+                category=category,
+                title=row["title"],
+                publication_date=today,
+                image_url=row["image_url"],
+                content=row["content"],
+                approved=request.user.is_staff
+            )
+
+        def on_insert(posts):
+            # bulk_create sends no post_save, so count the posts here
+            categories = [post.category_id for post in posts]
+            counters.adjust(counters.CATEGORY_POSTS, categories)
+            counters.reconcile_later(counters.CATEGORY_POSTS, categories)
+            trending.record_later([post.id for post in posts], trending.POST_WEIGHT)
+
+        return bulk_create_response(request, Post, build, CreatedPostSerializer,
+                                    on_insert=on_insert)
+
+    @staticmethod
+    def on_comments_inserted(post, comments):
+        counters.adjust(counters.POST_COMMENTS, [post.id] * len(comments))
+        counters.reconcile_later(counters.POST_COMMENTS, [post.id])
+        trending.record_later([post.id] * len(comments), trending.COMMENT_WEIGHT)
+
     @action(methods=['POST'], detail=True)
     def createComment(self, request, pk=None):
         """Handle POST operations
 
+        The body may also be a JSON array of comments on the post.
+
         Returns:
             Response -- JSON serialized game instance
         """
 
-        # Uses the token passed in the `Authorization` header
-        author = RareUser.objects.get(user=request.auth.user)
-        post = Post.objects.get(pk=pk)
+        # Looked up from the `Authorization` header token by the authenticator
+        author = request.rare_user
+        try:
+            post = visible_posts(request).get(pk=pk)
+        except Post.DoesNotExist as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
+
+        if isinstance(request.data, list):
+            today = datetime.date.today()
+            return bulk_create_response(
+                request, Comment,
+                lambda row: Comment(post=post, author=author,
+                                    content=row["content"], created_on=today),
+                CommentSerializer,
+                # bulk_create sends no post_save, so count the comments here
+                on_insert=lambda comments: self.on_comments_inserted(post, comments))
 
         # Try to save the new game to the database, then
         # serialize the game instance as JSON, and send the
@@ -95,22 +187,162 @@ class PostView(ViewSet):
         except ValidationError as ex:
             return Response({"reason": ex.message}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(methods=['POST'], detail=True)
+    def tags(self, request, pk=None):
+        """Attach and detach tags on a post in one transaction
+
+        Request body:
+            {"attach": [tag ids], "detach": [tag ids]}
+
+        Returns:
+            Response -- JSON serialized tags now on the post
+        """
+        try:
+            post = visible_posts(request).get(pk=pk)
+        except Post.DoesNotExist as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
+
+        if not isinstance(request.data, dict):
+            return Response({"reason": "Expected an object with attach and detach"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        attach = parse_ids(request.data.get("attach", []))
+        detach = parse_ids(request.data.get("detach", []))
+        if attach is None or detach is None:
+            return Response({"reason": "attach and detach must be lists of tag ids"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        missing = set(attach) - set(
+            Tag.objects.filter(pk__in=attach).values_list('pk', flat=True))
+        if missing:
+            return Response({"reason": f"Unknown tag ids: {sorted(missing)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            if detach:
+                PostTag.objects.filter(post_id=post, tag_id__in=detach).delete()
+            if attach:
+                # Tags the post already has are left alone, and only the
+                # new ones counted, since bulk_create sends no post_save
+                attached = set(PostTag.objects.filter(post_id=post, tag_id__in=attach)
+                               .values_list('tag_id', flat=True))
+                new = [tag_id for tag_id in dict.fromkeys(attach) if tag_id not in attached]
+                # The unique (post, tag) constraint still guards against a
+                # concurrent attach of the same tag, which both requests
+                # count; the reconcile job puts the count right after
+                PostTag.objects.bulk_create(
+                    [PostTag(post_id=post, tag_id_id=tag_id) for tag_id in new],
+                    ignore_conflicts=True)
+                counters.adjust(counters.TAG_POSTS, new)
+                counters.reconcile_later(counters.TAG_POSTS, new)
+
+        tags = Tag.objects.filter(posttag__post_id=post).order_by('id')
+        serializer = TagSerializer(tags, many=True, context={'request': request})
+        return Response(serializer.data)
+
+    @action(methods=['GET'], detail=False, permission_classes=[IsAdminUser])
+    def export(self, request):
+        """Stream every post with its comments as newline-delimited JSON
+
+        Query parameters:
+            chunk_size -- Posts read from the database at a time, at most
+            MAX_CHUNK_SIZE
+
+        Returns:
+            StreamingHttpResponse -- One serialized post per line
+        """
+        try:
+            chunk_size = int(request.query_params.get('chunk_size', DEFAULT_CHUNK_SIZE))
+        except ValueError:
+            chunk_size = DEFAULT_CHUNK_SIZE
+
+        response = StreamingHttpResponse(
+            export_posts_ndjson(PostDetailSerializer, chunk_size),
+            content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="posts.ndjson"'
+        return response
+
+    @action(methods=['GET'], detail=False, permission_classes=[IsAdminUser])
+    def moderation(self, request):
+        """List the posts waiting for a moderator, oldest first
+
+        Returns:
+            Response -- JSON serialized page of posts, with their full content
+        """
+        posts = apply_query_plan(Post.objects.alive().awaiting_moderation(), ModerationSerializer)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(posts, request, view=self)
+        serializer = ModerationSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+    @moderation.mapping.post
+    def moderate(self, request):
+        """Approve and reject posts in bulk
+
+        Request body:
+            {"approve": [post ids], "reject": [post ids]}
+
+        Returns:
+            Response -- JSON with how many posts were approved and rejected
+        """
+        if not isinstance(request.data, dict):
+            return Response({"reason": "Expected an object with approve and reject"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        approve = parse_ids(request.data.get("approve", []))
+        reject = parse_ids(request.data.get("reject", []))
+        if approve is None or reject is None:
+            return Response({"reason": "approve and reject must be lists of post ids"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if set(approve) & set(reject):
+            return Response({"reason": "A post cannot be both approved and rejected"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # One UPDATE each, however many posts are moderated
+        with transaction.atomic():
+            approved = Post.objects.filter(pk__in=approve).approve() if approve else 0
+            rejected = Post.objects.filter(pk__in=reject).reject() if reject else 0
+        return Response({"approved": approved, "rejected": rejected})
+
+    @replica_reads
     def retrieve(self, request, pk=None):
         """Handle GET requests for single post
 
         Returns:
             Response -- JSON serialized post instance
         """
+        # Support sparse fieldsets, e.g. ?fields=title,comments&expand=
         try:
+            fieldset = parse_fieldset(request, PostDetailSerializer.Meta.fields,
+                                      PostDetailSerializer.Meta.expandable)
+        except FieldsetError as ex:
+            return Response({"reason": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            # Answer a client polling for changes from the post's primary
+            # key row alone, before loading and serializing its comments
+            conditional = ('HTTP_IF_NONE_MATCH' in request.META or
+                           'HTTP_IF_MODIFIED_SINCE' in request.META)
+            visible = visible_posts(request)
+            updated_at = conditional and visible.filter(pk=pk).values_list(
+                'updated_at', flat=True).first()
+            if updated_at:
+                etag = post_etag(pk, updated_at, fieldset)
+                if not_modified(request, etag, updated_at):
+                    return Response(status=status.HTTP_304_NOT_MODIFIED,
+                                    headers=validator_headers(etag, updated_at))
+
             # `pk` is a parameter to this function, and
             # Django parses it from the URL route parameter
             #   http://localhost:8000/posts/2
             #
             # The `2` at the end of the route becomes `pk`
-            post = Post.objects.get(pk=pk)
+            posts = apply_query_plan(visible, PostDetailSerializer, fieldset=fieldset)
+            post = posts.get(pk=pk)
             serializer = PostDetailSerializer(
-                post, context={'request': request})
-            return Response(serializer.data)
+                post, context={'request': request}, fieldset=fieldset)
+            return Response(serializer.data, headers=validator_headers(
+                post_etag(post.pk, post.updated_at, fieldset), post.updated_at))
+        except Post.DoesNotExist as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
         except Exception as ex:
             return HttpResponseServerError(ex)
 
@@ -120,20 +352,22 @@ class PostView(ViewSet):
         Returns:
             Response -- Empty body with 204 status code
         """
-        rare_user = RareUser.objects.get(user=request.auth.user)
-        category = Category.objects.get(pk=request.data["categoryId"])
+        rare_user = request.rare_user
+        category = Category.objects.get(pk=request.data["categoryId"], deleted_at__isnull=True)
 
         # Do mostly the same thing as POST, but instead of
         # creating a new instance of Game, get the game record
         # from the database whose primary key is `pk`
-        post = Post.objects.get(pk=pk)
+        post = Post.objects.alive().get(pk=pk)
         post.rare_user = rare_user
-        post.category = request.data["category"]
+        post.category = category
         post.title = request.data["title"]
         post.publication_date = request.data["publication_date"]
         post.image_url = request.data["image_url"]
         post.content = request.data["content"]
-        post.approved = True
+        # An edited post goes back in the moderation queue
+        post.approved = request.user.is_staff
+        post.rejected = False
 
         post.save()
 
@@ -144,12 +378,15 @@ class PostView(ViewSet):
     def destroy(self, request, pk=None):
         """Handle DELETE requests for a single post
 
+        The post is hidden at once, and its comments and tags are
+        deleted in batches by the job worker, see rareapi/deletion.py
+
         Returns:
-            Response -- 200, 404, or 500 status code
+            Response -- 204, 404, or 500 status code
         """
         try:
-            post = Post.objects.get(pk=pk)
-            post.delete()
+            post = Post.objects.alive().get(pk=pk)
+            delete_later(post)
 
             return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -160,15 +397,29 @@ class PostView(ViewSet):
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     # @action(methods=['get'], detail=False)
+    @replica_reads
     def list(self, request):
         """Handle GET requests to posts resource
 
         Returns:
-            Response -- JSON serialized list of posts
+            Response -- JSON serialized page of posts, newest first,
+            best match first when searching with `q`, or most active
+            lately first with `sort=trending`. Only the newest-first
+            pages are stable; search and trending pages can skip or
+            repeat posts when posts change in between, see
+            rareapi.pagination
         """
+        # Support sparse fieldsets, e.g. ?fields=id,title&expand=
+        try:
+            fieldset = parse_fieldset(request, FastPostSerializer.field_columns,
+                                      FastPostSerializer.expandable)
+        except FieldsetError as ex:
+            return Response({"reason": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
         # Get the current authenticated user
-        rare_user = RareUser.objects.get(user=request.auth.user)
-        posts = Post.objects.all()
+        rare_user = request.rare_user
+        # Posts waiting for moderation are only listed for their authors
+        posts = Post.objects.alive().visible_to(rare_user)
 
         # # Set the `joined` property on every post
         # for post in posts:
@@ -180,51 +431,304 @@ class PostView(ViewSet):
         if post is not None:
             posts = posts.filter(rare_user = rare_user)
 
-        serializer = PostSerializer(
-            posts, many=True, context={'request': request})
-        return Response(serializer.data)
+        # Support filtering posts by tag, e.g. ?tags=1,2&tags_match=all
+        tags = self.request.query_params.get('tags', None)
+        if tags is not None:
+            tag_ids = parse_ids(tags.split(','))
+            if tag_ids is None:
+                return Response({"reason": "tags must be a comma separated list of ids"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            match_all = self.request.query_params.get('tags_match') == 'all'
+            posts = filter_by_tags(posts, tag_ids, match_all)
+
+        # Support ?sort=trending, posts with the most recent activity first
+        sort = self.request.query_params.get('sort', None)
+        if sort not in (None, 'trending'):
+            return Response({"reason": "sort must be trending"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # Support full-text search, e.g. ?q=road trip, best matches first
+        search = self.request.query_params.get('q', None)
+        if search is not None and sort is not None:
+            return Response({"reason": "search results cannot be sorted"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if sort == 'trending':
+            posts = trending.trending_posts(posts)
+            rows = FastPostSerializer.rows(posts, 'trending_score', 'trending_id',
+                                           fieldset=fieldset)
+            paginator = TrendingPagination()
+        elif search is not None:
+            posts = search_posts(posts, search)
+            rows = FastPostSerializer.rows(posts, 'search_rank', fieldset=fieldset)
+            paginator = SearchPagination()
+        else:
+            rows = FastPostSerializer.rows(posts, fieldset=fieldset)
+            paginator = PostPagination()
+        page = paginator.paginate_queryset(rows, request, view=self)
+        serializer = FastPostSerializer(page, many=True, fieldset=fieldset)
+        return paginator.get_paginated_response(serializer.data)
+
+
+def visible_posts(request):
+    """Posts the requesting user may see, staff seeing every post not deleted"""
+    if request.user.is_staff:
+        return Post.objects.alive()
+    return Post.objects.alive().visible_to(request.rare_user)
+
+
+def parse_ids(values):
+    """Turn a list of ids from the client into ints, or None if any is bad"""
+    if not isinstance(values, list):
+        return None
+    try:
+        return [int(value) for value in values]
+    except (TypeError, ValueError):
+        return None
+
+
+def post_etag(pk, updated_at, fieldset=None):
+    """ETag of a post detail, which changes whenever `updated_at` does
+
+    The handlers in rareapi.signals move `updated_at` when anything the
+    detail renders changes: the post, its comments, the category label,
+    and the names of its author and commenters.
+    Each sparse fieldset is a different representation, so it gets its own.
+    """
+    tag = fieldset_tag(fieldset)
+    return f'"post-{pk}-{int(updated_at.timestamp() * 1000000)}{"-" + tag if tag else ""}"'
+
+
+def filter_by_tags(posts, tag_ids, match_all=False):
+    """Narrow posts to those carrying any (or all) of the given tags
+
+    Both cases run as a subquery over the (tag, post) index of PostTag
+    rather than pulling tag rows into Python.
+    """
+    post_tags = PostTag.objects.filter(tag_id__in=tag_ids)
+    if match_all:
+        # (post, tag) is unique, so a post has all the tags exactly
+        # when it matches as many rows as there are distinct tags
+        post_tags = (post_tags.values('post_id')
+                     .annotate(matched=Count('tag_id'))
+                     .filter(matched=len(set(tag_ids))))
+    return posts.filter(id__in=post_tags.values('post_id'))
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = ['first_name', 'last_name', 'username']
 
 
-class RareUserSerializer(serializers.ModelSerializer):
+class RareUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(many=False)
 
     class Meta:
         model = RareUser
         fields = ['id', 'user']
+        select_related = ('user',)
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author = RareUserSerializer(many=False)
 
     class Meta:
         model = Comment
         fields = ['id', 'post', 'author', 'content', 'created_on']
         depth: 1
+        select_related = ('author__user',)
+        ordering = ('created_on', 'id')
 
 
-class PostSerializer(serializers.ModelSerializer):
-    """JSON serializer for posts
+class PostSerializer(TimedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
+    """JSON serializer for posts in lists
+
+    Lists show the stored excerpt in place of the full content, which only
+    the post detail renders, so the query plan leaves `content` unloaded.
 
     Arguments:
         serializer type
     """
 
     rare_user = RareUserSerializer(many=False)
+    # Declared, as depth = 1 would render every column of the category
+    category = CategorySerializer(many=False)
 
     class Meta:
         model = Post
         fields = ('id', 'title', 'publication_date', 'image_url',
-                  'content', 'rare_user', 'category')
+                  'excerpt', 'rare_user', 'category', 'comment_count')
         depth = 1
+        select_related = ('rare_user__user', 'category')
+        defer = ('content',)
+        expandable = ('rare_user', 'category')
+
+
+class CreatedPostSerializer(PostSerializer):
+    """JSON serializer for the posts a create request just wrote
+
+    The client sent the content, and create responses have always
+    rendered it back, so it is shown next to the excerpt.
+    """
+
+    class Meta(PostSerializer.Meta):
+        fields = PostSerializer.Meta.fields + ('content',)
+        defer = ()
+
+
+class FastPostSerializer:
+    """Read-only stand-in for PostSerializer built on flat value rows
+
+    `rows` selects exactly the columns PostSerializer renders, joined in one
+    query, as named tuples instead of model instances, and the dicts are
+    put together by hand instead of walking a tree of serializer fields.
+    The output is the same JSON as PostSerializer's, which the parity test
+    in rareapi/tests.py holds it to; change both together.
+
+    Given a sparse `Fieldset`, only the columns of the requested fields are
+    selected, and relations that are not expanded are rendered from their
+    foreign key column without joining the related table.
+    """
+    columns = (
+        'id', 'title', 'publication_date', 'image_url', 'excerpt',
+        'rare_user_id', 'rare_user__user__first_name',
+        'rare_user__user__last_name', 'rare_user__user__username',
+        'category_id', 'category__label', 'category__post_count', 'comment_count',
+    )
+
+    # The columns behind each output field, with relations as an id
+    field_columns = OrderedDict([
+        ('id', ('id',)),
+        ('title', ('title',)),
+        ('publication_date', ('publication_date',)),
+        ('image_url', ('image_url',)),
+        ('excerpt', ('excerpt',)),
+        ('rare_user', ('rare_user_id',)),
+        ('category', ('category_id',)),
+        ('comment_count', ('comment_count',)),
+    ])
+    # ... and behind the relations rendered as nested objects
+    expanded_columns = {
+        'rare_user': ('rare_user_id', 'rare_user__user__first_name',
+                      'rare_user__user__last_name', 'rare_user__user__username'),
+        'category': ('category_id', 'category__label', 'category__post_count'),
+    }
+    expandable = tuple(expanded_columns)
+    # Always selected, since PostPagination builds its cursor from them
+    ordering_columns = ('id', 'publication_date')
+
+    def __init__(self, instance, many=False, fieldset=None):
+        self.instance = instance
+        self.many = many
+        self.fieldset = fieldset
+
+    @classmethod
+    def rows(cls, posts, *extra, fieldset=None):
+        """Turn a post queryset into a queryset of rows for this serializer
+
+        Arguments:
+            posts -- Post queryset, filtered but not yet paginated
+            extra -- Annotations to keep on the rows, e.g. for ordering
+            fieldset -- Optional `Fieldset` the rows will be rendered with
+        """
+        if fieldset is None:
+            return posts.values_list(*cls.columns, *extra, named=True)
+
+        columns = list(cls.ordering_columns)
+        for name in fieldset.fields:
+            if fieldset.expands(name):
+                columns.extend(cls.expanded_columns[name])
+            else:
+                columns.extend(cls.field_columns[name])
+        # values_list() cannot name a column twice in named rows
+        return posts.values_list(*dict.fromkeys([*columns, *extra]), named=True)
+
+    @staticmethod
+    def rare_user(row):
+        return OrderedDict([
+            ('id', row.rare_user_id),
+            ('user', OrderedDict([
+                ('first_name', row.rare_user__user__first_name),
+                ('last_name', row.rare_user__user__last_name),
+                ('username', row.rare_user__user__username),
+            ])),
+        ])
+
+    @staticmethod
+    def category(row):
+        return OrderedDict([
+            ('id', row.category_id),
+            ('label', row.category__label),
+            ('post_count', row.category__post_count),
+        ])
+
+    @classmethod
+    def to_representation(cls, row):
+        return OrderedDict([
+            ('id', row.id),
+            ('title', row.title),
+            ('publication_date', row.publication_date.isoformat()),
+            ('image_url', row.image_url),
+            ('excerpt', row.excerpt),
+            ('rare_user', cls.rare_user(row)),
+            ('category', cls.category(row)),
+            ('comment_count', row.comment_count),
+        ])
+
+    @classmethod
+    def sparse_representation(cls, fieldset):
+        """Build a `to_representation` for rows selected with `fieldset`"""
+        getters = {
+            'id': attrgetter('id'),
+            'title': attrgetter('title'),
+            'publication_date': lambda row: row.publication_date.isoformat(),
+            'image_url': attrgetter('image_url'),
+            'excerpt': attrgetter('excerpt'),
+            'rare_user': (cls.rare_user if fieldset.expands('rare_user')
+                          else attrgetter('rare_user_id')),
+            'category': (cls.category if fieldset.expands('category')
+                         else attrgetter('category_id')),
+            'comment_count': attrgetter('comment_count'),
+        }
+        fields = [(name, getters[name]) for name in fieldset.fields]
+
+        def to_representation(row):
+            return OrderedDict([(name, get(row)) for name, get in fields])
+        return to_representation
+
+    @property
+    def data(self):
+        if self.fieldset is None:
+            to_representation = self.to_representation
+        else:
+            to_representation = self.sparse_representation(self.fieldset)
+        with timed_serialization():
+            if self.many:
+                return [to_representation(row) for row in self.instance]
+            return to_representation(self.instance)
+
+
+class PostCategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        # Not post_count, which changes with other posts and would make
+        # the detail's ETag (built from the post's updated_at) wrong
+        fields = ('id', 'label')
+
+
+class ModerationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """JSON serializer for posts in the moderation queue"""
+    rare_user = RareUserSerializer(many=False)
+    category = PostCategorySerializer(many=False)
+
+    class Meta:
+        model = Post
+        fields = ('id', 'title', 'publication_date', 'image_url',
+                  'content', 'rare_user', 'category')
+        select_related = ('rare_user__user', 'category')
 
 
-class PostDetailSerializer(serializers.ModelSerializer):
+class PostDetailSerializer(TimedSerializerMixin, SparseFieldsetMixin, serializers.ModelSerializer):
     """JSON serializer for posts
 
     Arguments:
@@ -232,9 +736,15 @@ class PostDetailSerializer(serializers.ModelSerializer):
     """
     comments = CommentSerializer(many=True)
     rare_user = RareUserSerializer(many=False)
+    category = PostCategorySerializer(many=False)
 
     class Meta:
         model = Post
         fields = ('id', 'title', 'publication_date', 'image_url',
-                  'content', 'rare_user', 'category', 'comments')
+                  'content', 'rare_user', 'category', 'comment_count', 'comments')
         depth = 1
+        select_related = ('rare_user__user', 'category')
+        prefetch_related = {'comments': CommentSerializer}
+        expandable = ('rare_user', 'category')
+        # The retrieve view builds the ETag from it
+        always_load = ('updated_at',)
@@ -0,0 +1,52 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rareapi.instrumentation import route_stats
+from rareapi.models import Job
+from rareapi.tasks import PURGE
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def performance_stats(request):
+    '''Per-route request timings collected by PerformanceMiddleware
+
+    GET returns, for every route, the number of requests seen and the
+    p50/p95/p99/max of the total, view, db, serializer and render times
+    in milliseconds and of the query count, over the latest requests.
+    DELETE clears the collected numbers.
+
+    Method arguments:
+      request -- The full HTTP request object
+    '''
+    if request.method == 'DELETE':
+        route_stats.reset()
+        return Response(None, status=204)
+    return Response(route_stats.snapshot())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def deletion_progress(request):
+    '''Categories, posts and users still being deleted in the background
+
+    For each one, the rows deleted so far by model, the batches run, and
+    the state of the job that runs the next batch. A failing batch keeps
+    its job, with the error, after its last retry.
+
+    Method arguments:
+      request -- The full HTTP request object
+    '''
+    purges = Job.objects.filter(name=PURGE).order_by('created_at', 'id')
+    return Response([
+        {
+            'model': job.payload['model'],
+            'id': job.payload['pk'],
+            'batches': job.payload.get('batches', 0),
+            'deleted': job.payload.get('deleted', {}),
+            'status': job.status,
+            'attempts': job.attempts,
+            'last_error': job.last_error,
+        }
+        for job in purges
+    ])
@@ -4,11 +4,22 @@ from django.http import HttpResponseServerError
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers
+from rareapi.bulk import bulk_create_response
+from rareapi.caching import cached_response, tag_cache
+from rareapi.instrumentation import TimedSerializerMixin
 from rareapi.models import Tag
+from rareapi.pagination import KeysetPagination
 
 
 class TagView(ViewSet):
     def create(self, request):
+        if isinstance(request.data, list):
+            response = bulk_create_response(
+                request, Tag, lambda row: Tag(label=row["label"]), TagSerializer)
+            # bulk_create does not send post_save, so invalidate by hand
+            tag_cache.bump()
+            return response
+
         try:
             tag = Tag.objects.create(
                 label = request.data["label"]
@@ -19,10 +30,16 @@ class TagView(ViewSet):
             return Response({"reason": ex.message}, status=status.HTTP_400_BAD_REQUEST)
 
     def list(self, request):
-        tag = Tag.objects.all()
-        serializer = TagSerializer(
-            tag, many=True, context={'request': request})
-        return Response(serializer.data)
+        def serialize():
+            tag = Tag.objects.all()
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(tag, request, view=self)
+            serializer = TagSerializer(
+                page, many=True, context={'request': request})
+            return paginator.get_paginated_response(serializer.data).data
+
+        return cached_response(
+            request, tag_cache, ('list', request.build_absolute_uri()), serialize)
     
     def destroy(self, request, pk=None):
         try:
@@ -37,9 +54,9 @@ class TagView(ViewSet):
         except Exception as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
-        fields = ('id', 'label')
+        fields = ('id', 'label', 'post_count')
         depth = 1
     